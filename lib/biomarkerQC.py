@@ -4,14 +4,14 @@ import numpy as np
 import pandas as pd
 from .utils import *
 from .statistics import *
-from .plotting import *
 
 
 class BiomarkerQC:
 
     def __init__(self, output_folder, sewageStat: SewageStat, biomarker_outlier_statistics, min_biomarker_threshold,
                  min_number_biomarkers_for_outlier_detection,
-                 max_number_biomarkers_for_outlier_detection, report_number_of_biomarker_outlier):
+                 max_number_biomarkers_for_outlier_detection, report_number_of_biomarker_outlier,
+                 window_index: WindowIndex = None):
         self.output_folder = output_folder
         self.sewageStat = sewageStat
         self.biomarker_outlier_statistics = biomarker_outlier_statistics
@@ -19,6 +19,7 @@ class BiomarkerQC:
         self.min_number_biomarkers_for_outlier_detection = min_number_biomarkers_for_outlier_detection
         self.max_number_biomarkers_for_outlier_detection = max_number_biomarkers_for_outlier_detection
         self.report_number_of_biomarker_outlier = report_number_of_biomarker_outlier
+        self.window_index = window_index if window_index else WindowIndex()
         self.logger = SewageLogger(self.output_folder)
 
 
@@ -79,9 +80,7 @@ class BiomarkerQC:
           Obtain last biomarker ratios for the previous measurements starting from current measurement.
           Remove previously detected outliers and empty ratios.
         """
-        max_idx = (index - 1 - self.max_number_biomarkers_for_outlier_detection) \
-            if (index - 1 - self.max_number_biomarkers_for_outlier_detection) >= 0 else 0
-        min_idx = index if index >= 0 else 0
+        max_idx, min_idx = self.window_index.get(measurements_df).count_window(index, self.max_number_biomarkers_for_outlier_detection)
         last_N_measurements = measurements_df.iloc[max_idx: min_idx]
         # remove previously detected outliers
         biomarker_ratio_flags = last_N_measurements[CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)]
@@ -105,7 +104,8 @@ class BiomarkerQC:
                     SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2),
                                                         SewageFlag.NOT_ENOUGH_PREVIOUS_BIOMARKER_VALUES)
                     continue
-                is_outlier = detect_outliers(self.biomarker_outlier_statistics, last_biomarker_ratios[biomarker_ratio], current_measurement[biomarker_ratio], isFactor=True)
+                is_outlier = detect_outliers(self.biomarker_outlier_statistics, last_biomarker_ratios[biomarker_ratio], current_measurement[biomarker_ratio], isFactor=True,
+                                             sewageStat=self.sewageStat)
                 if is_outlier:
                     SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2), SewageFlag.BIOMARKER_RATIO_OUTLIER)
                     self.sewageStat.add_biomarker_ratio_outlier(biomarker1, biomarker2, 'outlier')
@@ -0,0 +1,532 @@
+# Created by alex at 18.10.26
+import math
+import itertools
+from .utils import *
+from .statistics import *
+from .invalidation import InvalidationPlanner
+
+
+class MeasurementColumns:
+    """
+    Column store for the measurements of one sample location. All columns used by the quality control are pulled
+    once into NumPy arrays. After the quality control the modified arrays are written back to the data frame with
+    a single assignment per column.
+    """
+
+    def __init__(self, measurements: pd.DataFrame):
+        self.biomarkers = Columns.get_biomarker_columns()
+        self.biomarker_pairs = list(itertools.combinations(range(len(self.biomarkers)), 2))
+        self.biomarker_ratios = [self.biomarkers[i] + "/" + self.biomarkers[j] for i, j in self.biomarker_pairs]
+        self.biomarker_flag_columns = [CalculatedColumns.get_biomarker_flag(b) for b in self.biomarkers]
+        self.biomarker_ratio_flag_columns = [CalculatedColumns.get_biomaker_ratio_flag(self.biomarkers[i], self.biomarkers[j])
+                                             for i, j in self.biomarker_pairs]
+        self.size = measurements.shape[0]
+        self.dates = measurements[Columns.DATE].to_numpy(dtype='datetime64[ns]')
+        self.comment_analysis = measurements[Columns.COMMENT_ANALYSIS].to_numpy()
+        self.comment_operation = measurements[Columns.COMMENT_OPERATION].to_numpy()
+        self.trockentag = measurements[Columns.TROCKENTAG].to_numpy()
+        self.biomarker_values = measurements[self.biomarkers].to_numpy(dtype=np.float64)
+        self.values = {column: measurements[column].to_numpy(dtype=np.float64)
+                       for column in [Columns.MEAN_SEWAGE_FLOW, Columns.AMMONIUM, Columns.CONDUCTIVITY,
+                                      Columns.CRASSPHAGE, Columns.PMMOV]}
+        self.needs_processing = measurements[CalculatedColumns.NEEDS_PROCESSING.value].to_numpy(dtype=bool)
+        # calculated columns
+        self.flags = FlagMatrix(measurements)
+        self.flag = self.flags.flag
+        self.biomarker_flags = self.flags.biomarker_flags
+        self.biomarker_ratio_values = measurements[self.biomarker_ratios].to_numpy(dtype=np.float64, copy=True)
+        self.biomarker_ratio_flags = self.flags.biomarker_ratio_flags
+        self.num_usable_biomarkers = measurements[CalculatedColumns.NUMBER_OF_USABLE_BIOMARKERS.value].to_numpy(dtype=np.int64, copy=True)
+        self.normalized_mean_biomarkers = measurements[CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value].to_numpy(dtype=np.float64, copy=True)
+        self.base_reproduction_factor = measurements[CalculatedColumns.BASE_REPRODUCTION_FACTOR.value].to_numpy(dtype=np.float64, copy=True)
+        self.usable = measurements[CalculatedColumns.USABLE.value].to_numpy(dtype=bool, copy=True)
+        self.outlier_reason = measurements[CalculatedColumns.OUTLIER_REASON.value].to_numpy(dtype=object, copy=True)
+        self.ratio_matrix = BiomarkerRatioMatrix(self)
+
+    def write_back(self, measurements: pd.DataFrame) -> None:
+        self.flags.write_back(measurements)
+        for p, column in enumerate(self.biomarker_ratios):
+            measurements[column] = self.biomarker_ratio_values[:, p]
+        measurements[CalculatedColumns.NUMBER_OF_USABLE_BIOMARKERS.value] = self.num_usable_biomarkers
+        measurements[CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value] = self.normalized_mean_biomarkers
+        measurements[CalculatedColumns.BASE_REPRODUCTION_FACTOR.value] = self.base_reproduction_factor
+        measurements[CalculatedColumns.USABLE.value] = self.usable
+        measurements[CalculatedColumns.OUTLIER_REASON.value] = self.outlier_reason
+        measurements[CalculatedColumns.NEEDS_PROCESSING.value] = self.needs_processing
+
+    def reset_results(self, index) -> None:
+        """
+        Reset the stored results of a row that is processed again.
+        """
+        self.flags.reset(index)
+        self.biomarker_ratio_values[index] = np.NAN
+        self.num_usable_biomarkers[index] = 0
+        self.normalized_mean_biomarkers[index] = 0
+        self.base_reproduction_factor[index] = 0
+        self.usable[index] = False
+        self.outlier_reason[index] = ""
+        self.needs_processing[index] = True
+        self.ratio_matrix.update_row(index)
+
+    def get_results(self, index) -> dict:
+        results = {Columns.MEAN_SEWAGE_FLOW: self.values[Columns.MEAN_SEWAGE_FLOW][index],
+                   CalculatedColumns.FLAG.value: self.flag[index],
+                   CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value: self.normalized_mean_biomarkers[index]}
+        for column in [Columns.AMMONIUM, Columns.CONDUCTIVITY, Columns.CRASSPHAGE, Columns.PMMOV]:
+            results[column] = self.values[column][index]
+        for j, column in enumerate(self.biomarkers):
+            results[column] = self.biomarker_values[index, j]
+        for p, column in enumerate(self.biomarker_ratios):
+            results[column] = self.biomarker_ratio_values[index, p]
+        for p, column in enumerate(self.biomarker_ratio_flag_columns):
+            results[column] = self.biomarker_ratio_flags[index, p]
+        return results
+
+
+class BiomarkerRatioMatrix:
+    """
+    Raw ratios of all biomarker pairs (rows x pairs) with a mask of the ratios which are usable as previous values:
+    the measurement has a collection date, both biomarker values and a ratio which is no biomarker ratio outlier.
+    The mask is updated whenever ratios are calculated or flagged as outliers, so the medians of the previous ratios
+    of all pairs are computed in one pass over the window.
+    """
+
+    def __init__(self, columns: MeasurementColumns):
+        self.columns = columns
+        first_biomarkers = [j1 for j1, _ in columns.biomarker_pairs]
+        second_biomarkers = [j2 for _, j2 in columns.biomarker_pairs]
+        biomarker1_values = columns.biomarker_values[:, first_biomarkers]
+        biomarker2_values = columns.biomarker_values[:, second_biomarkers]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.raw_ratios = biomarker1_values / biomarker2_values
+        self.has_values = ~np.isnat(columns.dates)[:, np.newaxis] & ~np.isnan(biomarker1_values) & ~np.isnan(biomarker2_values)
+        self.is_usable = self.has_values & ~np.isnan(columns.biomarker_ratio_values) & \
+                         columns.flags.is_not_set(slice(None), columns.biomarker_ratio_flag_columns,
+                                                  SewageFlag.BIOMARKER_RATIO_OUTLIER)
+
+    def update_row(self, index) -> None:
+        """
+        Update the mask after the ratios of a row were calculated.
+        """
+        self.is_usable[index] = self.has_values[index] & ~np.isnan(self.columns.biomarker_ratio_values[index]) & \
+                                self.columns.flags.is_not_set(index, self.columns.biomarker_ratio_flag_columns,
+                                                              SewageFlag.BIOMARKER_RATIO_OUTLIER)
+
+    def exclude(self, index, pair_index) -> None:
+        """
+        The ratio of a pair was flagged as outlier.
+        """
+        self.is_usable[index, pair_index] = False
+
+    def get_usable_rows(self, start, end, pair_index) -> np.ndarray:
+        return np.flatnonzero(self.is_usable[start:end, pair_index]) + start
+
+    def get_medians(self, start, end) -> np.ndarray:
+        """
+        Medians of the usable raw ratios of all pairs within the rows start to end, NaN if a pair has no usable ratio.
+        Same values as np.median on the usable ratios of each pair.
+        """
+        if end <= start:
+            return np.full(self.raw_ratios.shape[1], np.NAN)
+        is_usable = self.is_usable[start:end]
+        sorted_ratios = np.sort(np.where(is_usable, self.raw_ratios[start:end], np.inf), axis=0)
+        counts = is_usable.sum(axis=0)
+        pair_indices = np.arange(sorted_ratios.shape[1])
+        upper = sorted_ratios[counts // 2, pair_indices]
+        lower = sorted_ratios[np.maximum(counts // 2 - 1, 0), pair_indices]
+        medians = np.where(counts % 2 == 1, upper, (lower + upper) / 2)
+        medians[counts == 0] = np.NAN
+        # np.median is NaN if any value is NaN (0 / 0)
+        medians[np.any(is_usable & np.isnan(self.raw_ratios[start:end]), axis=0)] = np.NAN
+        return medians
+
+
+def _has_flag(flag_value, sewage_flag: SewageFlag) -> bool:
+    mask = FlagMatrix.get_mask(sewage_flag)
+    return (flag_value & mask) == mask
+
+
+def _add_flag(flags: np.ndarray, index, sewage_flag: SewageFlag) -> None:
+    flags[index] |= FlagMatrix.get_mask(sewage_flag)
+
+
+class ColumnarQualityControl:
+    """
+    Alternative engine for the quality control and normalization. It runs the logic of BiomarkerQC,
+    SurrogateVirusQC, SewageFlow, WaterQuality and SewageNormalization on the NumPy arrays of a
+    MeasurementColumns store instead of reading and writing single cells of the data frame.
+    The parameters are taken from the configured stages, the resulting flags are identical.
+    """
+
+    def __init__(self, biomarkerQC, surrogateQC, sewage_flow, water_quality, sewageNormalization):
+        self.biomarkerQC = biomarkerQC
+        self.surrogateQC = surrogateQC
+        self.sewage_flow = sewage_flow
+        self.water_quality = water_quality
+        self.sewageNormalization = sewageNormalization
+        self.sewageStat = biomarkerQC.sewageStat
+        self.logger = biomarkerQC.logger
+        self.window_index = biomarkerQC.window_index
+
+    def run_quality_control(self, sample_location, measurements: pd.DataFrame, progress_bar,
+                            invalidation_planner: InvalidationPlanner = None) -> bool:
+        """
+        Runs all stages on the rows that need processing. Returns True if any row was processed.
+        :param invalidation_planner: planned for the measurements; if not given, only the rows with NEEDS_PROCESSING
+                                     are processed
+        """
+        columns = MeasurementColumns(measurements)
+        self.window_index.get(measurements)
+        if invalidation_planner is None:
+            invalidation_planner = InvalidationPlanner(self.biomarkerQC, self.surrogateQC, self.sewage_flow,
+                                                       self.water_quality, self.sewageNormalization).plan(measurements)
+        changes_detected = False
+        for index in range(columns.size):
+            if invalidation_planner.needs_processing(index):
+                changes_detected = True
+                if invalidation_planner.is_dependent(index):
+                    columns.reset_results(index)
+                    progress_bar.total += 1
+                progress_bar.update(1)
+                # -----------------  BIOMARKER QC -----------------------
+                self.__check_comments(columns, index)
+                self.__check_mean_sewage_flow_present(columns, index)
+                self.__biomarker_below_threshold_or_empty(columns, index)
+                self.__calculate_biomarker_ratios(columns, index)
+                self.__detect_biomarker_ratio_outliers(columns, index)
+                self.__assign_biomarker_outliers_based_on_ratio_flags(columns, index)
+                self.__analyze_usable_biomarkers(columns, index)
+                # --------------------  SUROGATVIRUS QC -------------------
+                self.__filter_dry_days_time_frame(columns, index)
+                self.__is_surrogatevirus_outlier(columns, index)
+                # --------------------  SEWAGE FLOW -------------------
+                self.__sewage_flow_quality_control(sample_location, columns, index)
+                # --------------------  WATER QUALITY -------------------
+                self.__detect_water_quality_outliers(columns, index, Columns.AMMONIUM, "Ammonium",
+                                                     SewageFlag.AMMONIUM_OUTLIER, SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES)
+                self.__detect_water_quality_outliers(columns, index, Columns.CONDUCTIVITY, "Conductivity",
+                                                     SewageFlag.CONDUCTIVITY_OUTLIER, SewageFlag.NOT_ENOUGH_CONDUCTIVITY_VALUES)
+                # --------------------  NORMALIZATION -------------------
+                self.__normalize_biomarker_values(columns, index)
+                # --------------------  MARK OUTLIERS FROM ALL STEPS -------------------
+                self.__decide_biomarker_usable_based_on_flags(columns, index)
+                invalidation_planner.set_processed(index, columns.get_results(index))
+        columns.write_back(measurements)
+        return changes_detected
+
+    # -----------------  BIOMARKER QC -----------------------
+
+    def __check_comments(self, columns: MeasurementColumns, index):
+        if columns.comment_analysis[index] != '' or columns.comment_operation[index] != '':
+            _add_flag(columns.flag, index, SewageFlag.COMMENT_NOT_EMPTY)
+            self.sewageStat.add_comment_not_empty()
+
+    def __check_mean_sewage_flow_present(self, columns: MeasurementColumns, index):
+        mean_sewage_flow = columns.values[Columns.MEAN_SEWAGE_FLOW][index]
+        if math.isnan(mean_sewage_flow) or mean_sewage_flow == 0:
+            _add_flag(columns.flag, index, SewageFlag.MISSING_MEAN_SEWAGE_FLOW)
+            self.sewageStat.add_mean_sewage_flow_empty()
+
+    def __biomarker_below_threshold_or_empty(self, columns: MeasurementColumns, index):
+        for j, biomarker in enumerate(columns.biomarkers):
+            biomarker_value = columns.biomarker_values[index, j]
+            if math.isnan(biomarker_value) or biomarker_value < self.biomarkerQC.min_biomarker_threshold:
+                _add_flag(columns.biomarker_flags[:, j], index, SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY)
+                self.sewageStat.add_biomarker_below_threshold_or_empty(biomarker)
+
+    def __calculate_biomarker_ratios(self, columns: MeasurementColumns, index):
+        first_biomarkers = [j1 for j1, _ in columns.biomarker_pairs]
+        second_biomarkers = [j2 for _, j2 in columns.biomarker_pairs]
+        is_below_threshold = columns.flags.is_set(index, columns.biomarker_flag_columns,
+                                                  SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY)
+        biomarker1_values = columns.biomarker_values[index, first_biomarkers]
+        biomarker2_values = columns.biomarker_values[index, second_biomarkers]
+        is_skipped = is_below_threshold[first_biomarkers] | is_below_threshold[second_biomarkers] | \
+                     (biomarker1_values == 0) | (biomarker2_values == 0)
+        start, end = self.window_index.count_window(index, self.biomarkerQC.max_number_biomarkers_for_outlier_detection)
+        last_biomarker_ratio_medians = columns.ratio_matrix.get_medians(start, end)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            biomarker_ratios = np.where(np.isnan(last_biomarker_ratio_medians), 1,
+                                        (biomarker1_values / biomarker2_values) / last_biomarker_ratio_medians)
+        columns.biomarker_ratio_values[index] = np.where(is_skipped, np.NAN, biomarker_ratios)
+        columns.ratio_matrix.update_row(index)
+
+    def __detect_biomarker_ratio_outliers(self, columns: MeasurementColumns, index):
+        for p, (j1, j2) in enumerate(columns.biomarker_pairs):
+            biomarker1, biomarker2 = columns.biomarkers[j1], columns.biomarkers[j2]
+            biomarker_ratio = columns.biomarker_ratio_values[index, p]
+            if biomarker_ratio and not math.isnan(biomarker_ratio):
+                start, end = self.window_index.count_window(index, self.biomarkerQC.max_number_biomarkers_for_outlier_detection)
+                rows = columns.ratio_matrix.get_usable_rows(start, end, p)
+                if len(rows) < self.biomarkerQC.min_number_biomarkers_for_outlier_detection:
+                    _add_flag(columns.biomarker_ratio_flags[:, p], index, SewageFlag.NOT_ENOUGH_PREVIOUS_BIOMARKER_VALUES)
+                    continue
+                is_outlier = detect_outliers(self.biomarkerQC.biomarker_outlier_statistics,
+                                             columns.biomarker_ratio_values[rows, p], biomarker_ratio, isFactor=True,
+                                             sewageStat=self.sewageStat)
+                if is_outlier:
+                    _add_flag(columns.biomarker_ratio_flags[:, p], index, SewageFlag.BIOMARKER_RATIO_OUTLIER)
+                    columns.ratio_matrix.exclude(index, p)
+                    self.sewageStat.add_biomarker_ratio_outlier(biomarker1, biomarker2, 'outlier')
+                else:
+                    self.sewageStat.add_biomarker_ratio_outlier(biomarker1, biomarker2, 'passed')
+            else:
+                self.sewageStat.add_biomarker_ratio_outlier(biomarker1, biomarker2, 'skipped')
+
+    def __assign_biomarker_outliers_based_on_ratio_flags(self, columns: MeasurementColumns, index):
+        usable_biomarkers = [j for j in range(len(columns.biomarkers))
+                             if not _has_flag(columns.biomarker_flags[index, j], SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY)]
+        usable_pairs = [p for p, (j1, j2) in enumerate(columns.biomarker_pairs) if j1 in usable_biomarkers and j2 in usable_biomarkers]
+        # if all ratios for a given biomarker are flagged as outliers then the biomarkers is flagged as validated outlier
+        all_ratios_outlier_biomarker_set = set()
+        if len(usable_biomarkers) > 2:
+            for j in usable_biomarkers:
+                if all(_has_flag(columns.biomarker_ratio_flags[index, p], SewageFlag.BIOMARKER_RATIO_OUTLIER)
+                       for p in usable_pairs if j in columns.biomarker_pairs[p]):
+                    all_ratios_outlier_biomarker_set.add(j)
+        for j in all_ratios_outlier_biomarker_set:
+            _add_flag(columns.biomarker_flags[:, j], index, SewageFlag.BIOMARKER_VALIDATED_OUTLIER)
+        for p in usable_pairs:
+            j1, j2 = columns.biomarker_pairs[p]
+            if j1 not in all_ratios_outlier_biomarker_set and j2 not in all_ratios_outlier_biomarker_set:
+                if _has_flag(columns.biomarker_ratio_flags[index, p], SewageFlag.BIOMARKER_RATIO_OUTLIER):
+                    _add_flag(columns.biomarker_flags[:, j1], index, SewageFlag.BIOMARKER_PROBABLE_OUTLIER)
+                    _add_flag(columns.biomarker_flags[:, j2], index, SewageFlag.BIOMARKER_PROBABLE_OUTLIER)
+
+    def __analyze_usable_biomarkers(self, columns: MeasurementColumns, index):
+        is_usable = columns.flags.is_not_set(index, columns.biomarker_flag_columns,
+                                             SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY | SewageFlag.BIOMARKER_VALIDATED_OUTLIER)
+        columns.num_usable_biomarkers[index] = np.count_nonzero(is_usable)
+        if columns.flags.is_set(index, columns.biomarker_flag_columns, SewageFlag.BIOMARKER_PROBABLE_OUTLIER).any():
+            _add_flag(columns.flag, index, SewageFlag.BIOMARKER_PROBABLE_OUTLIER)
+
+    # --------------------  SUROGATVIRUS QC -------------------
+
+    def __filter_dry_days_time_frame(self, columns: MeasurementColumns, index):
+        if columns.trockentag[index].lower().strip() != "ja":
+            _add_flag(columns.flag, index, SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE)
+
+    def __is_surrogatevirus_outlier(self, columns: MeasurementColumns, index):
+        start, end = self.window_index.calendar_window(index, num_month=self.surrogateQC.periode_month_surrogatevirus,
+                                                       include_start=False)
+        for sVirus in Columns.get_surrogatevirus_columns():
+            values = columns.values[sVirus]
+            outlier_flag = CalculatedColumns.get_surrogate_outlier_flag(sVirus)
+            if not _has_flag(columns.flag[index], SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE) and values[index] and \
+                    not math.isnan(values[index]):
+                previous_values = values[start:end]
+                is_previous = ~np.isnan(previous_values) & \
+                              columns.flags.is_not_set(slice(start, end), CalculatedColumns.FLAG.value,
+                                                       SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE | outlier_flag)
+                sVirus_values_to_take = previous_values[is_previous]
+                if len(sVirus_values_to_take) > self.surrogateQC.min_number_surrogatevirus_for_outlier_detection:
+                    is_outlier = detect_outliers(self.surrogateQC.surrogatevirus_outlier_statistics, sVirus_values_to_take, values[index],
+                                                 sewageStat=self.sewageStat)
+                    if is_outlier:
+                        _add_flag(columns.flag, index, outlier_flag)
+                        self.sewageStat.add_surrogate_virus_outlier(sVirus, 'outlier')
+                    else:
+                        self.sewageStat.add_surrogate_virus_outlier(sVirus, 'passed')
+                else:
+                    self.sewageStat.add_surrogate_virus_outlier(sVirus, 'skipped')
+
+    # --------------------  SEWAGE FLOW -------------------
+
+    def __get_mean_flow_based_on_last_min_values(self, sample_location, columns: MeasurementColumns, index):
+        start, end = self.window_index.history_window(index)
+        mean_sewage_flows = self.sewage_flow.dry_weather_flow_estimator.get(columns, columns.values[Columns.MEAN_SEWAGE_FLOW], end)
+        mean_sewage_flows.add(end, columns.flag)
+        if mean_sewage_flows.get_num_flows() < self.sewage_flow.min_num_samples_for_mean_dry_flow:
+            self.logger.log.debug("[Sewage flow] - [Sample location: '{}'] - Less than '{}' "
+                                  "previous samples obtained. Skipping sewage flow QC...".format(sample_location, self.sewage_flow.min_num_samples_for_mean_dry_flow))
+            return None
+        # round up to next integer
+        num_last_N_samples = math.ceil(mean_sewage_flows.get_num_flows() * self.sewage_flow.fraction_last_samples_for_dry_flow)
+        return mean_sewage_flows.get_mean_of_smallest(num_last_N_samples)
+
+    def __get_dry_flow(self, sample_location, columns: MeasurementColumns, index):
+        mean_dry_flow_estimation = self.__get_mean_flow_based_on_last_min_values(sample_location, columns, index)
+        if mean_dry_flow_estimation:
+            return mean_dry_flow_estimation
+        if sample_location in self.sewage_flow.sewage_plants2dry_weather_flow:
+            dry_flow = self.sewage_flow.sewage_plants2dry_weather_flow[sample_location]
+            if dry_flow:
+                return dry_flow
+        return None
+
+    def __sewage_flow_quality_control(self, sample_location, columns: MeasurementColumns, index):
+        flag = columns.flag
+        if not _has_flag(flag[index], SewageFlag.MISSING_MEAN_SEWAGE_FLOW):
+            dry_flow = self.__get_dry_flow(sample_location, columns, index)
+            if dry_flow:
+                current_mean_flow = columns.values[Columns.MEAN_SEWAGE_FLOW][index]
+                if (current_mean_flow / dry_flow) > self.sewage_flow.mean_sewage_flow_above_typo_factor:
+                    self.sewageStat.add_sewage_flow_outlier('probable_typo')
+                    flag[index] += SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value
+                elif (current_mean_flow / dry_flow) > 3:
+                    self.sewageStat.add_sewage_flow_outlier('heavy_precipitation')
+                    flag[index] += SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION.value
+                elif (current_mean_flow / dry_flow) > self.sewage_flow.heavy_precipitation_factor:
+                    self.sewageStat.add_sewage_flow_outlier('precipitation')
+                    flag[index] += SewageFlag.SEWAGE_FLOW_PRECIPITATION.value
+                elif (dry_flow / current_mean_flow) > self.sewage_flow.mean_sewage_flow_below_typo_factor:
+                    self.sewageStat.add_sewage_flow_outlier('probable_typo')
+                    flag[index] += SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value
+                else:
+                    self.sewageStat.add_sewage_flow_outlier('passed')
+            else:
+                flag[index] += SewageFlag.SEWAGE_FLOW_NOT_ENOUGH_PREVIOUS_VALUES.value
+                self.sewageStat.add_sewage_flow_outlier('skipped')
+        else:
+            flag[index] += SewageFlag.SEWAGE_FLOW_NOT_ENOUGH_PREVIOUS_VALUES.value
+            self.sewageStat.add_sewage_flow_outlier('skipped')
+
+    # --------------------  WATER QUALITY -------------------
+
+    def __get_last_N_month_and_days(self, columns: MeasurementColumns, index, values: np.ndarray, num_month, num_days,
+                                    sewage_flag: SewageFlag) -> np.ndarray:
+        """
+        Counterpart of utils.get_last_N_month_and_days
+        """
+        start, end = self.window_index.calendar_window(index, num_month, num_days)
+        previous_values = values[start:end]
+        is_previous = columns.flags.is_not_set(slice(start, end), CalculatedColumns.FLAG.value, sewage_flag) & \
+                      ~np.isnan(previous_values)
+        return previous_values[is_previous]
+
+    def __detect_water_quality_outliers(self, columns: MeasurementColumns, index, qual_type, name,
+                                        outlier_flag: SewageFlag, not_enough_values_flag: SewageFlag):
+        values = columns.values[qual_type]
+        last_values = self.__get_last_N_month_and_days(columns, index, values, self.water_quality.water_quality_number_of_last_month,
+                                                       0, outlier_flag)
+        enough_last_values = last_values.shape[0] >= self.water_quality.min_number_of_last_measurements_for_water_qc
+        if values[index] and not math.isnan(values[index]):
+            if not enough_last_values:
+                self.sewageStat.add_water_quality_outlier(name, 'skipped')
+                _add_flag(columns.flag, index, not_enough_values_flag)
+            else:
+                is_outlier = detect_outliers(self.water_quality.water_qc_outlier_statistics, last_values, values[index],
+                                             sewageStat=self.sewageStat)
+                if is_outlier:
+                    _add_flag(columns.flag, index, outlier_flag)
+                    self.sewageStat.add_water_quality_outlier(name, 'failed')
+                else:
+                    self.sewageStat.add_water_quality_outlier(name, 'passed')
+        else:
+            self.sewageStat.add_water_quality_outlier(name, 'skipped')
+
+    # --------------------  NORMALIZATION -------------------
+
+    def __normalize_with_sewage_flow(self, columns: MeasurementColumns, index):
+        if columns.num_usable_biomarkers[index] >= self.sewageNormalization.min_number_of_biomarkers_for_normalization:
+            if not _has_flag(columns.flag[index], SewageFlag.MISSING_MEAN_SEWAGE_FLOW):
+                biomarker_values = []
+                for j in range(len(columns.biomarkers)):
+                    biomarker_flag = columns.biomarker_flags[index, j]
+                    if not _has_flag(biomarker_flag, SewageFlag.BIOMARKER_VALIDATED_OUTLIER) and \
+                            not _has_flag(biomarker_flag, SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY):
+                        biomarker_value = columns.biomarker_values[index, j]
+                        if biomarker_value and not math.isnan(biomarker_value):
+                            biomarker_values.append(biomarker_value)
+                mean_sewage_flow = (columns.values[Columns.MEAN_SEWAGE_FLOW][index] / 1000) * 60 * 60 * 24  # from l/s --> m³/day
+                mean_biomarker_value = np.mean(biomarker_values) * 1000 * 1000  # from genecopies/ml --> mean genecopies/m³
+                return round(mean_biomarker_value * mean_sewage_flow, 2)  # genecopies/day
+        else:
+            _add_flag(columns.flag, index, SewageFlag.NOT_ENOUGH_BIOMARKERS_FOR_NORMALIZATION)
+        return None
+
+    def __detect_basic_reproduction_number_outliers(self, columns: MeasurementColumns, index):
+        normalized = columns.normalized_mean_biomarkers
+        last_values_one_week = self.__get_last_N_month_and_days(columns, index, normalized, 0,
+                                                                self.sewageNormalization.num_previous_days_reproduction_factor,
+                                                                SewageFlag.REPRODUCTION_NUMBER_OUTLIER)
+        last_values_one_week = last_values_one_week[last_values_one_week > 0]
+        if last_values_one_week.shape[0] > 0:
+            current_mean_normalized_biomarker = normalized[index]
+            last_mean_normalized_biomarker = np.mean(last_values_one_week)
+            if last_mean_normalized_biomarker > 0 and current_mean_normalized_biomarker > 0:  # no division by zero
+                reproduction_factor = current_mean_normalized_biomarker / last_mean_normalized_biomarker
+                columns.base_reproduction_factor[index] = reproduction_factor
+                base_reproduction_value_factor = self.sewageNormalization.base_reproduction_value_factor
+                if reproduction_factor > base_reproduction_value_factor or reproduction_factor < (1 / base_reproduction_value_factor):
+                    _add_flag(columns.flag, index, SewageFlag.REPRODUCTION_NUMBER_OUTLIER)
+                    self.sewageStat.add_reproduction_factor_outlier('failed')
+            else:
+                _add_flag(columns.flag, index, SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED)
+                self.sewageStat.add_reproduction_factor_outlier('skipped')
+        else:
+            _add_flag(columns.flag, index, SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED)
+            self.sewageStat.add_reproduction_factor_outlier('skipped')
+
+    def __normalize_biomarker_values(self, columns: MeasurementColumns, index):
+        normalized_mean_biomarker = self.__normalize_with_sewage_flow(columns, index)
+        if normalized_mean_biomarker:
+            columns.normalized_mean_biomarkers[index] = normalized_mean_biomarker
+            self.__detect_basic_reproduction_number_outliers(columns, index)
+        else:
+            # no normalized mean biomarker could be calculated --> too less usable biomarkers
+            self.sewageStat.add_reproduction_factor_outlier('failed')
+            _add_flag(columns.flag, index, SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED)
+
+    def __add_outlier_reason(self, columns: MeasurementColumns, index, reason: str):
+        values = columns.outlier_reason[index] + ", " + reason
+        if values.startswith(','):
+            values = values[2:]
+        columns.outlier_reason[index] = values
+
+    def __decide_biomarker_usable_based_on_flags(self, columns: MeasurementColumns, index):
+        flag_value = columns.flag[index]
+        num_flags = 0
+        is_outlier = False
+        if _has_flag(flag_value, SewageFlag.COMMENT_NOT_EMPTY):
+            num_flags += 1
+        #  less than 2 biomarker values available
+        if _has_flag(flag_value, SewageFlag.NOT_ENOUGH_BIOMARKERS_FOR_NORMALIZATION):
+            is_outlier = True
+            self.sewageStat.add_outliers('Min num biomarkers not reached')
+            self.__add_outlier_reason(columns, index, 'Min num biomarkers not reached')
+        num_flags += np.count_nonzero(~columns.flags.is_not_set(
+            index, columns.biomarker_flag_columns, SewageFlag.BIOMARKER_PROBABLE_OUTLIER | SewageFlag.BIOMARKER_VALIDATED_OUTLIER))
+        # surrogate_virus_flags
+        surrogate_virus_outliers = [_has_flag(flag_value, CalculatedColumns.get_surrogate_outlier_flag(sVirus))
+                                    for sVirus in Columns.get_surrogatevirus_columns()]
+        num_surrogate_virus_flags = sum(surrogate_virus_outliers)
+        if all(surrogate_virus_outliers):
+            self.sewageStat.add_outliers('Surrogate virus outlier')
+            self.__add_outlier_reason(columns, index, 'Surrogate virus outlier')
+            is_outlier = True
+        else:
+            num_flags += num_surrogate_virus_flags
+        if _has_flag(flag_value, SewageFlag.SEWAGE_FLOW_PRECIPITATION):  # precipitation outlier
+            if num_surrogate_virus_flags > 0:
+                self.sewageStat.add_outliers('Sewage flow outlier')
+                self.__add_outlier_reason(columns, index, 'Sewage flow outlier')
+                is_outlier = True
+        if _has_flag(flag_value, SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION):  # heavy precipitation outlier
+            self.sewageStat.add_outliers('Sewage flow outlier')
+            self.__add_outlier_reason(columns, index, 'Sewage flow outlier')
+            is_outlier = True
+        if _has_flag(flag_value, SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO):  # probable typo outlier
+            self.sewageStat.add_outliers('Sewage flow outlier')
+            self.__add_outlier_reason(columns, index, 'Sewage flow outlier')
+            is_outlier = True
+        if _has_flag(flag_value, SewageFlag.AMMONIUM_OUTLIER):
+            num_flags += 1
+        if _has_flag(flag_value, SewageFlag.CONDUCTIVITY_OUTLIER):
+            num_flags += 1
+        if _has_flag(flag_value, SewageFlag.REPRODUCTION_NUMBER_OUTLIER):
+            self.sewageStat.add_outliers('Reproduction factor outlier')
+            self.__add_outlier_reason(columns, index, 'Reproduction factor outlier')
+            is_outlier = True
+        if num_flags > self.sewageNormalization.max_number_of_flags_for_outlier:
+            self.__add_outlier_reason(columns, index, 'Too many flags')
+            self.sewageStat.add_outliers('Too many flags')
+            is_outlier = True
+        if is_outlier:
+            columns.usable[index] = False
+        else:
+            columns.usable[index] = True
+            # remove biomarker ratio outliers in case the sample is valid
+            is_ratio_outlier = columns.flags.is_set(index, columns.biomarker_ratio_flag_columns,
+                                                    SewageFlag.BIOMARKER_RATIO_OUTLIER)
+            columns.biomarker_ratio_flags[index, is_ratio_outlier] |= FlagMatrix.get_mask(SewageFlag.BIOMARKER_RATIO_OUTLIER_REMOVED)
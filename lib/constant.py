@@ -1,5 +1,7 @@
 # Created by alex at 15.06.23
 
+import itertools
+import functools
 from enum import Enum, Flag
 
 import numpy as np
@@ -51,53 +53,40 @@ class SewageFlag(Flag):
 
     @staticmethod
     def remove_flag_from_index_column(df, index, flag_column, sewage_flag) -> None:
-        if isinstance(sewage_flag, SewageFlag):
-            current_flag = df.iloc[index][flag_column]
-            has_flag = SewageFlag.is_flag(current_flag, sewage_flag)
-            if has_flag:
-                df.at[index, flag_column] -= sewage_flag.value
-        else:
-            raise ValueError("The given flag is not of type 'SewageFlag'")
+        mask = FlagMatrix.get_mask(sewage_flag)
+        current_flag = df.iat[index, df.columns.get_loc(flag_column)]
+        if (current_flag & mask) == mask:
+            df.at[index, flag_column] = current_flag - mask
 
     @staticmethod
     def add_flag_to_index_column(df, index, flag_column, sewage_flag) -> None:
-        if isinstance(sewage_flag, SewageFlag):
-            current_flag = df.iloc[index][flag_column]
-            has_flag = SewageFlag.is_flag(current_flag, sewage_flag)
-            if not has_flag:
-                df.at[index, flag_column] += sewage_flag.value
-        else:
-            raise ValueError("The given flag is not of type 'SewageFlag'")
+        mask = FlagMatrix.get_mask(sewage_flag)
+        current_flag = df.iat[index, df.columns.get_loc(flag_column)]
+        if (current_flag & mask) != mask:
+            df.at[index, flag_column] = current_flag + mask
 
     @staticmethod
     def add_series_flag_to_column(df: pd.DataFrame, flag_column, sewage_flag_series: np.array) -> None:
-        for index, row in df.iterrows():
-            current_flag = row[flag_column]
-            new_flag = SewageFlag.get_flag_from_value(sewage_flag_series[index])
-            if not SewageFlag.is_flag(current_flag, new_flag):
-                df.at[index, flag_column] += new_flag.value
+        new_flags = np.asarray(sewage_flag_series[df.index], dtype=np.int64)
+        df[flag_column] = df[flag_column].to_numpy() | new_flags
 
     @staticmethod
     def is_not_flag_set_for_series(series: pd.Series, sewage_flag) -> pd.Series:
         """
             checks if the given flag is NOT contained in a series/dataframe and returns a boolean series
         """
-        if isinstance(sewage_flag, SewageFlag):
-            series = series.astype(int)
-            return (series & sewage_flag.value) == 0
-        else:
-            raise ValueError("The given flag is not of type 'SewageFlag'")
+        mask = FlagMatrix.get_mask(sewage_flag)
+        series = series.astype(int)
+        return (series & mask) == 0
 
     @staticmethod
     def is_flag_set_for_series(series: pd.Series, sewage_flag) -> pd.Series:
         """
             checks if the given flag is contained in the series and returns a boolean series
         """
-        if isinstance(sewage_flag, SewageFlag):
-            series = series.astype(int)
-            return (series & sewage_flag.value) == sewage_flag.value
-        else:
-            raise ValueError("The given flag is not of type 'SewageFlag'")
+        mask = FlagMatrix.get_mask(sewage_flag)
+        series = series.astype(int)
+        return (series & mask) == mask
 
     @staticmethod
     def explain_flag_series(series: pd.Series) -> pd.Series:
@@ -105,8 +94,13 @@ class SewageFlag(Flag):
         Convert a flag column to named flags.
         E.g.: SewageFlag.convert_flag_series_to_named(measurements[Columns.FLAG.value])
         to convert the integer flag column to named flag column
+        Each distinct flag value is explained once, the named flags are returned as categorical series.
         """
-        return series.apply(SewageFlag.explain_flags_to_string)
+        codes, flag_values = pd.factorize(series)
+        explanations = [SewageFlag.explain_flags_to_string(int(flag_value)) for flag_value in flag_values]
+        explanation_codes, categories = pd.factorize(pd.Series(explanations, dtype=object))
+        codes = np.where(codes >= 0, explanation_codes[codes], -1)
+        return pd.Series(pd.Categorical.from_codes(codes, categories), index=series.index, name=series.name)
 
     @staticmethod
     def explain_flags_to_array(flag_value: int) -> []:
@@ -120,6 +114,7 @@ class SewageFlag(Flag):
         return named_flags
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def explain_flags_to_string(flag_value: int) -> str:
         """
         Returns a string representation of all flags that are stored in the given flag_value.
@@ -132,20 +127,15 @@ class SewageFlag(Flag):
         """
         Check if a flag is set
         """
-        if isinstance(sewage_flag, SewageFlag):
-            return (sewage_flag.value & flag_value) == sewage_flag.value
-        else:
-            raise ValueError("The given flag is not of type 'SewageFlag'")
+        mask = FlagMatrix.get_mask(sewage_flag)
+        return (mask & flag_value) == mask
 
     @staticmethod
     def is_not_flag(flag_value: int, sewage_flag) -> bool:
         """
         Check if a flag is NOT set
         """
-        if isinstance(sewage_flag, SewageFlag):
-            return (sewage_flag.value & flag_value) == 0
-        else:
-            raise ValueError("The given flag is not of type 'SewageFlag'")
+        return (FlagMatrix.get_mask(sewage_flag) & flag_value) == 0
 
     @staticmethod
     def get_flag_from_value(flag_value: int):
@@ -196,6 +186,26 @@ class CalculatedColumns(Enum):
         else:
             return True
 
+    @staticmethod
+    def get_initial_values() -> dict:
+        """
+        Values of the calculated columns of a measurement that was not processed yet
+        """
+        initial_values = dict()
+        for biomarker in Columns.get_biomarker_columns():
+            initial_values[CalculatedColumns.get_biomarker_flag(biomarker)] = 0
+        for biomarker1, biomarker2 in itertools.combinations(Columns.get_biomarker_columns(), 2):
+            initial_values[biomarker1 + "/" + biomarker2] = np.NAN
+            initial_values[CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)] = 0
+        for c in CalculatedColumns:
+            if c.type == bool:
+                initial_values[c.value] = c.value == CalculatedColumns.NEEDS_PROCESSING.value
+            elif c.type == str:
+                initial_values[c.value] = ""
+            else:
+                initial_values[c.value] = c.type(0)
+        return initial_values
+
     @staticmethod
     def get_num_of_unprocessed(measurements_df: pd.DataFrame) -> int:
         if CalculatedColumns.NEEDS_PROCESSING.value in measurements_df:
@@ -272,3 +282,85 @@ class Columns:
         surrogatevirus_columns = [Columns.CRASSPHAGE, Columns.PMMOV]
         return surrogatevirus_columns
 
+    @staticmethod
+    def get_input_columns():
+        input_columns = [Columns.DATE, Columns.COMMENT_ANALYSIS, Columns.COMMENT_OPERATION] + \
+                        Columns.get_biomarker_columns() + \
+                        [Columns.AMMONIUM, Columns.CONDUCTIVITY, Columns.MEAN_SEWAGE_FLOW] + \
+                        Columns.get_surrogatevirus_columns() + [Columns.TROCKENTAG]
+        return input_columns
+
+
+
+class FlagMatrix:
+    """
+    The flag columns of the measurements of one sample location (flag, flag_biomaker_* and flag_ratio_*) as one
+    unsigned integer matrix. Each column is contiguous, thus windows of previous flags are tested without copies.
+    Flags are set, tested and cleared with integer masks for any selection of rows and columns at once.
+    The flags of the measurement, the biomarkers and the biomarker ratios are also available as views.
+    """
+    dtype = np.uint32
+
+    def __init__(self, measurements: pd.DataFrame):
+        self.columns = FlagMatrix.get_flag_columns()
+        self.positions = {column: position for position, column in enumerate(self.columns)}
+        num_biomarkers = len(Columns.get_biomarker_columns())
+        self.matrix = np.zeros((measurements.shape[0], len(self.columns)), dtype=self.dtype, order='F')
+        for position, column in enumerate(self.columns):
+            if column in measurements:
+                self.matrix[:, position] = measurements[column].to_numpy(dtype=np.int64)
+        self.flag = self.matrix[:, 0]
+        self.biomarker_flags = self.matrix[:, 1:1 + num_biomarkers]
+        self.biomarker_ratio_flags = self.matrix[:, 1 + num_biomarkers:]
+
+    @staticmethod
+    def get_flag_columns() -> []:
+        biomarkers = Columns.get_biomarker_columns()
+        return [CalculatedColumns.FLAG.value] + CalculatedColumns.get_biomarker_flag_columns() + \
+            [CalculatedColumns.get_biomaker_ratio_flag(b1, b2) for b1, b2 in itertools.combinations(biomarkers, 2)]
+
+    @staticmethod
+    def get_mask(sewage_flag) -> int:
+        """
+        Integer mask of the flag, also of combined flags like SewageFlag.AMMONIUM_OUTLIER | SewageFlag.CONDUCTIVITY_OUTLIER
+        """
+        if type(sewage_flag) is not SewageFlag:
+            raise ValueError("The given flag is not of type 'SewageFlag'")
+        return sewage_flag._value_
+
+    def __get_index(self, rows, columns) -> tuple:
+        """
+        :param rows: row position, slice or positions
+        :param columns: column name or names, None for all columns
+        """
+        if columns is None:
+            columns = slice(None)
+        elif isinstance(columns, str):
+            columns = self.positions[columns]
+        else:
+            columns = [self.positions[c] for c in columns]
+        if isinstance(columns, list) and not np.isscalar(rows) and not isinstance(rows, slice):
+            return np.ix_(np.asarray(rows), columns)
+        return rows, columns
+
+    def set(self, rows, columns, sewage_flag) -> None:
+        index = self.__get_index(rows, columns)
+        self.matrix[index] |= self.dtype(self.get_mask(sewage_flag))
+
+    def clear(self, rows, columns, sewage_flag) -> None:
+        index = self.__get_index(rows, columns)
+        self.matrix[index] &= ~self.dtype(self.get_mask(sewage_flag))
+
+    def is_set(self, rows, columns, sewage_flag) -> np.ndarray:
+        mask = self.dtype(self.get_mask(sewage_flag))
+        return (self.matrix[self.__get_index(rows, columns)] & mask) == mask
+
+    def is_not_set(self, rows, columns, sewage_flag) -> np.ndarray:
+        return (self.matrix[self.__get_index(rows, columns)] & self.dtype(self.get_mask(sewage_flag))) == 0
+
+    def reset(self, rows) -> None:
+        self.matrix[rows] = 0
+
+    def write_back(self, measurements: pd.DataFrame) -> None:
+        for position, column in enumerate(self.columns):
+            measurements[column] = self.matrix[:, position].astype(np.int64)
@@ -2,23 +2,612 @@
 import os
 from platform import system
 from subprocess import call
+from contextlib import closing
 from pathlib import Path
 import itertools
+import datetime
+import shutil
 import hashlib
+import urllib.parse
+import sqlite3
+import time
+import json
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
 
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
+import pyarrow.ipc as ipc
 from .utils import *
 
+CHECKSUM_COLUMN = "checksum"
+database_backends = ['files', 'arrow', 'partitioned', 'sqlite']
+
+
+def get_default_database_folder() -> str:
+    return os.path.join(str(Path.home()), ".sewage_qc_normalization")
+
+
+class LocationLock:
+    """
+    Lock file of a sample location in the folder .locks of the database, shared by all processes using the database.
+    Writers hold the exclusive lock, readers that could see a partially stored sample location the shared lock.
+    On windows, the lock is always exclusive.
+    """
+
+    def __init__(self, database_folder, sample_location, shared=False):
+        self.lock_file = os.path.join(database_folder, ".locks",
+                                      "{}.lock".format(urllib.parse.quote(sample_location, safe='')))
+        self.shared = shared
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        self.file = open(self.lock_file, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # gives up after 10 seconds
+                    time.sleep(1)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+class LocationFilesBackend:
+    """
+    One hidden parquet file per sample location, which is rewritten completely on every run. The file is replaced
+    atomically while holding the lock of the sample location. The file is named by the escaped sample location, the
+    name of the sample location is stored in the schema metadata.
+    """
+
+    file_extension = "parquet"
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+
+    def __get_sample_location_escaped(self, sample_location: str):
+        sample_location_escaped = sample_location.replace(" ", "_").replace("/", "_")
+        return sample_location_escaped
+
+    def get_database_file(self, sample_location):
+        sample_location = self.__get_sample_location_escaped(sample_location)
+        return os.path.join(self.output_folder, ".{}_sewage_db.{}".format(sample_location, self.file_extension))
+
+    def get_sample_locations(self) -> List[str]:
+        """
+        :return: stored sample locations, as escaped in the file names for files of older versions
+        """
+        suffix = "_sewage_db.{}".format(self.file_extension)
+        sample_locations = []
+        for name in os.listdir(self.output_folder):
+            if name.startswith(".") and name.endswith(suffix):
+                metadata = self.read_schema_metadata(os.path.join(self.output_folder, name)) or dict()
+                sample_locations.append(metadata[b'ssqn_location'].decode() if b'ssqn_location' in metadata
+                                        else name[1:-len(suffix)])
+        return sorted(sample_locations)
+
+    @staticmethod
+    def read_schema_metadata(database_file) -> dict:
+        return pq.read_schema(database_file).metadata
+
+    @staticmethod
+    def get_table(sample_location, measurements_df: pd.DataFrame, metadata: dict = None) -> pa.Table:
+        """
+        :return: measurements as table with the sample location in the schema metadata
+        """
+        table = pa.Table.from_pandas(measurements_df)
+        return table.replace_schema_metadata({**(table.schema.metadata or dict()), **(metadata or dict()),
+                                              b'ssqn_location': sample_location.encode()})
+
+    def load(self, sample_location, columns: List[str] = None, filters: list = None) -> pd.DataFrame:
+        """
+        :param columns: columns to read, all if None
+        :param filters: row filters in the format of pyarrow, e.g. [('collectionDate', '>=', start_date)]
+        :return: stored measurements or None if nothing is stored for the sample location
+        """
+        database_file = self.get_database_file(sample_location)
+        if os.path.exists(database_file):
+            return pq.read_table(database_file, columns=columns, filters=filters).to_pandas()
+        return None
+
+    def store(self, sample_location, measurements_df: pd.DataFrame) -> None:
+        table = self.get_table(sample_location, measurements_df)
+        database_file = self.get_database_file(sample_location)
+        # the file is replaced atomically, readers need no lock
+        with LocationLock(self.output_folder, sample_location):
+            remove_temporary_files(database_file)
+            write_table_atomic(table, database_file)
+
+
+class ArrowSnapshotBackend(LocationFilesBackend):
+    """
+    One hidden uncompressed Arrow IPC file per sample location, which is memory-mapped when loading. Numeric and date
+    columns without missing values are used zero-copy as read only arrays, thus the pages of the file are only read
+    when the rows are accessed. Filters of the collection date only slice the table if the snapshot is sorted by date.
+    """
+    file_extension = "arrow"
+
+    def load(self, sample_location, columns: List[str] = None, filters: list = None) -> pd.DataFrame:
+        """
+        :param columns: columns to read, all if None
+        :param filters: row filters in the format of pyarrow, e.g. [('collectionDate', '>=', start_date)]
+        :return: stored measurements or None if nothing is stored for the sample location
+        """
+        database_file = self.get_database_file(sample_location)
+        if not os.path.exists(database_file):
+            return None
+        table = ipc.open_file(pa.memory_map(database_file)).read_all()
+        if filters is not None:
+            table = self.__filter(table, filters)
+        if columns is not None:
+            table = table.select(columns)
+        # split blocks, otherwise pandas copies the columns of the same type into one block
+        return table.to_pandas(split_blocks=True)
+
+    @staticmethod
+    def read_schema_metadata(database_file) -> dict:
+        return ipc.open_file(pa.memory_map(database_file)).schema.metadata
+
+    @staticmethod
+    def __filter(table: pa.Table, filters: list) -> pa.Table:
+        is_sorted = (table.schema.metadata or dict()).get(b'ssqn_sorted') == b'1'
+        if not is_sorted or any(column != Columns.DATE or operator not in ['>', '>=', '<', '<=']
+                                for column, operator, _ in filters):
+            return table.filter(pq.filters_to_expression(filters))
+        # binary search in the sorted collection dates
+        dates = table.column(Columns.DATE).to_numpy()
+        start, end = 0, table.num_rows
+        for _, operator, value in filters:
+            value = np.datetime64(pd.Timestamp(value))
+            if operator in ['>', '>=']:
+                start = max(start, int(np.searchsorted(dates, value, side='left' if operator == '>=' else 'right')))
+            else:
+                end = min(end, int(np.searchsorted(dates, value, side='right' if operator == '<=' else 'left')))
+        return table.slice(start, max(end - start, 0))
+
+    def store(self, sample_location, measurements_df: pd.DataFrame) -> None:
+        is_sorted = Columns.DATE in measurements_df and measurements_df[Columns.DATE].is_monotonic_increasing
+        table = self.get_table(sample_location, measurements_df, {b'ssqn_sorted': b'1' if is_sorted else b'0'})
+        # one record batch, thus each column is one contiguous array in the file
+        table = table.combine_chunks()
+
+        def write_snapshot(path):
+            with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+        database_file = self.get_database_file(sample_location)
+        with LocationLock(self.output_folder, sample_location):
+            remove_temporary_files(database_file)
+            write_atomic(database_file, write_snapshot)
+
+
+class PartitionedParquetBackend:
+    """
+    All sample locations in one parquet dataset, hive partitioned by sample location and optionally by year:
+
+        <folder>/location=<sample location>[/year=<year>]/part-<sequence number>.parquet
+
+    A partition consists of fragments written one after the other. When a sample location is stored, unchanged
+    partitions are skipped, rows appended to a partition are written as a new fragment and only partitions with
+    changed or removed rows are rewritten. Partitions with more than max_fragments fragments are compacted into one.
+
+    The file _manifest.json of a sample location lists the fragments, the number of rows and the checksum of its
+    partitions. It is replaced atomically after all new fragments were written, thus readers and runs killed while
+    storing see either the previous or the new version of the sample location. Fragments not listed in the manifest are removed afterwards or by the next store.
+    """
+    manifest_name = "_manifest.json"
+
+    def __init__(self, folder, partition_by_year=False, max_fragments=8):
+        self.folder = folder
+        self.partition_by_year = partition_by_year
+        self.max_fragments = max_fragments
+
+    def __get_location_folder(self, sample_location):
+        return os.path.join(self.folder, "location={}".format(urllib.parse.quote(sample_location, safe='')))
+
+    def get_sample_locations(self) -> List[str]:
+        return sorted(urllib.parse.unquote(name[len("location="):]) for name in os.listdir(self.folder)
+                      if name.startswith("location=") and
+                      os.path.exists(os.path.join(self.folder, name, self.manifest_name)))
+
+    def __get_partitions(self, measurements_df: pd.DataFrame) -> dict:
+        """
+        :return: partition name to positions of its rows
+        """
+        if not self.partition_by_year:
+            return {".": np.arange(measurements_df.shape[0])}
+        years = measurements_df[Columns.DATE].dt.year.fillna(0).to_numpy(dtype=np.int64)
+        return {"year={}".format(year): np.flatnonzero(years == year) for year in np.unique(years)}
+
+    @staticmethod
+    def __get_sequence_number(fragment) -> int:
+        return int(os.path.basename(fragment)[len("part-"):-len(".parquet")])
+
+    def __read_manifest(self, location_folder) -> dict:
+        """
+        :return: partition name to the fragments, number of rows and checksum of the partition, None if nothing
+                 is stored for the sample location, also if the first store was killed before writing the manifest
+        """
+        manifest_file = os.path.join(location_folder, self.manifest_name)
+        if not os.path.exists(manifest_file):
+            return None
+        with open(manifest_file) as f:
+            return json.load(f)
+
+    def __write_manifest(self, location_folder, manifest: dict) -> None:
+        def write_json(path):
+            with open(path, 'w') as f:
+                json.dump(manifest, f)
+        write_atomic(os.path.join(location_folder, self.manifest_name), write_json)
+
+    def __remove_unlisted_files(self, location_folder, manifest: dict) -> None:
+        """
+        Removes the replaced fragments, removed partitions and temporary files, also the ones of killed runs
+        """
+        for name in os.listdir(location_folder):
+            if name.startswith("year=") and name not in manifest:
+                shutil.rmtree(os.path.join(location_folder, name))
+        for partition in manifest:
+            partition_folder = os.path.join(location_folder, partition)
+            for name in os.listdir(partition_folder):
+                if (name.startswith("part-") and name not in manifest[partition]['fragments']) or \
+                        ".parquet.tmp-" in name:
+                    os.remove(os.path.join(partition_folder, name))
+        remove_temporary_files(os.path.join(location_folder, self.manifest_name))
+
+    @staticmethod
+    def __get_partition_checksum(row_checksums: np.ndarray) -> str:
+        return hashlib.sha256(row_checksums.tobytes()).hexdigest()
+
+    @staticmethod
+    def __write_fragment(partition_folder, sequence_number, partition_df: pd.DataFrame) -> str:
+        if not os.path.exists(partition_folder):
+            os.makedirs(partition_folder)
+        table = pa.Table.from_pandas(partition_df, preserve_index=False)
+        fragment = "part-{:08d}.parquet".format(sequence_number)
+        write_table_atomic(table, os.path.join(partition_folder, fragment))
+        return fragment
+
+    def load(self, sample_location, columns: List[str] = None, filters: list = None) -> pd.DataFrame:
+        """
+        :param columns: columns to read, all if None
+        :param filters: row filters in the format of pyarrow, e.g. [('collectionDate', '>=', start_date)].
+                        Filters of the collection date skip the year partitions outside of the date range.
+        :return: stored measurements or None if nothing is stored for the sample location
+        """
+        location_folder = self.__get_location_folder(sample_location)
+        tables = []
+        # the shared lock keeps the fragments of the manifest until they are read
+        with LocationLock(self.folder, sample_location, shared=True):
+            manifest = self.__read_manifest(location_folder)
+            if manifest is None:
+                return None
+            for partition in sorted(manifest):
+                if not self.__is_year_selected(partition, filters):
+                    continue
+                for fragment in manifest[partition]['fragments']:
+                    tables.append(pq.read_table(os.path.join(location_folder, partition, fragment), columns=columns,
+                                                filters=filters))
+        if len(tables) == 0:
+            return pd.DataFrame(columns=columns)
+        partition_dfs = [table.to_pandas() for table in tables]
+        measurements_df = pd.concat(partition_dfs, ignore_index=True)
+        # categorical columns of fragments with different categories are concatenated as objects
+        for column, dtype in partition_dfs[0].dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype) and not isinstance(measurements_df[column].dtype, pd.CategoricalDtype):
+                measurements_df[column] = measurements_df[column].astype('category')
+        return measurements_df
+
+    @staticmethod
+    def __is_year_selected(partition, filters) -> bool:
+        """
+        The layout of the stored partitions is taken from the manifest, a sample location stored without year
+        partitions has the single partition '.', which is always selected
+        """
+        if not partition.startswith("year="):
+            return True
+        year = int(partition[len("year="):])
+        for column, operator, value in filters or []:
+            if column != Columns.DATE:
+                continue
+            value_year = pd.Timestamp(value).year
+            if (operator in ['>', '>='] and year < value_year) or (operator in ['<', '<='] and year > value_year) or \
+                    (operator in ['=', '=='] and year != value_year):
+                return False
+        return True
+
+    def store(self, sample_location, measurements_df: pd.DataFrame) -> None:
+        measurements_df = measurements_df.reset_index(drop=True)
+        row_checksums = pd.util.hash_pandas_object(measurements_df, index=False).to_numpy(dtype=np.uint64)
+        location_folder = self.__get_location_folder(sample_location)
+        with LocationLock(self.folder, sample_location):
+            manifest = self.__read_manifest(location_folder) or dict()
+            if os.path.exists(location_folder):
+                self.__remove_unlisted_files(location_folder, manifest)
+            new_manifest = dict()
+            for partition, positions in self.__get_partitions(measurements_df).items():
+                new_manifest[partition] = self.__store_partition(os.path.join(location_folder, partition),
+                                                                 manifest.get(partition), measurements_df.iloc[positions],
+                                                                 row_checksums[positions])
+            if new_manifest != manifest or not os.path.exists(os.path.join(location_folder, self.manifest_name)):
+                self.__write_manifest(location_folder, new_manifest)
+                self.__remove_unlisted_files(location_folder, new_manifest)
+
+    def __store_partition(self, partition_folder, stored: dict, partition_df: pd.DataFrame,
+                          partition_checksums: np.ndarray) -> dict:
+        """
+        Writes the new fragment of the partition if it was changed
+        :param stored: manifest entry of the stored partition, None if it does not exist
+        :return: new manifest entry of the partition
+        """
+        stored = stored or {'fragments': [], 'rows': 0, 'checksum': None}
+        fragments = stored['fragments']
+        checksum = self.__get_partition_checksum(partition_checksums)
+        num_rows = partition_df.shape[0]
+        if stored['rows'] == num_rows and stored['checksum'] == checksum:
+            return stored  # unchanged
+        sequence_number = self.__get_sequence_number(fragments[-1]) + 1 if fragments else 0
+        is_appended = 0 < stored['rows'] < num_rows and \
+            stored['checksum'] == self.__get_partition_checksum(partition_checksums[:stored['rows']])
+        if is_appended and len(fragments) < self.max_fragments:
+            fragment = self.__write_fragment(partition_folder, sequence_number, partition_df.iloc[stored['rows']:])
+            fragments = fragments + [fragment]
+        else:
+            # rewrite or compact the partition, the old fragments are removed after the manifest was written
+            fragments = [self.__write_fragment(partition_folder, sequence_number, partition_df)]
+        return {'fragments': fragments, 'rows': num_rows, 'checksum': checksum}
+
+
+class SqliteBackend:
+    """
+    All sample locations in the table 'measurements' of a SQLite database with the sample location in the column
+    'location'. The indexes on (location, collectionDate, usable, flag) and (collectionDate, location, usable, flag)
+    answer queries across sample locations without reading the measurements of every sample location.
+    The pandas types of the columns of each sample location are kept in the table 'column_types' and restored when
+    loading. A sample location is stored in one transaction, SQLite thus handles concurrent runs and killed writers.
+    """
+    table = "measurements"
+    location_column = "location"
+    date_format = "%Y-%m-%d %H:%M:%S"
+    # seconds to wait for the write lock held by other processes
+    timeout = 600
+    operators = ['=', '==', '!=', '<', '<=', '>', '>=']
+
+    def __init__(self, database_file):
+        self.database_file = database_file
+
+    def connect(self, read_only=False) -> sqlite3.Connection:
+        if read_only:
+            if not os.path.exists(self.database_file):
+                raise ValueError("Database not found: {}".format(self.database_file))
+            return sqlite3.connect("file:{}?mode=ro".format(urllib.parse.quote(self.database_file)), uri=True,
+                                   timeout=self.timeout)
+        return sqlite3.connect(self.database_file, timeout=self.timeout)
+
+    @staticmethod
+    def __quote(identifier) -> str:
+        return '"{}"'.format(identifier.replace('"', '""'))
+
+    @staticmethod
+    def __get_sql_type(dtype) -> str:
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            return "INTEGER"
+        elif pd.api.types.is_float_dtype(dtype):
+            return "REAL"
+        return "TEXT"
+
+    def __get_column_types(self, connection, sample_location=None) -> dict:
+        """
+        Column types of the sample location. The types of all sample locations are combined if no sample location is
+        given: numbers of different types as float64, otherwise the column is not converted.
+        """
+        if not self.__has_table(connection, "column_types"):
+            return dict()
+        if sample_location is not None:
+            return dict(connection.execute("SELECT name, dtype FROM column_types WHERE location = ? ORDER BY position",
+                                           (sample_location,)).fetchall())
+        column_types = dict()
+        for name, dtypes in connection.execute("SELECT name, GROUP_CONCAT(DISTINCT dtype) FROM column_types GROUP BY name"):
+            dtypes = dtypes.split(",")
+            if len(dtypes) == 1:
+                column_types[name] = dtypes[0]
+            elif all(dtype in ['bool', 'int64', 'float64'] for dtype in dtypes):
+                column_types[name] = 'float64'
+        return column_types
+
+    @staticmethod
+    def __has_table(connection, table) -> bool:
+        return connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+    def __create_tables(self, connection, measurements_df: pd.DataFrame) -> None:
+        if not self.__has_table(connection, self.table):
+            columns = ["{} TEXT NOT NULL".format(self.location_column)] + \
+                      ["{} {}".format(self.__quote(c), self.__get_sql_type(t)) for c, t in measurements_df.dtypes.items()]
+            connection.execute("CREATE TABLE {} ({})".format(self.table, ", ".join(columns)))
+            connection.execute("CREATE TABLE column_types (location TEXT NOT NULL, position INTEGER NOT NULL, "
+                               "name TEXT NOT NULL, dtype TEXT NOT NULL, PRIMARY KEY (location, name))")
+        else:
+            existing_columns = {row[1] for row in connection.execute("PRAGMA table_info({})".format(self.table))}
+            for column, dtype in measurements_df.dtypes.items():
+                if column not in existing_columns:
+                    connection.execute("ALTER TABLE {} ADD COLUMN {} {}".format(self.table, self.__quote(column),
+                                                                              self.__get_sql_type(dtype)))
+        for name, columns in [("location_date", [self.location_column, Columns.DATE]),
+                              ("date_location", [Columns.DATE, self.location_column])]:
+            columns += [CalculatedColumns.USABLE.value, CalculatedColumns.FLAG.value]
+            if all(c == self.location_column or c in measurements_df for c in columns):
+                connection.execute("CREATE INDEX IF NOT EXISTS {}_{} ON {} ({})".format(
+                    self.table, name, self.table, ", ".join(self.__quote(c) for c in columns)))
+
+    def __to_sql_value(self, value):
+        if isinstance(value, (pd.Timestamp, datetime.datetime)):
+            return value.strftime(self.date_format)
+        return value
+
+    def __get_where_clause(self, sample_locations: List[str] = None, filters: list = None) -> (str, list):
+        conditions, parameters = [], []
+        if sample_locations is not None:
+            conditions.append("{} IN ({})".format(self.location_column, ", ".join("?" * len(sample_locations))))
+            parameters += list(sample_locations)
+        for column, operator, value in filters or []:
+            if operator not in self.operators:
+                raise ValueError("Unsupported filter operator: {}".format(operator))
+            conditions.append("{} {} ?".format(self.__quote(column), operator))
+            parameters.append(self.__to_sql_value(value))
+        return (" WHERE " + " AND ".join(conditions)) if len(conditions) > 0 else "", parameters
+
+    def __restore_types(self, df: pd.DataFrame, column_types: dict) -> pd.DataFrame:
+        for column in df.columns:
+            dtype = column_types.get(column)
+            if dtype is None or dtype == 'object':
+                continue
+            if dtype.startswith('datetime64'):
+                df[column] = pd.to_datetime(df[column], format=self.date_format)
+            elif dtype == 'uint64':
+                df[column] = df[column].astype(np.int64).view(np.uint64)
+            else:
+                df[column] = df[column].astype(dtype)
+        return df
+
+    def read_sql(self, sql, parameters=()) -> pd.DataFrame:
+        """
+        Runs a query on a read only connection, the types of the measurement columns are restored.
+        """
+        with closing(self.connect(read_only=True)) as connection:
+            df = pd.read_sql_query(sql, connection, params=parameters)
+            return self.__restore_types(df, self.__get_column_types(connection))
+
+    def load(self, sample_location, columns: List[str] = None, filters: list = None) -> pd.DataFrame:
+        """
+        :param columns: columns to read, all if None
+        :param filters: row filters in the format of pyarrow, e.g. [('collectionDate', '>=', start_date)]
+        :return: stored measurements or None if nothing is stored for the sample location
+        """
+        if not os.path.exists(self.database_file):
+            return None
+        with closing(self.connect()) as connection:
+            if not self.__has_table(connection, self.table) or connection.execute(
+                    "SELECT 1 FROM {} WHERE {} = ? LIMIT 1".format(self.table, self.location_column),
+                    (sample_location,)).fetchone() is None:
+                return None
+            column_types = self.__get_column_types(connection, sample_location)
+            selected = ", ".join(self.__quote(c) for c in columns) if columns is not None else \
+                ", ".join(self.__quote(c) for c in column_types)
+            where, parameters = self.__get_where_clause([sample_location], filters)
+            df = pd.read_sql_query("SELECT {} FROM {}{} ORDER BY rowid".format(selected, self.table, where),
+                                   connection, params=parameters)
+            return self.__restore_types(df, column_types)
+
+    def get_sample_locations(self) -> List[str]:
+        if not os.path.exists(self.database_file):
+            return []
+        with closing(self.connect(read_only=True)) as connection:
+            if not self.__has_table(connection, self.table):
+                return []
+            sql = "SELECT DISTINCT {location} FROM {table} ORDER BY {location}"
+            return [location for location, in connection.execute(sql.format(location=self.location_column,
+                                                                             table=self.table))]
+
+    def store(self, sample_location, measurements_df: pd.DataFrame) -> None:
+        values = measurements_df.copy()
+        for column, dtype in values.dtypes.items():
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                values[column] = values[column].dt.strftime(self.date_format)
+            elif dtype == np.uint64:
+                values[column] = values[column].view(np.int64)
+            elif pd.api.types.is_bool_dtype(dtype):
+                values[column] = values[column].astype(np.int64)
+        values = values.astype(object).where(values.notna(), None)
+        with closing(self.connect()) as connection, connection:
+            # one write transaction including the schema changes, other processes wait for the lock of the database
+            connection.execute("BEGIN IMMEDIATE")
+            self.__create_tables(connection, measurements_df)
+            connection.execute("DELETE FROM {} WHERE {} = ?".format(self.table, self.location_column), (sample_location,))
+            connection.execute("DELETE FROM column_types WHERE location = ?", (sample_location,))
+            connection.executemany("INSERT INTO column_types (location, position, name, dtype) VALUES (?, ?, ?, ?)",
+                                   [(sample_location, i, c, str(t)) for i, (c, t) in enumerate(measurements_df.dtypes.items())])
+            columns = [self.location_column] + list(values.columns)
+            connection.executemany("INSERT INTO {} ({}) VALUES ({})".format(
+                self.table, ", ".join(self.__quote(c) for c in columns), ", ".join("?" * len(columns))),
+                ((sample_location,) + row for row in values.itertuples(index=False, name=None)))
+
+    def query_measurements(self, sample_locations: List[str] = None, start_date=None, end_date=None, flags=0,
+                           usable=None, columns: List[str] = None, summary=False) -> pd.DataFrame:
+        """
+        Measurements of all or the given sample locations.
+        :param flags: only measurements with any of these flags
+        :param usable: only usable (True) or not usable (False) measurements
+        :param summary: number of selected measurements and first and last collection date per sample location
+        """
+        filters = []
+        if start_date is not None:
+            filters.append((Columns.DATE, '>=', pd.Timestamp(start_date)))
+        if end_date is not None:
+            filters.append((Columns.DATE, '<=', pd.Timestamp(end_date)))
+        if usable is not None:
+            filters.append((CalculatedColumns.USABLE.value, '=', int(usable)))
+        where, parameters = self.__get_where_clause(sample_locations, filters)
+        if flags != 0:
+            where += (" AND " if where else " WHERE ") + "({} & ?) != 0".format(self.__quote(CalculatedColumns.FLAG.value))
+            parameters.append(int(flags))
+        if summary:
+            sql = "SELECT {location}, COUNT(*) AS measurements, MIN({date}) AS first_date, MAX({date}) AS last_date " \
+                  "FROM {table}{where} GROUP BY {location} ORDER BY {location}"
+            df = self.read_sql(sql.format(location=self.location_column, date=self.__quote(Columns.DATE),
+                                          table=self.table, where=where), parameters)
+            for column in ['first_date', 'last_date']:
+                df[column] = pd.to_datetime(df[column], format=self.date_format)
+            return df
+        if columns is None:
+            columns = [Columns.DATE, CalculatedColumns.USABLE.value, CalculatedColumns.FLAG.value]
+        selected = ", ".join(self.__quote(c) for c in [self.location_column] + columns)
+        return self.read_sql("SELECT {} FROM {}{} ORDER BY {}, {}".format(
+            selected, self.table, where, self.location_column, self.__quote(Columns.DATE)), parameters)
+
 
 class SewageDatabase:
 
-    def __init__(self):
-        home = str(Path.home())
-        self.output_folder = os.path.join(home, ".sewage_qc_normalization")
+    def __init__(self, database_path=None, backend='files', partition_by_year=False):
+        """
+        :param database_path: folder of the database, a hidden folder in the home directory if None
+        :param backend: 'files' for one parquet file per sample location, 'arrow' for one memory-mapped Arrow IPC
+                        file per sample location, 'partitioned' for one parquet dataset or 'sqlite' for one SQLite
+                        database
+        """
+        if database_path is None:
+            self.output_folder = get_default_database_folder()
+            if backend == 'partitioned':
+                self.output_folder = os.path.join(self.output_folder, "sewage_db")
+        else:
+            self.output_folder = database_path
         self.measurements_dict = dict()
         self.__create_folder()
+        if backend == 'files':
+            self.backend = LocationFilesBackend(self.output_folder)
+        elif backend == 'arrow':
+            self.backend = ArrowSnapshotBackend(self.output_folder)
+        elif backend == 'partitioned':
+            self.backend = PartitionedParquetBackend(self.output_folder, partition_by_year)
+        elif backend == 'sqlite':
+            self.backend = SqliteBackend(os.path.join(self.output_folder, "sewage_db.sqlite"))
+        else:
+            raise ValueError("Unknown database backend: {}".format(backend))
 
     def __create_folder(self):
         operatingSystem = system()
@@ -31,40 +620,69 @@ class SewageDatabase:
 
 
     def __load_db_for_location(self, sample_location):
-        sample_location = self.__get_sample_location_escaped(sample_location)
-        database_file = os.path.join(self.output_folder, ".{}_sewage_db.parquet".format(sample_location))
-        if os.path.exists(database_file):
-            table2 = pq.read_table(database_file)
-            loaded_df = table2.to_pandas()
+        loaded_df = self.backend.load(sample_location)
+        if loaded_df is not None:
             return loaded_df, True
         return None, False
 
-    def __get_sample_location_escaped(self, sample_location: str):
-        sample_location_escaped = sample_location.replace(" ", "_").replace("/", "_")
-        return sample_location_escaped
+    def read_measurements(self, sample_location, columns: List[str] = None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Reads the stored measurements of a sample location, only the given columns and collection dates are read.
+        :return: measurements or None if nothing is stored for the sample location
+        """
+        filters = []
+        if start_date is not None:
+            filters.append((Columns.DATE, '>=', pd.Timestamp(start_date)))
+        if end_date is not None:
+            filters.append((Columns.DATE, '<=', pd.Timestamp(end_date)))
+        return self.backend.load(sample_location, columns, filters if len(filters) > 0 else None)
+
+    def get_sample_locations(self) -> List[str]:
+        """
+        :return: sample locations stored in the database
+        """
+        return self.backend.get_sample_locations()
+
+    def query_measurements(self, *args, **kwargs) -> pd.DataFrame:
+        """
+        Queries across sample locations, see SqliteBackend.query_measurements
+        """
+        if not isinstance(self.backend, SqliteBackend):
+            raise ValueError("Queries require the database backend 'sqlite'")
+        return self.backend.query_measurements(*args, **kwargs)
 
     def add_sewage_location2db(self, sample_location, measurements_df: pd.DataFrame):
-        sample_location = self.__get_sample_location_escaped(sample_location)
         if CalculatedColumns.NEEDS_PROCESSING.value in measurements_df:
             measurements_df = measurements_df.drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value])
-        table = pa.Table.from_pandas(measurements_df)
-        pq.write_table(table, os.path.join(self.output_folder, ".{}_sewage_db.parquet".format(sample_location)))
-
-    def __get_checksum_for_row(self, row) -> []:
-        used_columns = [c.value for c in Columns]
-        used_row = row[used_columns]
-        series = []
-        if isinstance(used_row, pd.DataFrame):  # multiple entries with same date
-            for index, duplicate in used_row.iterrows():
-                series.append(duplicate)
-        else:
-            series.append(used_row)
-        checksums = []
-        for serie in series:
-            merged = ','.join([str(i) for i in serie.to_list()])
-            md5hash = hashlib.md5(merged.encode('utf-8')).hexdigest()
-            checksums.append(md5hash)
-        return checksums
+        # store the checksums with the measurements, thus they are never recomputed for stored data
+        measurements_df = measurements_df.assign(**{CHECKSUM_COLUMN: self.__get_checksums(measurements_df)})
+        self.backend.store(sample_location, measurements_df)
+
+    def __get_checksums(self, measurements_df: pd.DataFrame) -> np.ndarray:
+        """
+        Content hash of the input columns of each row. Numbers are hashed as float, thus a column read as integer
+        in one file and as float in another yields the same checksums.
+        """
+        used_columns = dict()
+        for column in Columns.get_input_columns():
+            if column in measurements_df:
+                values = measurements_df[column]
+                if pd.api.types.is_datetime64_any_dtype(values):
+                    used_columns[column] = values
+                elif pd.api.types.is_numeric_dtype(values):
+                    used_columns[column] = values.astype(np.float64)
+                else:
+                    used_columns[column] = values.astype(str)
+        used_df = pd.DataFrame(used_columns, index=measurements_df.index)
+        return pd.util.hash_pandas_object(used_df, index=False).to_numpy(dtype=np.uint64)
+
+    def __get_join_keys(self, measurements_df: pd.DataFrame, checksums: np.ndarray) -> pd.DataFrame:
+        """
+        Rows are identified by collection date and checksum. The occurrence counter matches duplicated rows one to one.
+        """
+        keys = pd.DataFrame({Columns.DATE: measurements_df[Columns.DATE].to_numpy(), CHECKSUM_COLUMN: checksums})
+        keys['occurrence'] = keys.groupby([Columns.DATE, CHECKSUM_COLUMN], sort=False, dropna=False).cumcount()
+        return keys
 
     def __set_dtypes(self, new_measurements):
         for c in CalculatedColumns:
@@ -78,33 +696,59 @@ class SewageDatabase:
             if column in new_measurements:
                 new_measurements[column] = new_measurements[column].astype(np.int)
 
-    def needs_recalcuation(self, sample_location, new_measurements: pd.DataFrame, rerun_all: bool):
+    def __get_previous_versions(self, new_keys: pd.DataFrame, stored_keys: pd.DataFrame, is_stored: np.ndarray,
+                                is_matched: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Pairs the changed measurements with the unmatched stored measurements of the same collection date.
+        Returns the positions of the changed rows, the positions of their stored versions and the collection dates
+        of the stored measurements that were removed from the input.
+        """
+        changed_keys = new_keys.loc[~is_stored, [Columns.DATE]]
+        changed_keys['position'] = np.flatnonzero(~is_stored)
+        unmatched_keys = stored_keys.loc[~is_matched, [Columns.DATE, 'stored_index']]
+        for keys in [changed_keys, unmatched_keys]:
+            keys['occurrence'] = keys.groupby(Columns.DATE, sort=False, dropna=False).cumcount()
+        paired = changed_keys.merge(unmatched_keys, how='outer', on=[Columns.DATE, 'occurrence'], sort=False)
+        is_paired = paired['position'].notna() & paired['stored_index'].notna()
+        removed_dates = paired.loc[paired['position'].isna(), Columns.DATE].to_numpy(dtype='datetime64[ns]')
+        return paired.loc[is_paired, 'position'].to_numpy(dtype=np.int64), \
+            paired.loc[is_paired, 'stored_index'].to_numpy(dtype=np.int64), np.unique(removed_dates)
+
+    def needs_recalcuation(self, sample_location, new_measurements: pd.DataFrame, rerun_all: bool) -> (pd.DataFrame, np.ndarray):
+        """
+        Sets NEEDS_PROCESSING for the new and changed measurements and takes over the results of the unchanged ones.
+        Returns the stored versions of the changed measurements (indexed like new_measurements) and the collection
+        dates of the stored measurements that are no longer part of the input. Both are None if nothing was loaded.
+        """
         if rerun_all:
             new_measurements[CalculatedColumns.NEEDS_PROCESSING.value] = True
         else:
             db_measurements, is_loaded = self.__load_db_for_location(sample_location)
             if is_loaded:
-                indices = []
-                for index, row in new_measurements.iterrows():
-                    needs_recalculation = True
-                    db_row = db_measurements[db_measurements[Columns.DATE] == row[Columns.DATE]]
-                    if db_row.shape[0] > 0:
-                        stored_checksums_list = self.__get_checksum_for_row(db_row.squeeze())
-                        new_checksum = self.__get_checksum_for_row(row)[0]
-                        found = False
-                        for stored_checksum in stored_checksums_list:
-                            if stored_checksum == new_checksum and not found:
-                                found = True
-                                needs_recalculation = False
-                                indices.append(db_row.index.tolist()[0])
-                    new_measurements.at[index, CalculatedColumns.NEEDS_PROCESSING.value] = needs_recalculation
-                update_df = db_measurements.iloc[indices]
-                new_measurements.set_index(Columns.DATE, inplace=True)
-                new_measurements.update(update_df.set_index(Columns.DATE))
-                new_measurements.reset_index(inplace=True)
+                if CHECKSUM_COLUMN in db_measurements:
+                    stored_checksums = db_measurements[CHECKSUM_COLUMN].to_numpy(dtype=np.uint64)
+                else:  # database written by an older version
+                    stored_checksums = self.__get_checksums(db_measurements)
+                new_keys = self.__get_join_keys(new_measurements, self.__get_checksums(new_measurements))
+                stored_keys = self.__get_join_keys(db_measurements, stored_checksums)
+                stored_keys['stored_index'] = np.arange(db_measurements.shape[0])
+                joined = new_keys.merge(stored_keys, how='left', on=[Columns.DATE, CHECKSUM_COLUMN, 'occurrence'],
+                                        sort=False)
+                is_stored = joined['stored_index'].notna().to_numpy()
+                matched_indices = joined.loc[is_stored, 'stored_index'].to_numpy(dtype=np.int64)
+                is_matched = np.zeros(db_measurements.shape[0], dtype=bool)
+                is_matched[matched_indices] = True
+                # take over the results of the unchanged rows
+                update_df = db_measurements.iloc[matched_indices]
+                update_df.index = new_measurements.index[is_stored]
+                new_measurements.update(update_df)
+                new_measurements[CalculatedColumns.NEEDS_PROCESSING.value] = ~is_stored
                 self.__set_dtypes(new_measurements)
+                changed_positions, previous_indices, removed_dates = self.__get_previous_versions(new_keys, stored_keys,
+                                                                                                 is_stored, is_matched)
+                previous_measurements = db_measurements.iloc[previous_indices]
+                previous_measurements.index = new_measurements.index[changed_positions]
+                return previous_measurements, removed_dates
             else:
                 new_measurements[CalculatedColumns.NEEDS_PROCESSING.value] = True
-
-
-
+        return None, None
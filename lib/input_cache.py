@@ -0,0 +1,161 @@
+# Created by alex at 18.10.26
+import os
+import re
+import json
+import hashlib
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .utils import *
+
+# changes of the parsing invalidate all cached sheets
+INPUT_CACHE_VERSION = 1
+
+_SPREADSHEET_NAMESPACE = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_RELATIONSHIP_NAMESPACE = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_RELATIONSHIP_NAMESPACE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_shared_string_cell_pattern = re.compile(rb'<c\b([^>]*)>\s*<v>(\d+)</v>')
+_shared_string_pattern = re.compile(rb'<si\b[^>]*?(?:/>|>(.*?)</si>)', re.DOTALL)
+
+
+def get_file_checksum(input_file: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(input_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_sheet_checksums(input_file: str) -> dict:
+    """
+    Content hash of each sheet of an xlsx workbook, computed from the raw XML of the sheet without parsing the cells.
+    Besides the sheet, the hash covers the shared strings used by the sheet and the cell styles, which define the
+    number formats of dates. Thus, editing one sheet does not change the hashes of the other sheets.
+    :return: sheet name to checksum in the order of the workbook
+    """
+    with zipfile.ZipFile(input_file) as workbook:
+        names = set(workbook.namelist())
+        workbook_xml = ET.fromstring(workbook.read("xl/workbook.xml"))
+        relationships = ET.fromstring(workbook.read("xl/_rels/workbook.xml.rels"))
+        targets = {r.get("Id"): r.get("Target") for r in relationships.iter(_PACKAGE_RELATIONSHIP_NAMESPACE + "Relationship")}
+        common = hashlib.sha256()
+        common.update(str(INPUT_CACHE_VERSION).encode())
+        common.update(json.dumps(column_map).encode())
+        workbook_properties = workbook_xml.find(_SPREADSHEET_NAMESPACE + "workbookPr")
+        common.update(str(workbook_properties is not None and workbook_properties.get("date1904")).encode())
+        if "xl/styles.xml" in names:
+            common.update(workbook.read("xl/styles.xml"))
+        shared_strings = None
+        if "xl/sharedStrings.xml" in names:
+            shared_strings = _shared_string_pattern.findall(workbook.read("xl/sharedStrings.xml"))
+        sheet_checksums = dict()
+        for sheet in workbook_xml.iter(_SPREADSHEET_NAMESPACE + "sheet"):
+            target = targets[sheet.get(_RELATIONSHIP_NAMESPACE + "id")]
+            path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+            sheet_xml = workbook.read(path)
+            sha256 = common.copy()
+            sha256.update(sheet_xml)
+            if shared_strings is not None:
+                for attributes, string_index in _shared_string_cell_pattern.findall(sheet_xml):
+                    if b't="s"' in attributes:
+                        sha256.update(shared_strings[int(string_index)] or b'')
+            sheet_checksums[sheet.get("name")] = sha256.hexdigest()
+    return sheet_checksums
+
+
+class InputCache:
+    """
+    Cache of the parsed sheets of input workbooks in the output folder. Each sheet is stored as parquet file named by
+    the content hash of the sheet, thus only new or modified sheets are parsed again. The sheet hashes of a workbook
+    are stored by the hash of the whole file, an unchanged workbook is thus loaded without opening it.
+    Sheets and workbooks not used by the last run are removed from the cache. The files are replaced atomically, cached files
+    that cannot be read (e.g. truncated by a killed run) are parsed again and overwritten.
+    """
+
+    def __init__(self, output_folder):
+        self.cache_folder = os.path.join(output_folder, ".input_cache")
+        self.hits = 0
+        self.misses = 0
+
+    def __get_sheet_file(self, checksum):
+        return os.path.join(self.cache_folder, "{}.parquet".format(checksum))
+
+    def __get_workbook_file(self, checksum):
+        return os.path.join(self.cache_folder, "{}.json".format(checksum))
+
+    def __get_sheet_checksums(self, input_file, file_checksum, engine) -> dict:
+        workbook_file = self.__get_workbook_file(file_checksum)
+        if os.path.exists(workbook_file):
+            try:
+                with open(workbook_file) as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+        sheet_checksums = {sheet: "{}_{}".format(engine, checksum) for sheet, checksum in get_sheet_checksums(input_file).items()}
+
+        def write_workbook(temporary_file):
+            with open(temporary_file, 'w') as f:
+                json.dump(sheet_checksums, f)
+        write_atomic(workbook_file, write_workbook)
+        return sheet_checksums
+
+    def __read_sheet(self, checksum):
+        """
+        :return: the cached sheet or None if it cannot be read
+        """
+        try:
+            return pq.read_table(self.__get_sheet_file(checksum)).to_pandas()
+        except (pa.ArrowInvalid, OSError):
+            return None
+
+    def __store(self, checksum, measurements: pd.DataFrame) -> None:
+        try:
+            table = pa.Table.from_pandas(measurements)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # e.g. columns with numbers and texts, the sheet is parsed again the next time
+            return
+        write_table_atomic(table, self.__get_sheet_file(checksum))
+
+    def __remove_unused(self, file_checksum, sheet_checksums) -> None:
+        used = {os.path.basename(self.__get_workbook_file(file_checksum))}
+        used.update(os.path.basename(self.__get_sheet_file(checksum)) for checksum in sheet_checksums.values())
+        for name in os.listdir(self.cache_folder):
+            if name not in used:
+                os.remove(os.path.join(self.cache_folder, name))
+
+    def iter_excel_input_files(self, input_file: str, engine='openpyxl'):
+        """
+        Same as utils.iter_excel_input_files, but only the sheets missing in the cache are parsed.
+        Workbooks in other formats than xlsx are parsed completely.
+        """
+        if not zipfile.is_zipfile(input_file):
+            yield from iter_excel_input_files(input_file, engine)
+            return
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+        file_checksum = "{}_{}".format(engine, get_file_checksum(input_file))
+        sheet_checksums = self.__get_sheet_checksums(input_file, file_checksum, engine)
+        missing_sheets = [sheet for sheet, checksum in sheet_checksums.items()
+                          if not os.path.exists(self.__get_sheet_file(checksum))]
+        # the missing sheets are parsed in the order of the workbook when they are reached
+        parsed_sheets = iter_excel_input_files(input_file, engine, missing_sheets)
+        for sheet, checksum in sheet_checksums.items():
+            if sheet in missing_sheets:
+                _, measurements = next(parsed_sheets)
+            else:
+                measurements = self.__read_sheet(checksum)
+                if measurements is not None:
+                    self.hits += 1
+                    yield sheet, measurements
+                    continue
+                # the cached sheet cannot be read, it is parsed again and overwritten
+                _, measurements = next(iter_excel_input_files(input_file, engine, [sheet]))
+            self.__store(checksum, measurements)
+            self.misses += 1
+            yield sheet, measurements
+        self.__remove_unused(file_checksum, sheet_checksums)
+
+    def read_excel_input_files(self, input_file: str, engine='openpyxl') -> dict:
+        return dict(self.iter_excel_input_files(input_file, engine))
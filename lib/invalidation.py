@@ -0,0 +1,154 @@
+# Created by alex at 18.10.26
+import bisect
+import itertools
+from .utils import *
+
+
+class InvalidationPlanner:
+    """
+    Decides which measurements of a sample location are processed when only some of them were added or changed.
+    Besides the new and changed measurements, a measurement is processed again if one of the stages looks back on a
+    previous measurement whose values read by that stage have changed:
+
+        biomarker ratios:   last N measurements       biomarker values, ratios and ratio outlier flags
+        surrogatevirus:     last N month              surrogatevirus values, dry day and outlier flags
+        sewage flow:        all previous measurements mean sewage flow, precipitation, typo and missing flow flags
+        water quality:      last N month              ammonium and conductivity values and outlier flags
+        normalization:      last N days               normalized biomarker values and reproduction number outliers
+
+    The measurements are processed in order of the collection date, thus the results of a processed measurement are
+    compared to its previous results before the later measurements are checked. A measurement that was processed
+    again without any change of these values does not invalidate further measurements.
+    If stored measurements were removed from the input, all measurements from the date of the first removed one on
+    are processed again.
+    """
+
+    def __init__(self, biomarkerQC, surrogateQC, sewage_flow, water_quality, sewageNormalization):
+        self.window_index = biomarkerQC.window_index
+        biomarkers = Columns.get_biomarker_columns()
+        biomarker_pairs = list(itertools.combinations(biomarkers, 2))
+        flag_column = CalculatedColumns.FLAG.value
+        # name: (window, window parameters, [(column, flags to compare or None for the value)])
+        self.dependencies = {
+            'biomarker_ratios': ('count', (biomarkerQC.max_number_biomarkers_for_outlier_detection,),
+                                 [(b, None) for b in biomarkers] +
+                                 [(b1 + "/" + b2, None) for b1, b2 in biomarker_pairs] +
+                                 [(CalculatedColumns.get_biomaker_ratio_flag(b1, b2), SewageFlag.BIOMARKER_RATIO_OUTLIER.value)
+                                  for b1, b2 in biomarker_pairs]),
+            'surrogatevirus': ('calendar', (surrogateQC.periode_month_surrogatevirus, 0, False),
+                               [(s, None) for s in Columns.get_surrogatevirus_columns()] +
+                               [(flag_column, SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE.value |
+                                 SewageFlag.SURROGATEVIRUS_OUTLIER_PMMOV.value |
+                                 SewageFlag.SURROGATEVIRUS_OUTLIER_CRASSPHAGE.value)]),
+            'sewage_flow': ('history', (),
+                            [(Columns.MEAN_SEWAGE_FLOW, None),
+                             (flag_column, SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION.value |
+                              SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value | SewageFlag.MISSING_MEAN_SEWAGE_FLOW.value)]),
+            'water_quality': ('calendar', (water_quality.water_quality_number_of_last_month, 0, True),
+                              [(Columns.AMMONIUM, None), (Columns.CONDUCTIVITY, None),
+                               (flag_column, SewageFlag.AMMONIUM_OUTLIER.value | SewageFlag.CONDUCTIVITY_OUTLIER.value)]),
+            'normalization': ('calendar', (0, sewageNormalization.num_previous_days_reproduction_factor, True),
+                              [(CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value, None),
+                               (flag_column, SewageFlag.REPRODUCTION_NUMBER_OUTLIER.value)])
+        }
+        self.columns = list(dict.fromkeys(column for _, _, columns in self.dependencies.values() for column, _ in columns))
+        self.is_active = False
+        self.needs_processing_flags = None
+        self.is_dependent_flags = None
+
+    def __getstate__(self):
+        # the plan is made for each sample location, don't ship it to worker processes
+        state = self.__dict__.copy()
+        for name in ['needs_processing_flags', 'is_dependent_flags', 'has_previous', 'previous_values', 'dirty']:
+            state.pop(name, None)
+        state['is_active'] = False
+        return state
+
+    def plan(self, measurements: pd.DataFrame, previous_measurements: pd.DataFrame = None,
+             removed_dates: np.ndarray = None) -> 'InvalidationPlanner':
+        """
+        :param measurements: measurements of a sample location sorted by collection date, NEEDS_PROCESSING is set for
+                             the new and changed ones, the others hold the stored results
+        :param previous_measurements: stored versions of the changed measurements, indexed like measurements.
+                                      If None, only the measurements with NEEDS_PROCESSING are processed
+        :param removed_dates: collection dates of stored measurements that are no longer part of the input
+        """
+        self.window_index.get(measurements)
+        self.needs_processing_flags = measurements[CalculatedColumns.NEEDS_PROCESSING.value].to_numpy(dtype=bool, copy=True)
+        self.is_dependent_flags = np.zeros(measurements.shape[0], dtype=bool)
+        self.is_active = previous_measurements is not None
+        if not self.is_active:
+            return self
+        # values of the previous run: stored results of the unchanged measurements, stored versions of the changed ones
+        positions = measurements.index.get_indexer(previous_measurements.index)
+        self.has_previous = ~self.needs_processing_flags
+        self.has_previous[positions] = True
+        self.previous_values = dict()
+        for column in self.columns:
+            values = measurements[column].to_numpy(copy=True)
+            if column in previous_measurements:
+                values[positions] = previous_measurements[column].to_numpy()
+            else:
+                self.has_previous[positions] = False
+            self.previous_values[column] = values
+        self.dirty = {name: [] for name in self.dependencies}
+        self.first_removed_index = measurements.shape[0]
+        if removed_dates is not None and len(removed_dates) > 0:
+            first_removed_date = np.min(np.asarray(removed_dates, dtype='datetime64[ns]'))
+            self.first_removed_index = int(np.searchsorted(self.window_index.dates, first_removed_date, side='left'))
+        return self
+
+    def __get_window(self, window, parameters, index) -> (int, int):
+        if window == 'count':
+            return self.window_index.count_window(index, *parameters)
+        elif window == 'calendar':
+            return self.window_index.calendar_window(index, *parameters)
+        return self.window_index.history_window(index)
+
+    def needs_processing(self, index) -> bool:
+        if self.needs_processing_flags[index]:
+            return True
+        if not self.is_active:
+            return False
+        is_dependent = index >= self.first_removed_index
+        for name, (window, parameters, _) in self.dependencies.items():
+            if is_dependent:
+                break
+            start, end = self.__get_window(window, parameters, index)
+            dirty = self.dirty[name]
+            position = bisect.bisect_left(dirty, start)
+            is_dependent = position < len(dirty) and dirty[position] < end
+        if is_dependent:
+            self.needs_processing_flags[index] = True
+            self.is_dependent_flags[index] = True
+        return is_dependent
+
+    def is_dependent(self, index) -> bool:
+        """
+        True if the measurement itself is unchanged but is processed again due to a changed previous measurement.
+        Its stored results have to be reset before.
+        """
+        return self.is_dependent_flags[index]
+
+    def get_num_dependent(self) -> int:
+        return int(np.sum(self.is_dependent_flags))
+
+    def set_processed(self, index, results) -> None:
+        """
+        Compares the results of a processed measurement with the previous ones.
+        :param results: row or mapping with the values of the processed measurement
+        """
+        if not self.is_active:
+            return
+        for name, (_, _, columns) in self.dependencies.items():
+            is_changed = not self.has_previous[index]
+            for column, flags in columns:
+                if is_changed:
+                    break
+                previous_value, value = self.previous_values[column][index], results[column]
+                if flags is not None:
+                    is_changed = (int(previous_value) & flags) != (int(value) & flags)
+                else:
+                    is_changed = not (previous_value == value or (pd.isna(previous_value) and pd.isna(value)))
+            if is_changed:
+                self.dirty[name].append(index)
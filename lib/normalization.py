@@ -3,7 +3,6 @@ import pandas as pd
 import math
 from .utils import *
 from .statistics import *
-from .plotting import *
 
 
 class SewageNormalization:
@@ -11,13 +10,14 @@ class SewageNormalization:
                  min_number_of_biomarkers_for_normalization: int,
                  base_reproduction_value_factor: float,
                  num_previous_days_reproduction_factor: int,
-                 output_folder: str):
+                 output_folder: str, window_index: WindowIndex = None):
         self.sewageStat = sewageStat
         self.max_number_of_flags_for_outlier = max_number_of_flags_for_outlier
         self.min_number_of_biomarkers_for_normalization = min_number_of_biomarkers_for_normalization
         self.base_reproduction_value_factor = base_reproduction_value_factor
         self.num_previous_days_reproduction_factor = num_previous_days_reproduction_factor
         self.output_folder = output_folder
+        self.window_index = window_index if window_index else WindowIndex()
         self.logger = SewageLogger(self.output_folder)
 
     def __get_usable_biomarkers(self, current_measurement: pd.Series) -> []:
@@ -46,9 +46,10 @@ class SewageNormalization:
 
     def __detect_basic_reproduction_number_outliers(self, sample_location: str, measurements_df: pd.DataFrame, index) -> None:
         current_measurement = measurements_df.iloc[index]
-        last_values_one_week = get_last_N_month_and_days(measurements_df, current_measurement, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value,
+        last_values_one_week = get_last_N_month_and_days(measurements_df, index, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value,
                                                          num_month=0, num_days=self.num_previous_days_reproduction_factor,
-                                                         sewage_flag=SewageFlag.REPRODUCTION_NUMBER_OUTLIER)
+                                                         sewage_flag=SewageFlag.REPRODUCTION_NUMBER_OUTLIER,
+                                                         window_index=self.window_index)
        # last_values_one_month = get_last_N_month_and_days(measurements_df, current_measurement, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS,
        #                                                  num_month=1, num_days=0,
        #                                                  sewage_flag=SewageFlag.REPRODUCTION_NUMBER_OUTLIER)
@@ -0,0 +1,99 @@
+# Created by alex at 18.10.26
+import os
+import json
+import pickle
+import hashlib
+import urllib.parse
+from .utils import *
+
+# changes of the drawing of the figures invalidate all cached figures
+PLOT_CACHE_VERSION = 1
+
+
+class PlotCache:
+    """
+    Cache of the drawn figures of a sample location in the folder .plot_cache of the plots. Each figure is stored as
+    pickled matplotlib figure named by the content hash of its plot frame and drawing arguments, thus only the figures
+    whose data changed are drawn again, including the time consuming layout of their labels.
+    The file pages.json lists the figures of the current plot file, the plot file is not written again if no figure
+    changed. Figures not used by the current plot file are removed from the cache.
+    With redraw, all figures are drawn again and replace the cached ones.
+    """
+
+    def __init__(self, plots_folder, sample_location, redraw=False):
+        self.cache_folder = os.path.join(plots_folder, ".plot_cache", urllib.parse.quote(sample_location, safe=''))
+        self.redraw = redraw
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_checksum(name, plot_frame: pd.DataFrame, arguments) -> str:
+        # only loaded if plots are generated
+        import matplotlib
+        import seaborn
+        sha256 = hashlib.sha256()
+        sha256.update(json.dumps([PLOT_CACHE_VERSION, matplotlib.__version__, seaborn.__version__, name,
+                                  [str(a) for a in arguments]]).encode())
+        sha256.update(json.dumps([[str(c), str(t)] for c, t in plot_frame.dtypes.items()]).encode())
+        sha256.update(pd.util.hash_pandas_object(plot_frame, index=False).to_numpy().tobytes())
+        return "{}-{}".format(name, sha256.hexdigest())
+
+    def __get_figure_file(self, checksum):
+        return os.path.join(self.cache_folder, "{}.pickle".format(checksum))
+
+    def __get_pages_file(self):
+        return os.path.join(self.cache_folder, "pages.json")
+
+    def is_unchanged(self, checksums: List[str]) -> bool:
+        """
+        True if the plot file consists of these figures
+        """
+        if self.redraw or not os.path.exists(self.__get_pages_file()):
+            return False
+        with open(self.__get_pages_file()) as f:
+            return json.load(f) == checksums
+
+    def get_figure(self, checksum, draw_function, plot_frame: pd.DataFrame, arguments):
+        """
+        Loads the figure from the cache or draws it with draw_function(plot_frame, *arguments) and stores it
+        """
+        figure_file = self.__get_figure_file(checksum)
+        if not self.redraw and os.path.exists(figure_file):
+            with open(figure_file, 'rb') as f:
+                figure = pickle.load(f)
+            self.hits += 1
+            return figure
+        figure = draw_function(plot_frame, *arguments)
+        self.misses += 1
+        try:
+            content = pickle.dumps(figure)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # e.g. artists of other libraries, the figure is drawn again the next time
+            return figure
+        self.__write(figure_file, content)
+        return figure
+
+    def __write(self, path, content: bytes) -> None:
+        def write_content(temporary_file):
+            with open(temporary_file, 'wb') as f:
+                f.write(content)
+        os.makedirs(self.cache_folder, exist_ok=True)
+        write_atomic(path, write_content)
+
+    def remove_pages(self) -> None:
+        """
+        Call before the plot file is written, thus a failed writing is never taken as unchanged plot file
+        """
+        if os.path.exists(self.__get_pages_file()):
+            os.remove(self.__get_pages_file())
+
+    def set_pages(self, checksums: List[str]) -> None:
+        """
+        Stores the figures of the written plot file and removes the other figures of the sample location
+        """
+        self.__write(self.__get_pages_file(), json.dumps(checksums).encode())
+        used = {os.path.basename(self.__get_figure_file(checksum)) for checksum in checksums}
+        used.add(os.path.basename(self.__get_pages_file()))
+        for name in os.listdir(self.cache_folder):
+            if name not in used:
+                os.remove(os.path.join(self.cache_folder, name))
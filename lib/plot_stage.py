@@ -0,0 +1,146 @@
+# Created by alex at 18.10.26
+import os
+from concurrent.futures import ProcessPoolExecutor
+from . import database as db
+from .plot_cache import PlotCache
+from .utils import *
+
+
+def get_plot_file(output_folder, sample_location) -> str:
+    return os.path.join(output_folder, "plots", "{}.plots.pdf".format(sample_location.replace("/", "_")))
+
+
+def is_plot_generated(output_folder, sample_location) -> bool:
+    return os.path.exists(get_plot_file(output_folder, sample_location))
+
+
+def render_plots(output_folder, sample_location, measurements: pd.DataFrame, biomarker_outlier_statistics,
+                 surrogatevirus_outlier_statistics, water_qc_outlier_statistics, use_cache=True, fast=False) -> str:
+    """
+    Renders the plots of a sample location into one pdf file with the non-interactive Agg backend.
+    The pdf file is replaced only after all plots were rendered, thus a failed or killed rendering never leaves a
+    truncated file behind and the plots are rendered again in the next run.
+    Figures whose plot frame did not change are loaded from the plot cache instead of being drawn again, see PlotCache.
+    :param use_cache: False draws all figures again
+    :param fast: fast plotting mode for long time series, see plotting.get_figures
+    :return: the pdf file
+    """
+    # matplotlib and seaborn are only loaded if plots are generated
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    from . import plotting
+
+    plot_file = get_plot_file(output_folder, sample_location)
+    plot_cache = PlotCache(os.path.dirname(plot_file), sample_location, redraw=not use_cache)
+    figures = []
+    for name, get_plot_frame, draw_function, arguments in plotting.get_figures(biomarker_outlier_statistics,
+                                                                               surrogatevirus_outlier_statistics,
+                                                                               water_qc_outlier_statistics, fast):
+        plot_frame = get_plot_frame(measurements)
+        arguments = (sample_location,) + arguments
+        figures.append((plot_cache.get_checksum(name, plot_frame, arguments), draw_function, plot_frame, arguments))
+    checksums = [checksum for checksum, _, _, _ in figures]
+    if os.path.exists(plot_file) and plot_cache.is_unchanged(checksums):
+        return plot_file
+
+    def write_plots(temporary_file):
+        with PdfPages(temporary_file) as pdf_pages:
+            for checksum, draw_function, plot_frame, arguments in figures:
+                plotting.save_figure(pdf_pages, plot_cache.get_figure(checksum, draw_function, plot_frame, arguments))
+
+    os.makedirs(os.path.dirname(plot_file), exist_ok=True)
+    remove_temporary_files(plot_file)
+    plot_cache.remove_pages()
+    try:
+        write_atomic(plot_file, write_plots)
+    finally:
+        plt.close('all')
+    plot_cache.set_pages(checksums)
+    return plot_file
+
+
+class PlotStage:
+    """
+    Renders the plots of the sample locations from the results stored in the database. Sample locations are submitted
+    after their results were written, thus the plots never delay the database and the excel files.
+    With jobs > 0 the plots are rendered by a separate process pool of this size while the quality control of the next
+    sample locations continues, with jobs = 0 in the calling process on submit.
+    Failed plots are logged and do not stop the run, they are missing in the plots folder and rendered in the next run.
+    The plots show the stored measurements between start_date and end_date, all if None. Without use_cache, all
+    figures are drawn again instead of loading the unchanged ones from the plot cache. With fast, the figures are
+    drawn in the fast plotting mode for long time series.
+    """
+
+    def __init__(self, output_folder, logger: SewageLogger, database_path=None, database_backend='files',
+                 partition_by_year=False, biomarker_outlier_statistics=None, surrogatevirus_outlier_statistics=None,
+                 water_qc_outlier_statistics=None, jobs=1, start_date=None, end_date=None,
+                 use_cache=True, fast=False):
+        self.output_folder = output_folder
+        self.logger = logger
+        self.database_arguments = (database_path, database_backend, partition_by_year)
+        self.outlier_statistics = (biomarker_outlier_statistics, surrogatevirus_outlier_statistics,
+                                   water_qc_outlier_statistics)
+        self.date_range = (start_date, end_date)
+        self.render_options = (use_cache, fast)
+        self.jobs = jobs
+        self.executor = None
+        self.futures = dict()
+        self.num_rendered = 0
+        self.num_failed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(wait=exc_type is None)
+
+    def submit(self, sample_location) -> None:
+        if self.jobs == 0:
+            self.__collect(sample_location, lambda: _render_stored_plots(sample_location, self.output_folder,
+                                                                         self.database_arguments, self.date_range,
+                                                                         self.outlier_statistics, self.render_options))
+            return
+        if self.executor is None:
+            # the pool is started with the first plot, thus runs without changes start no processes
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        future = self.executor.submit(_render_stored_plots, sample_location, self.output_folder,
+                                      self.database_arguments, self.date_range, self.outlier_statistics,
+                                      self.render_options)
+        self.futures[future] = sample_location
+        for finished in [f for f in self.futures if f.done()]:
+            self.__collect(self.futures.pop(finished), finished.result)
+
+    def close(self, wait=True) -> None:
+        """
+        Waits for the submitted plots and shuts the process pool down. Without waiting, pending plots are cancelled.
+        """
+        if self.executor is not None:
+            if wait:
+                for future, sample_location in self.futures.items():
+                    self.__collect(sample_location, future.result)
+            self.futures.clear()
+            self.executor.shutdown(wait=wait, cancel_futures=not wait)
+            self.executor = None
+        if self.num_rendered + self.num_failed > 0:
+            self.logger.log.debug("Plots of {} sample locations rendered, {} failed".format(self.num_rendered,
+                                                                                            self.num_failed))
+
+    def __collect(self, sample_location, get_result) -> None:
+        try:
+            plot_file = get_result()
+        except Exception as e:
+            self.num_failed += 1
+            self.logger.log.error("Plots of '{}' could not be rendered: {}".format(sample_location, repr(e)))
+            return
+        self.num_rendered += 1
+        self.logger.log.debug("Plots of '{}' written to {}".format(sample_location, plot_file))
+
+
+def _render_stored_plots(sample_location, output_folder, database_arguments, date_range, outlier_statistics,
+                         render_options) -> str:
+    measurements = db.SewageDatabase(*database_arguments).read_measurements(sample_location, None, *date_range)
+    if measurements is None or measurements.shape[0] == 0:
+        raise ValueError("No results of '{}' stored in the database".format(sample_location))
+    return render_plots(output_folder, sample_location, measurements, *outlier_statistics, *render_options)
@@ -11,6 +11,10 @@ from .constant import *
 sns.set_style('darkgrid')
 sns.set_context("talk")
 
+# fast mode: labels per axis and inliers per facet
+max_fast_labels = 30
+max_fast_inliers = 500
+
 
 def get_label_colors():
     colors = {'inlier': '#1f77b4',
@@ -21,179 +25,326 @@ def get_label_colors():
     return colors
 
 
+def get_date_labels(plot_frame, select_column) -> list:
+    """
+    :return: (date, value, text) of each row of the plot frame
+    """
+    return list(zip(plot_frame['date'], plot_frame[select_column], plot_frame['date'].dt.strftime("%Y-%m-%d")))
+
+
+def cluster_date_labels(labels: list, max_labels=max_fast_labels) -> list:
+    """
+    Fast mode: merges the labels of outliers close in time into one label per cluster, thus at most max_labels labels
+    remain. The clusters are split at the largest gaps between the dates. A cluster is labeled with its first date and
+    the number of further outliers at its largest value.
+    """
+    if len(labels) <= max_labels:
+        return labels
+    labels = sorted(labels, key=lambda label: label[0])
+    dates = np.array([label[0].to_datetime64() for label in labels], dtype='datetime64[ns]').astype(np.int64)
+    values = np.array([label[1] for label in labels], dtype=np.float64)
+    splits = np.sort(np.argsort(np.diff(dates), kind='stable')[-(max_labels - 1):] + 1)
+    clustered = []
+    for cluster in np.split(np.arange(len(labels)), splits):
+        largest = cluster[np.argmax(np.nan_to_num(values[cluster], nan=-np.inf))]
+        text = labels[cluster[0]][2] if len(cluster) == 1 else "{} +{}".format(labels[cluster[0]][2], len(cluster) - 1)
+        clustered.append((labels[largest][0], labels[largest][1], text))
+    return clustered
+
+
+def add_date_labels(ax, labels: list, fast=False) -> list:
+    if fast:
+        labels = cluster_date_labels(labels)
+    return [ax.text(date, value, text, size='xx-small', color='black', horizontalalignment='right', rotation=0)
+            for date, value, text in labels]
+
+
 def get_date_outlier_labels_flags(plot_frame, filter_column, filter_value, outlier_column, sewageFlag: SewageFlag, select_column):
-    labels = []
     plot_frame = plot_frame[plot_frame[filter_column] == filter_value]
-    for index, current_row in plot_frame.iterrows():
-        if SewageFlag.is_flag(current_row[outlier_column], sewageFlag):
-            date = current_row['date'].strftime("%Y-%m-%d")
-            t = (current_row['date'], current_row[select_column], date)
-            labels.append(t)
-    return labels
+    return get_date_labels(plot_frame[SewageFlag.is_flag_set_for_series(plot_frame[outlier_column], sewageFlag)], select_column)
 
 
 def get_date_outlier_labels_value(plot_frame, filter_column, filter_value, outlier_column, outlier_value, select_column):
-    labels = []
     plot_frame = plot_frame[plot_frame[filter_column] == filter_value]
-    for index, current_row in plot_frame.iterrows():
-        if current_row[outlier_column] == outlier_value:
-            date = current_row['date'].strftime("%Y-%m-%d")
-            t = (current_row['date'], current_row[select_column], date)
-            labels.append(t)
-    return labels
-
-
-def get_general_outlier_date_labels(plot_frame, outlier_col='outlier'):
-    labels = []
-    for index, current_row in plot_frame.iterrows():
-        if current_row[outlier_col] != "":
-            date = current_row['date'].strftime("%Y-%m-%d")
-            t = plt.text(current_row['date'], current_row['value'], date, size='xx-small', color='black', horizontalalignment='right', rotation=0)
-            labels.append(t)
-    return labels
-
-def get_date_outlier_labels_by_value(plot_frame, outlier_col='outlier', value='outlier'):
-    labels = []
-    for index, current_row in plot_frame.iterrows():
-        if current_row[outlier_col] == value:
-            date = current_row['date'].strftime("%Y-%m-%d")
-            t = plt.text(current_row['date'], current_row['value'], date, size='xx-small', color='black', horizontalalignment='right', rotation=0)
-            labels.append(t)
-    return labels
-
-
-def __add_outlier_date_labels2ax(g, labels_dict: dict):
+    return get_date_labels(plot_frame[plot_frame[outlier_column] == outlier_value], select_column)
+
+
+def get_general_outlier_date_labels(plot_frame, outlier_col='outlier', fast=False):
+    return add_date_labels(plt.gca(), get_date_labels(plot_frame[plot_frame[outlier_col] != ""], 'value'), fast)
+
+
+def get_date_outlier_labels_by_value(plot_frame, outlier_col='outlier', value='outlier', fast=False):
+    return add_date_labels(plt.gca(), get_date_labels(plot_frame[plot_frame[outlier_col] == value], 'value'), fast)
+
+
+def __add_outlier_date_labels2ax(g, labels_dict: dict, fast=False):
     for biomarker_ratio, ax in g.axes_dict.items():
-        texts = []
-        for tuples in labels_dict[biomarker_ratio]:
-            t = ax.text(tuples[0], tuples[1], tuples[2], size='xx-small', color='black', horizontalalignment='right', rotation=0)
-            texts.append(t)
-        adjust_text(texts, ax=ax, arrowprops=dict(arrowstyle='-', color='red'))
+        texts = add_date_labels(ax, labels_dict[biomarker_ratio], fast)
+        if not fast:
+            adjust_text(texts, ax=ax, arrowprops=dict(arrowstyle='-', color='red'))
 
-def plot_biomarker_outlier_summary(pdf_plotter, measurements_df, sample_location, outlier_detection_methods):
-    plot_frame = pd.DataFrame()
+
+def downsample_lttb(x: np.ndarray, y: np.ndarray, num_points) -> np.ndarray:
+    """
+    Largest triangle three buckets: selects num_points of the series sorted by x, which keep the visual shape of the
+    series. The first and the last point are kept, from each bucket of the points in between the point spanning the
+    largest triangle with the previously selected point and the mean of the next bucket.
+    :return: positions of the selected points
+    """
+    num_values = len(x)
+    if num_points >= num_values or num_points < 3:
+        return np.arange(num_values)
+    selected = np.empty(num_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, num_values - 1
+    edges = np.append(np.linspace(1, num_values - 1, num_points - 1).astype(np.int64), num_values)
+    previous = 0
+    for bucket in range(num_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = x[end:edges[bucket + 2]].mean(), y[end:edges[bucket + 2]].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def is_long_series(plot_frame, group_column=None, max_points=max_fast_inliers) -> bool:
+    """
+    Fast mode: the points of facets with more than max_points measurements are rasterized
+    """
+    if group_column is None:
+        return plot_frame.shape[0] > max_points
+    return plot_frame.shape[0] > 0 and plot_frame.groupby(group_column, sort=False).size().max() > max_points
+
+
+def downsample_inliers(plot_frame, value_column, group_column=None, inlier_value='inlier',
+                       max_points=max_fast_inliers) -> pd.DataFrame:
+    """
+    Fast mode: reduces the inliers of each facet to at most max_points by LTTB, outliers and not tested measurements
+    are kept. Inliers without value are kept as well, they are not drawn but keep the facets of missing values.
+    """
+    dates = plot_frame['date'].to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(np.float64)
+    values = plot_frame[value_column].to_numpy(dtype=np.float64)
+    is_inlier = (plot_frame['outlier'] == inlier_value).to_numpy()
+    keep = ~is_inlier | ~np.isfinite(values)
+    groups = plot_frame[group_column].to_numpy() if group_column is not None else np.zeros(plot_frame.shape[0])
+    for group in pd.unique(groups):
+        positions = np.flatnonzero((groups == group) & is_inlier & np.isfinite(values))
+        positions = positions[np.argsort(dates[positions], kind='stable')]
+        keep[positions[downsample_lttb(dates[positions], values[positions], max_points)]] = True
+    return plot_frame[keep]
+
+
+def melt_measurements(measurements_df, value_columns: list, value_name, type_name) -> pd.DataFrame:
+    """
+    Long plot frame of the value columns by one melt of the measurements, the rows of each value column follow each
+    other and keep the index and the order of the measurements.
+    :return: columns date, value_name and type_name
+    """
+    if len(value_columns) == 0:
+        return pd.DataFrame()
+    plot_frame = measurements_df[[Columns.DATE] + value_columns].melt(id_vars=Columns.DATE, var_name=type_name,
+                                                                      value_name=value_name)
+    plot_frame.index = np.tile(measurements_df.index, len(value_columns))
+    return plot_frame.rename(columns={Columns.DATE: 'date'})[['date', value_name, type_name]]
+
+
+def get_long_flags(measurements_df, flag_columns: list) -> np.ndarray:
+    """
+    Flags of the rows of melt_measurements, one flag column per value column or one flag column for all
+    """
+    return measurements_df[flag_columns].to_numpy(dtype=np.int64).ravel(order='F')
+
+
+def get_outlier_labels(flags, label_flags: list, default='inlier') -> np.ndarray:
+    """
+    Label of each row by the first of the labels whose flag is set, in the order of label_flags.
+    :param flags: integer flags of the rows
+    :param label_flags: (label, SewageFlag) or (label, list with one SewageFlag per value column) for the rows of
+    melt_measurements
+    """
+    flags = np.asarray(flags, dtype=np.int64)
+    conditions = []
+    for _, sewage_flags in label_flags:
+        if isinstance(sewage_flags, SewageFlag):
+            masks = FlagMatrix.get_mask(sewage_flags)
+        else:
+            masks = np.repeat([FlagMatrix.get_mask(f) for f in sewage_flags], len(flags) // len(sewage_flags))
+        conditions.append((flags & masks) == masks)
+    return np.select(conditions, [label for label, _ in label_flags], default)
+
+
+def get_figures(biomarker_outlier_statistics, surrogatevirus_outlier_statistics, water_qc_outlier_statistics,
+                fast=False) -> list:
+    """
+    Figures of the plot file in the order of the pages. Each figure is given by its name, the function creating its
+    plot frame from the measurements and the function drawing the plot frame with the further arguments.
+    :param fast: clustered labels without layout, rasterized points and downsampled inliers on long time series
+    """
+    return [("biomarker_outlier_summary", get_biomarker_ratio_frame, draw_biomarker_outlier_summary, (biomarker_outlier_statistics, fast)),
+            ("surrogatvirus", get_surrogatvirus_frame, draw_surrogatvirus, (surrogatevirus_outlier_statistics, fast)),
+            ("sewage_flow", get_sewage_flow_frame, draw_sewage_flow, (fast,)),
+            ("water_quality", get_water_quality_frame, draw_water_quality, (water_qc_outlier_statistics, fast)),
+            ("biomarker_normalization", get_biomarker_normalization_frame, draw_biomarker_normalization, (fast,)),
+            ("general_outliers", get_general_outliers_frame, draw_general_outliers, (fast,))]
+
+
+def save_figure(pdf_plotter, figure) -> None:
+    if figure is not None:
+        pdf_plotter.savefig(figure)
+        plt.close(figure)
+
+
+def get_biomarker_ratio_frame(measurements_df) -> pd.DataFrame:
+    biomarker_pairs = [(biomarker1, biomarker2) for biomarker1, biomarker2 in
+                       itertools.combinations(Columns.get_biomarker_columns(), 2)
+                       if measurements_df[biomarker1 + "/" + biomarker2].notna().any()]
+    plot_frame = melt_measurements(measurements_df, [b1 + "/" + b2 for b1, b2 in biomarker_pairs],
+                                   'ratio/median ratio', 'biomarker_ratio')
+    if len(biomarker_pairs) > 0:
+        plot_frame['outlier'] = get_long_flags(measurements_df, [CalculatedColumns.get_biomaker_ratio_flag(b1, b2)
+                                                                 for b1, b2 in biomarker_pairs])
+    return plot_frame
+
+
+def draw_biomarker_outlier_summary(plot_frame, sample_location, outlier_detection_methods, fast=False):
+    """
+    :return: figure or None if no biomarker ratios were calculated
+    """
+    if plot_frame.shape[0] == 0:
+        return None
     labels_dict = dict()
-    for biomarker1, biomarker2 in itertools.combinations(Columns.get_biomarker_columns(), 2):
-        biomarker_ratio = biomarker1 + "/" + biomarker2
-        length = len(measurements_df[biomarker_ratio].dropna())
-        if length > 0:
-            dat = pd.DataFrame()
-            dat['date'] = measurements_df[Columns.DATE]
-            dat['ratio/median ratio'] = measurements_df[biomarker_ratio]
-            dat['biomarker_ratio'] = biomarker_ratio
-            dat['outlier'] = measurements_df[CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)]
-            plot_frame = pd.concat([plot_frame, dat])
-            labels_dict[biomarker_ratio] = \
-                get_date_outlier_labels_flags(plot_frame, 'biomarker_ratio', biomarker_ratio,
-                                              'outlier', SewageFlag.BIOMARKER_RATIO_OUTLIER, 'ratio/median ratio')
-
-    if plot_frame.shape[0] > 0:
-        plot_frame['outlier'] = np.where(
-            (SewageFlag.is_flag_set_for_series(plot_frame['outlier'], SewageFlag.NOT_ENOUGH_PREVIOUS_BIOMARKER_VALUES)),
-            'not tested',
-            np.where((SewageFlag.is_flag_set_for_series(plot_frame['outlier'], SewageFlag.BIOMARKER_RATIO_OUTLIER_REMOVED)), 'outlier recall',
-                     np.where((SewageFlag.is_flag_set_for_series(plot_frame['outlier'], SewageFlag.BIOMARKER_RATIO_OUTLIER)), 'outlier', 'inlier')))
-
-        g = sns.FacetGrid(plot_frame, col="biomarker_ratio", col_wrap=1, margin_titles=True, height=5, aspect=6, sharey=False, legend_out=True)
-        min_date = plot_frame['date'].min() + relativedelta(days=-10)
-        max_date = plot_frame['date'].max() + relativedelta(days=10)
-        g.set(xlim=(min_date, max_date))
-        g.set(yscale="log")
-        g.map_dataframe(sns.scatterplot, x="date", y="ratio/median ratio", hue="outlier", palette=get_label_colors())
-        # add outlier dates as text labels to each axis
-        __add_outlier_date_labels2ax(g, labels_dict)
-        color_dict = get_label_colors()
-        legend_patches = []
-        for label, color in color_dict.items():
-            #legend_patches.append(matplotlib.patches.Patch(color=color, label=label))
-            legend_patches.append(Line2D([0], [0], marker='o', markerfacecolor=color, color='white', linewidth=0, label=label, markersize=15))
-        if any(labels_dict.values()):
-            plt.legend(handles=legend_patches, loc="upper center", bbox_to_anchor=(.5, -0.2), ncol=3, title=None, frameon=True)
-        g.set_titles(row_template='{row_name}', col_template='{col_name}')
-        g.fig.subplots_adjust(top=0.9, bottom=0.1)
-        g.fig.suptitle("Biomarker ratios for '{}' -  Outlier detection methods: {}".format(sample_location, outlier_detection_methods))
-        pdf_plotter.savefig()
-        plt.cla()
-        plt.close()
-
-
-def plot_surrogatvirus (pdf_plotter, measurements_df, sample_location, outlier_detection_methods):
-    plot_frame = pd.DataFrame()
+    for biomarker_ratio in plot_frame['biomarker_ratio'].unique():
+        labels_dict[biomarker_ratio] = \
+            get_date_outlier_labels_flags(plot_frame, 'biomarker_ratio', biomarker_ratio,
+                                          'outlier', SewageFlag.BIOMARKER_RATIO_OUTLIER, 'ratio/median ratio')
+    plot_frame = plot_frame.copy()
+    plot_frame['outlier'] = get_outlier_labels(plot_frame['outlier'],
+                                               [('not tested', SewageFlag.NOT_ENOUGH_PREVIOUS_BIOMARKER_VALUES),
+                                                ('outlier recall', SewageFlag.BIOMARKER_RATIO_OUTLIER_REMOVED),
+                                                ('outlier', SewageFlag.BIOMARKER_RATIO_OUTLIER)])
+    rasterized = fast and is_long_series(plot_frame, 'biomarker_ratio')
+    if fast:
+        plot_frame = downsample_inliers(plot_frame, 'ratio/median ratio', 'biomarker_ratio')
+
+    g = sns.FacetGrid(plot_frame, col="biomarker_ratio", col_wrap=1, margin_titles=True, height=5, aspect=6, sharey=False, legend_out=True)
+    min_date = plot_frame['date'].min() + relativedelta(days=-10)
+    max_date = plot_frame['date'].max() + relativedelta(days=10)
+    g.set(xlim=(min_date, max_date))
+    g.set(yscale="log")
+    g.map_dataframe(sns.scatterplot, x="date", y="ratio/median ratio", hue="outlier", palette=get_label_colors(),
+                    rasterized=rasterized)
+    # add outlier dates as text labels to each axis
+    __add_outlier_date_labels2ax(g, labels_dict, fast)
+    color_dict = get_label_colors()
+    legend_patches = []
+    for label, color in color_dict.items():
+        #legend_patches.append(matplotlib.patches.Patch(color=color, label=label))
+        legend_patches.append(Line2D([0], [0], marker='o', markerfacecolor=color, color='white', linewidth=0, label=label, markersize=15))
+    if any(labels_dict.values()):
+        plt.legend(handles=legend_patches, loc="upper center", bbox_to_anchor=(.5, -0.2), ncol=3, title=None, frameon=True)
+    g.set_titles(row_template='{row_name}', col_template='{col_name}')
+    g.fig.subplots_adjust(top=0.9, bottom=0.1)
+    g.fig.suptitle("Biomarker ratios for '{}' -  Outlier detection methods: {}".format(sample_location, outlier_detection_methods))
+    return g.fig
+
+
+def plot_biomarker_outlier_summary(pdf_plotter, measurements_df, sample_location, outlier_detection_methods, fast=False):
+    save_figure(pdf_plotter, draw_biomarker_outlier_summary(get_biomarker_ratio_frame(measurements_df), sample_location,
+                                                            outlier_detection_methods, fast))
+
+
+def get_surrogatvirus_frame(measurements_df) -> pd.DataFrame:
+    surrogatevirus_columns = Columns.get_surrogatevirus_columns()
+    plot_frame = melt_measurements(measurements_df, surrogatevirus_columns, 'value', 'type')
+    plot_frame['outlier'] = get_outlier_labels(
+        get_long_flags(measurements_df, [CalculatedColumns.FLAG.value] * len(surrogatevirus_columns)),
+        [('not tested', SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE),
+         ('outlier', [CalculatedColumns.get_surrogate_outlier_flag(sVirus) for sVirus in surrogatevirus_columns])])
+    return plot_frame
+
+
+def draw_surrogatvirus(plot_frame, sample_location, outlier_detection_methods, fast=False):
     labels_dict = dict()
-    for sVirus in Columns.get_surrogatevirus_columns():
-        dat = pd.DataFrame()
-        dat['date'] = measurements_df[Columns.DATE]
-        dat['value'] = measurements_df[sVirus]
-        dat['type'] = sVirus
-        dat['outlier'] = np.where(
-            (SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value],
-                                               SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE)),
-            'not tested', np.where((SewageFlag.is_flag_set_for_series(
-                measurements_df[CalculatedColumns.FLAG.value], CalculatedColumns.get_surrogate_outlier_flag(sVirus))),
-                'outlier', 'inlier'))
-        plot_frame = pd.concat([plot_frame, dat])
+    for sVirus in plot_frame['type'].unique():
         labels_dict[sVirus] = get_date_outlier_labels_value(plot_frame, 'type', sVirus, 'outlier', 'outlier', 'value')
+    rasterized = fast and is_long_series(plot_frame, 'type')
+    if fast:
+        plot_frame = downsample_inliers(plot_frame, 'value', 'type')
     g = sns.FacetGrid(plot_frame, col="type", col_wrap=1, margin_titles=True, height=5, aspect=6, sharey=False, legend_out=True)
     min_date = plot_frame['date'].min() + relativedelta(days=-10)
     max_date = plot_frame['date'].max() + relativedelta(days=10)
     g.set(xlim=(min_date, max_date))
-    g.map_dataframe(sns.scatterplot, x="date", y="value", hue="outlier", palette=get_label_colors())
-    __add_outlier_date_labels2ax(g, labels_dict)
+    g.map_dataframe(sns.scatterplot, x="date", y="value", hue="outlier", palette=get_label_colors(), rasterized=rasterized)
+    __add_outlier_date_labels2ax(g, labels_dict, fast)
     if any(labels_dict.values()):
         plt.legend(loc="upper center", bbox_to_anchor=(.5, -0.2), ncol=3, title=None, frameon=True)
     g.set_titles(row_template='{row_name}', col_template='{col_name}')
     g.fig.subplots_adjust(top=0.9)
     g.fig.suptitle("Surrogatvirus quality control for '{}' -  Outlier detection methods: {}".format(sample_location, outlier_detection_methods))
     plt.tight_layout()
-    pdf_plotter.savefig()
-    plt.cla()
-    plt.close()
+    return g.fig
 
 
-def plot_water_quality(pdf_plotter, measurements_df, sample_location,  outlier_detection_methods):
-    plot_frame = pd.DataFrame()
+def plot_surrogatvirus (pdf_plotter, measurements_df, sample_location, outlier_detection_methods, fast=False):
+    save_figure(pdf_plotter, draw_surrogatvirus(get_surrogatvirus_frame(measurements_df), sample_location,
+                                                outlier_detection_methods, fast))
+
+
+def get_water_quality_frame(measurements_df) -> pd.DataFrame:
+    plot_frame = melt_measurements(measurements_df, [Columns.AMMONIUM, Columns.CONDUCTIVITY], 'value', 'type')
+    plot_frame['outlier'] = get_outlier_labels(
+        get_long_flags(measurements_df, [CalculatedColumns.FLAG.value] * 2),
+        [('not tested', [SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES, SewageFlag.NOT_ENOUGH_CONDUCTIVITY_VALUES]),
+         ('outlier', [SewageFlag.AMMONIUM_OUTLIER, SewageFlag.CONDUCTIVITY_OUTLIER])])
+    return plot_frame
+
+
+def draw_water_quality(plot_frame, sample_location, outlier_detection_methods, fast=False):
     labels_dict = dict()
-    for qual_type, outlier_flag, not_enough_flag in zip([Columns.AMMONIUM, Columns.CONDUCTIVITY],
-                                                        [SewageFlag.AMMONIUM_OUTLIER, SewageFlag.CONDUCTIVITY_OUTLIER],
-                                                        [SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES, SewageFlag.NOT_ENOUGH_CONDUCTIVITY_VALUES]):
-        dat = pd.DataFrame()
-        dat['date'] = measurements_df[Columns.DATE]
-        dat['value'] = measurements_df[qual_type]
-        dat['type'] = qual_type
-        dat['outlier'] = measurements_df[CalculatedColumns.FLAG.value]
-        dat['outlier'] = np.where((SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], not_enough_flag)), 'not tested',
-                                     np.where((SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], outlier_flag)), 'outlier', 'inlier'))
-        plot_frame = pd.concat([plot_frame, dat])
+    for qual_type in plot_frame['type'].unique():
         labels_dict[qual_type] = get_date_outlier_labels_value(plot_frame, 'type', qual_type, 'outlier', 'outlier', 'value')
-
+    rasterized = fast and is_long_series(plot_frame, 'type')
+    if fast:
+        plot_frame = downsample_inliers(plot_frame, 'value', 'type')
     g = sns.FacetGrid(plot_frame, col="type", col_wrap=1, margin_titles=True, height=5, aspect=6, sharey=False, legend_out=True)
     min_date = plot_frame['date'].min() + relativedelta(days=-10)
     max_date = plot_frame['date'].max() + relativedelta(days=10)
     g.set(xlim=(min_date, max_date))
-    g.map_dataframe(sns.scatterplot, x="date", y="value", hue="outlier", palette=get_label_colors(), legend="full")
-    __add_outlier_date_labels2ax(g, labels_dict)
+    g.map_dataframe(sns.scatterplot, x="date", y="value", hue="outlier", palette=get_label_colors(), legend="full",
+                    rasterized=rasterized)
+    __add_outlier_date_labels2ax(g, labels_dict, fast)
     if any(labels_dict.values()):
         plt.legend(loc="upper center", bbox_to_anchor=(.5, -0.2), ncol=3, title=None, frameon=True)
     g.set_titles(row_template='{row_name}', col_template='{col_name}')
     g.fig.subplots_adjust(top=0.9)
     g.fig.suptitle("Water quality control for '{}' -  Outlier detection methods: {}".format(sample_location, outlier_detection_methods))
     plt.tight_layout()
-    pdf_plotter.savefig()
-    plt.cla()
-    plt.close()
+    return g.fig
+
 
+def plot_water_quality(pdf_plotter, measurements_df, sample_location,  outlier_detection_methods, fast=False):
+    save_figure(pdf_plotter, draw_water_quality(get_water_quality_frame(measurements_df), sample_location,
+                                                outlier_detection_methods, fast))
 
-def plot_sewage_flow(pdf_plotter, measurements_df, sample_location):
+
+def get_sewage_flow_frame(measurements_df) -> pd.DataFrame:
     plot_frame = pd.DataFrame()
     plot_frame['date'] = measurements_df[Columns.DATE]
     plot_frame['value'] = measurements_df[Columns.MEAN_SEWAGE_FLOW]
-    plot_frame['outlier'] = np.where(
-        (SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION)) |
-        (SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO)),
-        'outlier', np.where((SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], SewageFlag.SEWAGE_FLOW_NOT_ENOUGH_PREVIOUS_VALUES)),
-        'not tested', 'inlier'))
-    plt.figure(figsize=(30, 8))
-    g = sns.scatterplot(data=plot_frame, x="date", y="value", hue="outlier", palette=get_label_colors())
+    plot_frame['outlier'] = get_outlier_labels(measurements_df[CalculatedColumns.FLAG.value],
+                                               [('outlier', SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION),
+                                                ('outlier', SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO),
+                                                ('not tested', SewageFlag.SEWAGE_FLOW_NOT_ENOUGH_PREVIOUS_VALUES)])
+    return plot_frame
+
+
+def draw_sewage_flow(plot_frame, sample_location, fast=False):
+    figure = plt.figure(figsize=(30, 8))
+    rasterized = fast and is_long_series(plot_frame)
+    if fast:
+        plot_frame = downsample_inliers(plot_frame, 'value')
+    g = sns.scatterplot(data=plot_frame, x="date", y="value", hue="outlier", palette=get_label_colors(), rasterized=rasterized)
     min_date = plot_frame['date'].min() + relativedelta(days=-10)
     max_date = plot_frame['date'].max() + relativedelta(days=10)
     g.set(xlim=(min_date, max_date))
@@ -201,8 +352,9 @@ def plot_sewage_flow(pdf_plotter, measurements_df, sample_location):
     #    g.axhline(dry_weather_flow, label="Dry weather flow", linestyle='dashed', c='black')
     #    plt.title("Mean sewage flow for '{}' - Dry weather flow: '{}'".format(sample_location, round(dry_weather_flow,1)))
     # plt.legend(bbox_to_anchor=(1.01, 0.5), loc='center left', borderaxespad=0)
-    labels = get_date_outlier_labels_by_value(plot_frame, 'outlier', 'outlier')
-    adjust_text(labels)
+    labels = get_date_outlier_labels_by_value(plot_frame, 'outlier', 'outlier', fast)
+    if not fast:
+        adjust_text(labels)
     sns.move_legend(
         g, loc="upper center",
         bbox_to_anchor=(.5, -0.1), ncol=3, title=None, frameon=True
@@ -210,54 +362,69 @@ def plot_sewage_flow(pdf_plotter, measurements_df, sample_location):
     plt.title("Mean sewage flow for '{}'".format(sample_location), fontsize=22)
     plt.ylabel('Mean sewage flow')
     plt.tight_layout()
-    pdf_plotter.savefig()
-    plt.cla()
-    plt.close()
+    return figure
 
 
-def plot_biomarker_normalization(pdf_plotter, measurements_df, sample_location):
-    plot_frame = pd.DataFrame()
+def plot_sewage_flow(pdf_plotter, measurements_df, sample_location, fast=False):
+    save_figure(pdf_plotter, draw_sewage_flow(get_sewage_flow_frame(measurements_df), sample_location, fast))
+
+
+def get_biomarker_normalization_frame(measurements_df) -> pd.DataFrame:
+    plot_frame = melt_measurements(measurements_df, [CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value,
+                                                     CalculatedColumns.BASE_REPRODUCTION_FACTOR.value], 'value', 'type')
+    plot_frame['outlier'] = get_outlier_labels(get_long_flags(measurements_df, [CalculatedColumns.FLAG.value] * 2),
+                                               [('outlier', SewageFlag.REPRODUCTION_NUMBER_OUTLIER),
+                                                ('not tested', SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED)])
+    return plot_frame
+
+
+def draw_biomarker_normalization(plot_frame, sample_location, fast=False):
     labels_dict = dict()
-    for column_type in [CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value, CalculatedColumns.BASE_REPRODUCTION_FACTOR.value]:
-        dat = pd.DataFrame()
-        dat['date'] = measurements_df[Columns.DATE]
-        dat['value'] = measurements_df[column_type]
-        dat['type'] = column_type
-        dat['outlier'] = np.where(
-            (SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], SewageFlag.REPRODUCTION_NUMBER_OUTLIER)),
-            'outlier', np.where((SewageFlag.is_flag_set_for_series(measurements_df[CalculatedColumns.FLAG.value], SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED)),
-                                'not tested', 'inlier'))
-        plot_frame = pd.concat([plot_frame, dat])
+    for column_type in plot_frame['type'].unique():
         labels_dict[column_type] = get_date_outlier_labels_value(plot_frame, 'type', column_type, 'outlier', 'outlier', 'value')
+    rasterized = fast and is_long_series(plot_frame, 'type')
+    if fast:
+        plot_frame = downsample_inliers(plot_frame, 'value', 'type')
     g = sns.FacetGrid(plot_frame, col="type", col_wrap=1, margin_titles=True, height=5, aspect=6, sharey=False, legend_out=True)
     min_date = plot_frame['date'].min() + relativedelta(days=-2)
     max_date = plot_frame['date'].max() + relativedelta(days=2)
     g.set(xlim=(min_date, max_date))
-    g.map_dataframe(sns.scatterplot, x="date", y="value", hue="outlier", palette=get_label_colors())
-    __add_outlier_date_labels2ax(g, labels_dict)
+    g.map_dataframe(sns.scatterplot, x="date", y="value", hue="outlier", palette=get_label_colors(), rasterized=rasterized)
+    __add_outlier_date_labels2ax(g, labels_dict, fast)
     plt.legend(loc="upper center", bbox_to_anchor=(.5, -0.2), ncol=3, title=None, frameon=True)
     g.set_titles(row_template='{row_name}', col_template='{col_name}')
     g.fig.subplots_adjust(top=0.9)
     g.fig.suptitle("Biomarker normalization for '{}'".format(sample_location))
     g.fig.axes[1].set_yscale("symlog", base=2)
     plt.tight_layout()
-    pdf_plotter.savefig()
-    plt.cla()
-    plt.close()
+    return g.fig
 
 
-def plot_general_outliers(pdf_plotter, measurements_df, sample_location):
+def plot_biomarker_normalization(pdf_plotter, measurements_df, sample_location, fast=False):
+    save_figure(pdf_plotter, draw_biomarker_normalization(get_biomarker_normalization_frame(measurements_df),
+                                                          sample_location, fast))
+
+
+def get_general_outliers_frame(measurements_df) -> pd.DataFrame:
     plot_frame = pd.DataFrame()
     plot_frame['date'] = measurements_df[Columns.DATE]
     plot_frame['value'] = measurements_df[CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value]
     plot_frame['outlier'] = measurements_df[CalculatedColumns.OUTLIER_REASON.value]
-    plt.figure(figsize=(30, 10))
-    g = sns.scatterplot(data=plot_frame, x="date", y="value", hue="outlier")
+    return plot_frame
+
+
+def draw_general_outliers(plot_frame, sample_location, fast=False):
+    figure = plt.figure(figsize=(30, 10))
+    rasterized = fast and is_long_series(plot_frame)
+    if fast:
+        plot_frame = downsample_inliers(plot_frame, 'value', inlier_value="")
+    g = sns.scatterplot(data=plot_frame, x="date", y="value", hue="outlier", rasterized=rasterized)
     min_date = plot_frame['date'].min() + relativedelta(days=-10)
     max_date = plot_frame['date'].max() + relativedelta(days=10)
     g.set(xlim=(min_date, max_date))
-    labels = get_general_outlier_date_labels(plot_frame, 'outlier')
-    adjust_text(labels)
+    labels = get_general_outlier_date_labels(plot_frame, 'outlier', fast)
+    if not fast:
+        adjust_text(labels)
     if len(labels) > 0:
         sns.move_legend(
             g, loc="upper center",
@@ -265,8 +432,8 @@ def plot_general_outliers(pdf_plotter, measurements_df, sample_location):
         )
     plt.title("Outliers - Normalized mean biomarkers for '{}'".format(sample_location), fontsize=22)
     plt.tight_layout()
-    pdf_plotter.savefig()
-    plt.cla()
-    plt.close()
+    return figure
 
 
+def plot_general_outliers(pdf_plotter, measurements_df, sample_location, fast=False):
+    save_figure(pdf_plotter, draw_general_outliers(get_general_outliers_frame(measurements_df), sample_location, fast))
@@ -1,15 +1,104 @@
 # Created by alex at 03.07.23
 import math
-from .plotting import *
 from .statistics import *
 from .utils import *
 
 
+class DryWeatherFlowEstimator:
+    """
+    Mean sewage flows of the previous measurements that are not flagged as heavy precipitation, probable typo or
+    missing flow. The flows are kept in a Fenwick tree over the ranks of all flows of the sample location, thus adding
+    a measurement and the mean of the smallest flows take O(log n) instead of filtering and sorting the whole history
+    for every measurement.
+    Measurements have to be added in order of the collection date, after their flags were set.
+    """
+    sewage_flow_flags = SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION.value | SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value | \
+                        SewageFlag.MISSING_MEAN_SEWAGE_FLOW.value
+
+    def __init__(self):
+        self.measurements = None
+        self.flows = None
+
+    def __getstate__(self):
+        # rebuilt for each sample location, don't ship it to worker processes
+        state = self.__dict__.copy()
+        state['measurements'] = None
+        state['flows'] = None
+        return state
+
+    def get(self, measurements, flows: np.ndarray, end) -> 'DryWeatherFlowEstimator':
+        """
+        Returns the estimator for the given measurements. It is rebuilt for the measurements of another location
+        or if an earlier measurement is requested again.
+        :param measurements: data frame or column store the flows belong to
+        :param flows: mean sewage flows of all measurements
+        :param end: position of the first measurement that is not added
+        """
+        if measurements is not self.measurements or flows.shape[0] != self.flows.shape[0] or end < self.num_added:
+            self.measurements = measurements
+            self.flows = flows
+            self.sorted_flows = np.unique(flows[~np.isnan(flows)]).tolist()
+            self.ranks = np.searchsorted(self.sorted_flows, flows).tolist()
+            self.tree_size = len(self.sorted_flows)
+            self.tree_counts = [0] * (self.tree_size + 1)
+            self.tree_sums = [0.0] * (self.tree_size + 1)
+            self.counts = [0] * self.tree_size
+            self.num_added = 0
+            self.num_flows = 0
+            self.num_values = 0
+        return self
+
+    def add(self, end, flags: np.ndarray) -> None:
+        """
+        Adds the measurements up to end (exclusive) which are not flagged.
+        """
+        for index in range(self.num_added, end):
+            if int(flags[index]) & self.sewage_flow_flags == 0:
+                self.num_flows += 1
+                if not math.isnan(self.flows[index]):
+                    self.num_values += 1
+                    rank = self.ranks[index]
+                    self.counts[rank] += 1
+                    position = rank + 1
+                    while position <= self.tree_size:
+                        self.tree_counts[position] += 1
+                        self.tree_sums[position] += self.sorted_flows[rank]
+                        position += position & -position
+        self.num_added = max(self.num_added, end)
+
+    def get_num_flows(self) -> int:
+        """
+        Number of added flows, including empty ones.
+        """
+        return self.num_flows
+
+    def get_mean_of_smallest(self, num_smallest) -> float:
+        """
+        Mean of the num_smallest flows and all flows equal to the largest of them (like Series.nsmallest with
+        keep='all'). NaN if no flow is selected.
+        """
+        num_smallest = min(num_smallest, self.num_values)
+        if num_smallest <= 0:
+            return np.NAN
+        # descend the tree to the rank of the num_smallest-th flow, summing up all smaller flows
+        position, remaining, smaller_count, smaller_sum = 0, num_smallest, 0, 0.0
+        step = 1 << (self.tree_size.bit_length() - 1)
+        while step > 0:
+            if position + step <= self.tree_size and self.tree_counts[position + step] < remaining:
+                position += step
+                remaining -= self.tree_counts[position]
+                smaller_count += self.tree_counts[position]
+                smaller_sum += self.tree_sums[position]
+            step >>= 1
+        count = smaller_count + self.counts[position]
+        return (smaller_sum + self.counts[position] * self.sorted_flows[position]) / count
+
+
 class SewageFlow:
 
     def __init__(self, output_folder, sewageStat: SewageStat, sewage_plants2dry_weather_flow: dict, fraction_last_samples_for_dry_flow: float,
                  min_num_samples_for_mean_dry_flow: int, heavy_precipitation_factor: int, mean_sewage_flow_below_typo_factor: float,
-                 mean_sewage_flow_above_typo_factor: float):
+                 mean_sewage_flow_above_typo_factor: float, window_index: WindowIndex = None):
         self.output_folder = output_folder
         self.sewageStat = sewageStat
         self.sewage_plants2dry_weather_flow = sewage_plants2dry_weather_flow
@@ -18,31 +107,30 @@ class SewageFlow:
         self.heavy_precipitation_factor = heavy_precipitation_factor
         self.mean_sewage_flow_below_typo_factor = mean_sewage_flow_below_typo_factor
         self.mean_sewage_flow_above_typo_factor = mean_sewage_flow_above_typo_factor
+        self.window_index = window_index if window_index else WindowIndex()
+        self.dry_weather_flow_estimator = DryWeatherFlowEstimator()
         self.logger = SewageLogger(self.output_folder)
 
     def sewage_flow_quality_control(self, sample_location, measurements: pd.DataFrame, index):
         dry_flow, is_mean_dry_weather_flow_available = self.__is_mean_flow_above_dry_flow(sample_location, measurements, index)
 
-    def __get_mean_flow_based_on_last_min_values(self, sample_location, measurements_df: pd.DataFrame, current_measurement):
-        last_measurements = measurements_df[measurements_df[Columns.DATE] < current_measurement[Columns.DATE]]
+    def __get_mean_flow_based_on_last_min_values(self, sample_location, measurements_df: pd.DataFrame, index):
         # omit samples where any sewage flow tag was set
-        last_measurements = last_measurements[SewageFlag.is_not_flag_set_for_series(last_measurements[CalculatedColumns.FLAG.value], SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION)]
-        last_measurements = last_measurements[SewageFlag.is_not_flag_set_for_series(last_measurements[CalculatedColumns.FLAG.value], SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO)]
-        last_measurements = last_measurements[SewageFlag.is_not_flag_set_for_series(last_measurements[CalculatedColumns.FLAG.value], SewageFlag.MISSING_MEAN_SEWAGE_FLOW)]
-        mean_sewage_flows = last_measurements[Columns.MEAN_SEWAGE_FLOW]
-        if mean_sewage_flows.shape[0] < self.min_num_samples_for_mean_dry_flow:
+        start, end = self.window_index.get(measurements_df).history_window(index)
+        mean_sewage_flows = self.dry_weather_flow_estimator.get(measurements_df, measurements_df[Columns.MEAN_SEWAGE_FLOW].to_numpy(dtype=np.float64), end)
+        mean_sewage_flows.add(end, measurements_df[CalculatedColumns.FLAG.value].to_numpy())
+        if mean_sewage_flows.get_num_flows() < self.min_num_samples_for_mean_dry_flow:
             self.logger.log.debug("[Sewage flow] - [Sample location: '{}'] - Less than '{}' "
                                   "previous samples obtained. Skipping sewage flow QC...".format(sample_location, self.min_num_samples_for_mean_dry_flow))
             return None
         # round up to next integer
-        num_last_N_samples = math.ceil(mean_sewage_flows.shape[0] * self.fraction_last_samples_for_dry_flow)
-        smallest_sewage_flows = mean_sewage_flows.nsmallest(num_last_N_samples, keep='all')
-        mean_dry_flow_estimation = np.mean(smallest_sewage_flows)
+        num_last_N_samples = math.ceil(mean_sewage_flows.get_num_flows() * self.fraction_last_samples_for_dry_flow)
+        mean_dry_flow_estimation = mean_sewage_flows.get_mean_of_smallest(num_last_N_samples)
         return mean_dry_flow_estimation
 
-    def __get_dry_flow(self, sample_location, measurements_df: pd.DataFrame, current_measurement):
+    def __get_dry_flow(self, sample_location, measurements_df: pd.DataFrame, index):
         is_mean_dry_weather_flow_available = False
-        mean_dry_flow_estimation = self.__get_mean_flow_based_on_last_min_values(sample_location, measurements_df, current_measurement)
+        mean_dry_flow_estimation = self.__get_mean_flow_based_on_last_min_values(sample_location, measurements_df, index)
         if mean_dry_flow_estimation:
             is_mean_dry_weather_flow_available = True
             return mean_dry_flow_estimation, is_mean_dry_weather_flow_available
@@ -57,7 +145,7 @@ class SewageFlow:
         is_mean_dry_weather_flow_available, dry_flow = False, None
         current_measurement = measurements.iloc[index]
         if SewageFlag.is_not_flag(current_measurement[CalculatedColumns.FLAG.value], SewageFlag.MISSING_MEAN_SEWAGE_FLOW):
-            dry_flow, is_mean_dry_weather_flow_available = self.__get_dry_flow(sample_location, measurements, current_measurement)
+            dry_flow, is_mean_dry_weather_flow_available = self.__get_dry_flow(sample_location, measurements, index)
             if dry_flow:
                 current_mean_flow = current_measurement[Columns.MEAN_SEWAGE_FLOW]
                 # is the mean flow a factor of N (default: 9) higher than the dry weather flow --> probable typo
@@ -1,4 +1,6 @@
 # Created by alex at 14.07.23
+import sys
+import tracemalloc
 
 
 class SewageStat:
@@ -14,6 +16,8 @@ class SewageStat:
         self.water_quality_outliers = dict()
         self.normalization_outliers = dict()
         self.outliers = dict()
+        self.outlier_model_fits = dict()
+        self.outlier_model_cache = dict()
 
     def __reset(self):
         self.stat_dict = dict()
@@ -24,6 +28,8 @@ class SewageStat:
         self.water_quality_outliers = dict()
         self.normalization_outliers = dict()
         self.outliers = dict()
+        self.outlier_model_fits = dict()
+        self.outlier_model_cache = dict()
 
     def set_sample_location_and_total_number(self, sample_location, total_samples_number):
         self.sample_location = sample_location
@@ -75,6 +81,16 @@ class SewageStat:
         self.outliers.setdefault(type, 0)
         self.outliers[type] += 1
 
+    def add_outlier_model_fit(self, outlier_statistic, status):
+        if not outlier_statistic in self.outlier_model_fits:
+            self.outlier_model_fits[outlier_statistic] = dict()
+        self.outlier_model_fits[outlier_statistic].setdefault(status, 0)
+        self.outlier_model_fits[outlier_statistic][status] += 1
+
+    def add_outlier_model_cache(self, status):
+        self.outlier_model_cache.setdefault(status, 0)
+        self.outlier_model_cache[status] += 1
+
     def print_statistics(self):
         stats = "{}:\n".format(self.sample_location)
         for key, msg in self.stat_dict.items():
@@ -98,4 +114,65 @@ class SewageStat:
         stats += "Outlier reasons:\n"
         for outlier_type, count in self.outliers.items():
             stats += "\t{}:\t{}\n".format(outlier_type, count)
-        return stats
\ No newline at end of file
+        stats += "Outlier model fits:\n"
+        for outlier_statistic, status_dict in self.outlier_model_fits.items():
+            stats += "\t{}:\n".format(outlier_statistic)
+            for status, count in status_dict.items():
+                stats += "\t\t{}:\t{}\n".format(status, count)
+        stats += "Outlier model cache:\n"
+        for status, count in self.outlier_model_cache.items():
+            stats += "\t{}:\t{}\n".format(status, count)
+        return stats
+
+def get_max_rss() -> int:
+    """
+    Peak resident set size of the process in bytes, None if not available on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac os
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class MemoryReport:
+    """
+    Peak memory while processing each sample location. The memory allocated by Python and NumPy is traced by
+    tracemalloc, which slows down the processing, thus it is only started for the report. The peak is counted from
+    the memory in use when the processing of the sample location started. The resident set size is the high-water
+    mark of the whole process, that is of all sample locations processed by it so far.
+    """
+
+    def __init__(self):
+        # sample location: (traced peak, peak resident set size) in bytes
+        self.peaks = dict()
+        self.__start_memory = 0
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.__start_memory = tracemalloc.get_traced_memory()[0]
+
+    def stop(self, sample_location) -> (int, int):
+        peak = tracemalloc.get_traced_memory()[1] - self.__start_memory
+        self.peaks[sample_location] = (peak, get_max_rss())
+        return self.peaks[sample_location]
+
+    @staticmethod
+    def format_megabytes(num_bytes) -> str:
+        return "n/a" if num_bytes is None else "{:.1f} MB".format(num_bytes / 1024 ** 2)
+
+    def print_report(self) -> str:
+        report = "Peak memory per sample location (traced, resident set size of the process):\n"
+        for sample_location, (peak, max_rss) in self.peaks.items():
+            report += "\t{}:\t{}\t{}\n".format(sample_location, self.format_megabytes(peak), self.format_megabytes(max_rss))
+        return report
+
+    def write(self, output_file) -> None:
+        with open(output_file, 'w') as f:
+            f.write("sample_location\ttraced_peak_bytes\tmax_rss_bytes\n")
+            for sample_location, (peak, max_rss) in self.peaks.items():
+                f.write("{}\t{}\t{}\n".format(sample_location, peak, "" if max_rss is None else max_rss))
@@ -1,25 +1,21 @@
 # Created by alex at 22.06.23
 import math
-from dateutil.relativedelta import relativedelta
 from .utils import *
 from .statistics import *
-from .plotting import *
 
 
 class SurrogateVirusQC:
 
-    def __init__(self, sewageStat: SewageStat, periode_month_surrogatevirus, min_number_surrogatevirus_for_outlier_detection, surrogatevirus_outlier_statistics, output_folder):
+    def __init__(self, sewageStat: SewageStat, periode_month_surrogatevirus, min_number_surrogatevirus_for_outlier_detection, surrogatevirus_outlier_statistics, output_folder,
+                 window_index: WindowIndex = None):
         self.sewageStat = sewageStat
         self.periode_month_surrogatevirus = periode_month_surrogatevirus
         self.min_number_surrogatevirus_for_outlier_detection = min_number_surrogatevirus_for_outlier_detection
         self.surrogatevirus_outlier_statistics = surrogatevirus_outlier_statistics
         self.output_folder = output_folder
+        self.window_index = window_index if window_index else WindowIndex()
         self.logger = SewageLogger(output_folder)
 
-    def __get_start_timeframe(self, current_date: datetime):
-        start_timeframe = (current_date - relativedelta(months=self.periode_month_surrogatevirus)).strftime('%Y-%m-%d')
-        return start_timeframe
-
     def filter_dry_days_time_frame(self, sample_location: str, measurements: pd.DataFrame, index):
         """
          Get rid of rainy days
@@ -29,15 +25,14 @@ class SurrogateVirusQC:
             SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value,
                                                 SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE)
 
-    def __get_previous_surrogatevirus_values (self, measurements_df: pd.DataFrame, current_measurement, sVirus):
+    def __get_previous_surrogatevirus_values (self, measurements_df: pd.DataFrame, index, sVirus):
         """
           Timeframe of n month, all surrogatevirus measurements that are set and are not flagged
         """
-        #get current timeframe eg. last 4 month from current measurement
-        start_timeframe = self.__get_start_timeframe(current_measurement[Columns.DATE])
-
-        current_timeframe = measurements_df[(measurements_df[Columns.DATE] > start_timeframe) &
-                                            (measurements_df[Columns.DATE] < current_measurement[Columns.DATE])]
+        #get current timeframe eg. last 4 month from current measurement, the start day itself is excluded
+        start, end = self.window_index.get(measurements_df).calendar_window(index, num_month=self.periode_month_surrogatevirus,
+                                                                            include_start=False)
+        current_timeframe = measurements_df.iloc[start:end]
 
         # get rid of empty measurements
         current_timeframe = current_timeframe[current_timeframe[sVirus].notna()]
@@ -59,10 +54,10 @@ class SurrogateVirusQC:
 
             if SewageFlag.is_not_flag(current_measurement[CalculatedColumns.FLAG.value], SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE) and current_measurement[sVirus] and not math.isnan(
                     current_measurement[sVirus]):
-                sVirus_values_to_take = self.__get_previous_surrogatevirus_values(measurements, current_measurement, sVirus)
+                sVirus_values_to_take = self.__get_previous_surrogatevirus_values(measurements, index, sVirus)
                 if len(sVirus_values_to_take) > self.min_number_surrogatevirus_for_outlier_detection:
                     is_outlier = detect_outliers(self.surrogatevirus_outlier_statistics, sVirus_values_to_take[sVirus],
-                                                 current_measurement[sVirus])
+                                                 current_measurement[sVirus], sewageStat=self.sewageStat)
                     if is_outlier:
                         SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value,
                                                 CalculatedColumns.get_surrogate_outlier_flag(sVirus))
@@ -1,18 +1,20 @@
 # Created by alex at 20.06.23
 import os.path
 import sys
+import glob
+import uuid
 from typing import List
 import datetime
-import dateutil.relativedelta
+import hashlib
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import logging
 import tqdm
-import scipy.stats as st
-from sklearn.ensemble import IsolationForest
-from sklearn.neighbors import LocalOutlierFactor
-from sklearn.svm import OneClassSVM
 from .sewage import SewageSample
+from .window_index import WindowIndex
 from .constant import *
 
 column_map = {
@@ -34,15 +36,165 @@ column_map = {
 }
 
 
-def read_excel_input_files(input_file: str):
-    f = pd.ExcelFile(input_file)
-    location_dict = dict()
-    for sheet in f.sheet_names:
-        df = f.parse(sheet)
-        df.rename(columns=column_map, inplace=True)
-        df = df[list(column_map.values())]
-        location_dict[sheet] = df
-    return location_dict
+# input formats with the file extensions used to detect them
+input_formats = {
+    'excel': ['.xlsx', '.xlsm', '.xls'],
+    'parquet': ['.parquet', '.pq'],
+    'arrow': ['.arrow', '.feather', '.ipc'],
+    'csv': ['.csv', '.csv.gz']
+}
+excel_engines = ['openpyxl', 'calamine']
+# column of the long format inputs holding the sample location
+default_location_column = 'sample_location'
+
+
+def write_atomic(path, write_function) -> None:
+    """
+    Writes the file to a temporary file in the same folder, which replaces the file only after it was written
+    completely. Thus, readers and runs killed while writing never see a truncated file.
+    Temporary files of killed runs are named <path>.tmp-<random>, see remove_temporary_files.
+    :param write_function: writes the content to the given path
+    """
+    temporary_file = "{}.tmp-{}".format(path, uuid.uuid4().hex)
+    try:
+        write_function(temporary_file)
+        with open(temporary_file, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temporary_file, path)
+    except BaseException:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+        raise
+
+
+def write_table_atomic(table: pa.Table, path) -> None:
+    write_atomic(path, lambda temporary_file: pq.write_table(table, temporary_file))
+
+
+def remove_temporary_files(path) -> None:
+    """
+    Removes the temporary files of runs killed while writing the file, only call it while holding the lock of the file.
+    """
+    for temporary_file in glob.glob("{}.tmp-*".format(glob.escape(path))):
+        os.remove(temporary_file)
+
+
+def get_input_format(input_file: str) -> str:
+    for input_format, extensions in input_formats.items():
+        if any(input_file.lower().endswith(extension) for extension in extensions):
+            return input_format
+    raise ValueError("Unknown format of input file '{}', use one of: {}".format(
+        input_file, ", ".join(e for extensions in input_formats.values() for e in extensions)))
+
+
+def iter_input_files(input_file: str, input_format='auto', excel_engine='openpyxl',
+                     location_column=default_location_column):
+    """
+    Reads the measurements of the sample locations one after the other, only the columns of column_map are read.
+    Excel workbooks have one sheet per sample location, Parquet, Arrow IPC and CSV files are in long format with the
+    sample location in location_column.
+    :return: generator of (sample location, measurements)
+    """
+    if input_format == 'auto':
+        input_format = get_input_format(input_file)
+    if input_format == 'excel':
+        return iter_excel_input_files(input_file, excel_engine)
+    return iter_long_format_input_file(input_file, input_format, location_column)
+
+
+def read_input_files(input_file: str, input_format='auto', excel_engine='openpyxl',
+                     location_column=default_location_column):
+    """
+    :return: dictionary of sample location to measurements
+    """
+    return dict(iter_input_files(input_file, input_format, excel_engine, location_column))
+
+
+def _is_input_column(column) -> bool:
+    return column in column_map or column in column_map.values()
+
+
+def _select_input_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.rename(columns=column_map)
+    df = df[list(column_map.values())]
+    if pd.api.types.is_datetime64_any_dtype(df[Columns.DATE]):
+        # dates are checked in the text format of the excel sheets
+        df[Columns.DATE] = df[Columns.DATE].dt.strftime("%Y-%m-%dT%H:%M:%S")
+    return df
+
+
+def iter_excel_input_files(input_file: str, engine='openpyxl', sheet_names: List[str] = None):
+    """
+    Parses the sheets one after the other, a sheet is only parsed when the generator is advanced.
+    :param sheet_names: sheets to read, all sheets if None
+    """
+    if engine == 'calamine':
+        sheets = _read_calamine_sheets(input_file, sheet_names)
+    else:
+        f = pd.ExcelFile(input_file, engine=engine)
+        sheet_names = f.sheet_names if sheet_names is None else sheet_names
+        sheets = ((sheet, f.parse(sheet, usecols=_is_input_column)) for sheet in sheet_names)
+    for sheet, df in sheets:
+        yield sheet, _select_input_columns(df)
+
+
+def read_excel_input_files(input_file: str, engine='openpyxl', sheet_names: List[str] = None):
+    return dict(iter_excel_input_files(input_file, engine, sheet_names))
+
+
+def _convert_calamine_cell(cell):
+    # integral numbers are read as int by openpyxl
+    if isinstance(cell, float) and cell.is_integer():
+        return int(cell)
+    return cell
+
+
+def _read_calamine_sheets(input_file: str, sheet_names: List[str] = None):
+    """
+    Reads the sheets with the Rust based calamine reader, which is much faster than openpyxl.
+    The cells are parsed by the same TextParser as in pandas.read_excel.
+    """
+    try:
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        raise ValueError("The excel engine 'calamine' requires the package python-calamine")
+    from pandas.io.parsers import TextParser
+    workbook = CalamineWorkbook.from_path(input_file)
+    for sheet in workbook.sheet_names if sheet_names is None else sheet_names:
+        rows = workbook.get_sheet_by_name(sheet).to_python(skip_empty_area=False)
+        rows = [[_convert_calamine_cell(cell) for cell in row] for row in rows]
+        if len(rows) == 0:
+            yield sheet, pd.DataFrame()
+        else:
+            yield sheet, TextParser(rows, header=0, usecols=_is_input_column).read()
+
+
+def iter_long_format_input_file(input_file: str, input_format, location_column=default_location_column):
+    def is_column(column):
+        return _is_input_column(column) or column == location_column
+
+    if input_format == 'parquet':
+        import pyarrow.parquet as pq
+        columns = [c for c in pq.read_schema(input_file).names if is_column(c)]
+        df = pd.read_parquet(input_file, columns=columns)
+    elif input_format == 'arrow':
+        import pyarrow.feather as feather
+        table = feather.read_table(input_file, memory_map=True)
+        df = table.select([c for c in table.column_names if is_column(c)]).to_pandas()
+    elif input_format == 'csv':
+        df = pd.read_csv(input_file, usecols=is_column)
+    else:
+        raise ValueError("Unknown input format: {}".format(input_format))
+    if location_column not in df:
+        raise ValueError("Column '{}' of the sample locations is missing in {}".format(location_column, input_file))
+    # the rows of each sample location are copied when it is processed, not all at once as by groupby
+    codes, sample_locations = pd.factorize(df.pop(location_column), sort=False)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(sample_locations) + 1))
+    for i, sample_location in enumerate(sample_locations):
+        measurements = df.iloc[order[bounds[i]:bounds[i + 1]]].reset_index(drop=True)
+        # the column types are inferred for each sample location as for the excel sheets
+        yield str(sample_location), _select_input_columns(measurements.infer_objects())
 
 
 def convert_sample_list2pandas(measurements: List[SewageSample]):
@@ -50,31 +202,289 @@ def convert_sample_list2pandas(measurements: List[SewageSample]):
     return table
 
 
-def detect_outliers(outlier_statistics, train_values, test_value, isFactor=False):
-    outlier_detected = []
-    if 'svm' in outlier_statistics or 'all' in outlier_statistics:
-        is_svm_outlier = is_oneClassSVM(test_value, train_values)
-        outlier_detected.append(is_svm_outlier)
-    if 'lof' in outlier_statistics or 'all' in outlier_statistics:
-        is_lof_outlier = is_outlier_local_outlier_factor(test_value, train_values)
-        outlier_detected.append(is_lof_outlier)
-    if 'rf' in outlier_statistics or 'all' in outlier_statistics:
-        is_isolation_forest_outlier, isolation_forest_score_ratio = is_outlier_isolation_forest(test_value, train_values)
-        outlier_detected.append(is_isolation_forest_outlier)
-    if 'ci' in outlier_statistics or 'all' in outlier_statistics:
-        is_confidence_interval_99_outlier, confidence_interval = is_confidence_interval_outlier(test_value, train_values, 0.99)
-        outlier_detected.append(is_confidence_interval_99_outlier)
-    if 'iqr' in outlier_statistics or 'all' in outlier_statistics:
-        is_iqr_outlier, iqr_range = interquartile_range(test_value, train_values, isFactor)
-        outlier_detected.append(is_iqr_outlier)
-    if 'zscore' in outlier_statistics or 'all' in outlier_statistics:
-        is_zscore_outlier, z_score_threshold = is_outlier_modified_z_score(test_value, train_values)
-        outlier_detected.append(is_zscore_outlier)
-    return all(outlier_detected)
-
-
-
-def is_outlier_local_outlier_factor(test_value: float, train_values: List[float], contamination='auto'):
+# outlier statistics in the order of evaluation: O(n) statistics first, model fits last
+outlier_statistics_order = ['iqr', 'zscore', 'ci', 'lof', 'svm', 'rf']
+model_based_outlier_statistics = ['lof', 'svm', 'rf']
+
+
+def fit_outlier_model(outlier_statistic, train_values):
+    """
+    Model or statistics of the training values used to decide if a value is an outlier.
+    """
+    if outlier_statistic == 'iqr':
+        return fit_interquartile_range(train_values)
+    if outlier_statistic == 'zscore':
+        return fit_modified_z_score(train_values)
+    if outlier_statistic == 'ci':
+        return fit_confidence_interval(train_values, 0.99)
+    if outlier_statistic == 'lof':
+        return LocalOutlierFactorModel(train_values)
+    if outlier_statistic == 'svm':
+        return fit_oneClassSVM(train_values)
+    if outlier_statistic == 'rf':
+        return fit_isolation_forest(train_values)
+    raise ValueError("Unknown outlier statistic '{}'".format(outlier_statistic))
+
+
+def is_outlier(outlier_statistic, train_values, test_value, isFactor=False, model=None) -> bool:
+    """
+    :param model: model of the training values from fit_outlier_model, fitted if not given
+    """
+    if outlier_statistic == 'iqr':
+        return interquartile_range(test_value, train_values, isFactor, model)[0]
+    if outlier_statistic == 'zscore':
+        return is_outlier_modified_z_score(test_value, train_values, model)[0]
+    if outlier_statistic == 'ci':
+        return is_confidence_interval_outlier(test_value, train_values, 0.99, model)[0]
+    if outlier_statistic == 'lof':
+        return is_outlier_local_outlier_factor(test_value, train_values, model=model)
+    if outlier_statistic == 'svm':
+        return is_oneClassSVM(test_value, train_values, model)
+    if outlier_statistic == 'rf':
+        return is_outlier_isolation_forest(test_value, train_values, model=model)[0]
+    raise ValueError("Unknown outlier statistic '{}'".format(outlier_statistic))
+
+
+class OutlierModelCache:
+    """
+    LRU cache of the fitted outlier models and statistics, keyed by the outlier statistic and a hash of the
+    training values. Consecutive measurements often share the same training window, e.g. measurements of the same
+    collection date or windows which did not change after outlier exclusion.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def set_max_size(self, max_size):
+        self.max_size = max_size
+        while len(self.models) > max(self.max_size, 0):
+            self.models.popitem(last=False)
+
+    @staticmethod
+    def get_window_key(train_values: np.ndarray):
+        return train_values.shape[0], hashlib.blake2b(train_values.tobytes(), digest_size=16).digest()
+
+    def get_model(self, outlier_statistic, window_key, train_values: np.ndarray) -> (object, bool):
+        """
+        Returns the model of the training values and if it was cached.
+        """
+        key = (outlier_statistic, window_key)
+        if key in self.models:
+            self.models.move_to_end(key)
+            self.hits += 1
+            return self.models[key], True
+        self.misses += 1
+        model = fit_outlier_model(outlier_statistic, train_values)
+        if self.max_size > 0:
+            self.models[key] = model
+            if len(self.models) > self.max_size:
+                self.models.popitem(last=False)
+        return model, False
+
+
+outlier_model_cache = OutlierModelCache()
+
+
+def detect_outliers(outlier_statistics, train_values, test_value, isFactor=False, sewageStat=None):
+    """
+    A value is an outlier if all selected statistics detect it as outlier. The statistics are evaluated cheapest first
+    and the evaluation stops at the first statistic that detects an inlier, so the models of the remaining statistics
+    are not fitted. Models are taken from the outlier model cache if the training values were seen before.
+
+    :param sewageStat: optional statistics to count the fitted, cached and avoided model fits
+    """
+    selected_statistics = [s for s in outlier_statistics_order if s in outlier_statistics or 'all' in outlier_statistics]
+    train_values = np.asarray(train_values, dtype=float)
+    window_key = OutlierModelCache.get_window_key(train_values)
+    for position, outlier_statistic in enumerate(selected_statistics):
+        model, is_cached = outlier_model_cache.get_model(outlier_statistic, window_key, train_values)
+        if sewageStat:
+            sewageStat.add_outlier_model_cache('hit' if is_cached else 'miss')
+            if outlier_statistic in model_based_outlier_statistics:
+                sewageStat.add_outlier_model_fit(outlier_statistic, 'cached' if is_cached else 'fitted')
+        if not is_outlier(outlier_statistic, train_values, test_value, isFactor, model):
+            if sewageStat:
+                for skipped_statistic in selected_statistics[position + 1:]:
+                    if skipped_statistic in model_based_outlier_statistics:
+                        sewageStat.add_outlier_model_fit(skipped_statistic, 'avoided')
+            return False
+    return True
+
+
+# LOF implementation used for contamination='auto': 'native' (1-D, see below) or 'sklearn'
+lof_backends = ['native', 'sklearn']
+lof_backend = 'native'
+# threshold of the LOF score for contamination='auto'
+lof_auto_offset = -1.5
+
+
+def set_lof_backend(backend):
+    global lof_backend
+    if backend not in lof_backends:
+        raise ValueError("Unknown LOF backend '{}'. Use one of: {}".format(backend, ", ".join(lof_backends)))
+    lof_backend = backend
+
+
+def _get_k_nearest_neighbors_1d(sorted_values: np.ndarray, queries: np.ndarray, positions: np.ndarray, k,
+                                exclude_query):
+    """
+    k nearest neighbors of one-dimensional queries in sorted values. In 1-D the neighbors are a block of consecutive
+    values around the position of the query, i.e. the result of moving two pointers outwards from the query and taking
+    the closer value (the left one on ties). Of the k + 1 possible blocks the first one is selected whose leftmost
+    value is not farther away than the next value right of the block.
+
+    :param positions: position of the query in the sorted values (insertion position if the query is no training value)
+    :param exclude_query: the queries are the sorted values themselves and are no neighbors of themselves
+    :return: positions and distances of the neighbors sorted by distance, and the positions of the next not selected
+             values left and right of the neighbors
+    """
+    n = sorted_values.shape[0]
+    window = k + 1 if exclude_query else k
+    starts = positions[:, np.newaxis] + np.arange(-k, 1)
+    ends = starts + window - 1
+    is_valid = (starts >= 0) & (ends < n)
+    is_closer_than_next = (ends + 1 >= n) | (queries[:, np.newaxis] - sorted_values[np.clip(starts, 0, n - 1)] <=
+                                             sorted_values[np.clip(ends + 1, 0, n - 1)] - queries[:, np.newaxis])
+    start = starts[np.arange(starts.shape[0]), np.argmax(is_valid & is_closer_than_next, axis=1)]
+    neighbors = start[:, np.newaxis] + np.arange(window)
+    if exclude_query:
+        neighbors = neighbors[neighbors != positions[:, np.newaxis]].reshape(-1, k)
+    distances = np.abs(sorted_values[neighbors] - queries[:, np.newaxis])
+    order = np.argsort(distances, axis=1, kind='stable')
+    neighbors = np.take_along_axis(neighbors, order, axis=1)
+    distances = np.take_along_axis(distances, order, axis=1)
+    return neighbors, distances, start - 1, start + window
+
+
+def _get_tied_k_nearest_neighbors(sorted_values: np.ndarray, queries: np.ndarray, next_left: np.ndarray,
+                                  next_right: np.ndarray, tolerance):
+    """
+    A not selected value next to the neighbors could have been selected instead of the selected value on the other
+    side of the neighbors if both have the same distance (e.g. x - d and x + d). scikit-learn breaks these ties
+    depending on the search algorithm.
+    :param tolerance: relative tolerance of near ties
+    :return: for each side if the next not selected value is tied, its position and the position of the selected value
+             on the other side
+    """
+    n = sorted_values.shape[0]
+    ties = []
+    for candidate, opposite in [(next_left, next_right - 1), (next_right, next_left + 1)]:
+        is_valid = (candidate >= 0) & (candidate < n)
+        candidate = np.clip(candidate, 0, n - 1)
+        candidate_value, opposite_value = sorted_values[candidate], sorted_values[opposite]
+        candidate_distance, opposite_distance = np.abs(queries - candidate_value), np.abs(queries - opposite_value)
+        is_tie = np.abs(candidate_distance - opposite_distance) * (candidate_distance + opposite_distance) <= \
+            tolerance * (queries * queries + candidate_value * candidate_value + opposite_value * opposite_value)
+        ties.append((is_valid & is_tie & (candidate_value != opposite_value), candidate, opposite))
+    return ties
+
+
+def fit_local_outlier_factor_1d(train_values: List[float]):
+    """
+    Local reachability densities of one-dimensional training values, identical to the fit of
+    LocalOutlierFactor(novelty=True) of scikit-learn with the same number of neighbours.
+    Returns None if the values can't be fitted.
+
+    :param train_values: values to be used for training the model
+    """
+    sorted_values = np.sort(np.asarray(train_values, dtype=float))
+    n = sorted_values.shape[0]
+    if n < 2 or np.isnan(sorted_values[-1]):
+        return None
+    k = 20 if n > 20 else n - 1
+    # scikit-learn uses brute force for k >= n / 2 which computes distances with rounding errors (|x|² - 2xy + |y|²),
+    # so near ties are ties as well; the kd tree computes exact distances
+    tolerance = 1e-12 if k >= n // 2 else 0
+    # neighbors of the training values without the value itself
+    neighbors, distances, next_left, next_right = _get_k_nearest_neighbors_1d(sorted_values, sorted_values, np.arange(n),
+                                                                              k, exclude_query=True)
+    k_distances = distances[:, -1]
+    local_reachability_densities = 1. / (np.mean(np.maximum(distances, k_distances[neighbors]), axis=1) + 1e-10)
+    # a tie only matters if the reachability distance of the tied values differs
+    is_ambiguous = np.zeros(n, dtype=bool)
+    for is_tie, candidate, opposite in _get_tied_k_nearest_neighbors(sorted_values, sorted_values, next_left, next_right,
+                                                                     tolerance):
+        is_ambiguous |= is_tie & (np.maximum(distances[:, -1], k_distances[candidate]) !=
+                                  np.maximum(distances[:, -1], k_distances[opposite]))
+    return dict(sorted_values=sorted_values, k=k, tolerance=tolerance, k_distances=k_distances,
+                local_reachability_densities=local_reachability_densities, is_ambiguous=is_ambiguous)
+
+
+def get_local_outlier_factor_score_1d(test_value: float, train_values: List[float], model: dict = None):
+    """
+    Local Outlier Factor score of one value for one-dimensional training values, identical to
+    LocalOutlierFactor(novelty=True).score_samples of scikit-learn with the same number of neighbours.
+    Returns None if the result depends on how scikit-learn breaks ties between neighbors.
+
+    :param test_value: the value to be scored
+    :param train_values: values to be used for training the model
+    :param model: model of the training values from fit_local_outlier_factor_1d, fitted if not given
+    """
+    if model is None:
+        model = fit_local_outlier_factor_1d(train_values)
+        if model is None:
+            return None
+    sorted_values, k, tolerance = model['sorted_values'], model['k'], model['tolerance']
+    k_distances, is_ambiguous = model['k_distances'], model['is_ambiguous']
+    local_reachability_densities = model['local_reachability_densities']
+    # neighbors of the test value
+    test_values = np.array([test_value], dtype=float)
+    test_neighbors, test_distances, test_next_left, test_next_right = \
+        _get_k_nearest_neighbors_1d(sorted_values, test_values, np.searchsorted(sorted_values, test_values), k,
+                                    exclude_query=False)
+    if np.any(is_ambiguous[test_neighbors]):
+        return None
+    for is_tie, candidate, opposite in _get_tied_k_nearest_neighbors(sorted_values, test_values, test_next_left,
+                                                                     test_next_right, tolerance):
+        if np.any(is_tie & ((np.maximum(test_distances[:, -1], k_distances[candidate]) !=
+                             np.maximum(test_distances[:, -1], k_distances[opposite])) |
+                            (local_reachability_densities[candidate] != local_reachability_densities[opposite]) |
+                            is_ambiguous[candidate])):
+            return None
+    test_local_reachability_density = 1. / (np.mean(np.maximum(test_distances, k_distances[test_neighbors]), axis=1) + 1e-10)
+    local_reachability_ratios = local_reachability_densities[test_neighbors] / test_local_reachability_density[:, np.newaxis]
+    return -np.mean(local_reachability_ratios, axis=1)[0]
+
+
+class LocalOutlierFactorModel:
+    """
+    Local outlier factor fitted on one training window. The native and the scikit-learn model are fitted on first use,
+    the scikit-learn model is only needed for the sklearn backend or if the native result is ambiguous.
+    """
+
+    def __init__(self, train_values: List[float], contamination='auto'):
+        self.train_values = np.array(train_values, dtype=float)
+        self.contamination = contamination
+        self.__native_model = None
+        self.__is_native_model_fitted = False
+        self.__sklearn_model = None
+
+    def get_native_model(self):
+        if not self.__is_native_model_fitted:
+            self.__native_model = fit_local_outlier_factor_1d(self.train_values)
+            self.__is_native_model_fitted = True
+        return self.__native_model
+
+    def get_sklearn_model(self) -> 'LocalOutlierFactor':
+        if self.__sklearn_model is None:
+            from sklearn.neighbors import LocalOutlierFactor
+            X = np.array(self.train_values).reshape(-1, 1)
+            neighbours = 20 if len(X) > 20 else len(X) - 1
+            self.__sklearn_model = LocalOutlierFactor(n_neighbors=neighbours, novelty=True, contamination=self.contamination,
+                                                      n_jobs=1).fit(X)
+        return self.__sklearn_model
+
+
+def is_outlier_local_outlier_factor(test_value: float, train_values: List[float], contamination='auto',
+                                    model: LocalOutlierFactorModel = None):
     """
     The Local Outlier Factor measures the local deviation of the density of a given sample with respect to its neighbors.
     It is local in that the anomaly score depends on how isolated the object is with respect to the surrounding neighborhood.
@@ -85,31 +495,58 @@ def is_outlier_local_outlier_factor(test_value: float, train_values: List[float]
     :param test_value: the value to be checked as an outlier
     :param train_values: values to be used for training the model
     :param contamination:  the amount of contamination, i.e. the proportion of outliers in the data set. Range should be: (0, 0.5]
+    :param model: model fitted on the training values, fitted if not given
     """
-    X = np.array(train_values).reshape(-1, 1)
-    neighbours = 20 if len(X) > 20 else len(X) - 1
-    lof_novelty = LocalOutlierFactor(n_neighbors=neighbours, novelty=True, contamination=contamination, n_jobs=1).fit(X)
+    if model is None:
+        model = LocalOutlierFactorModel(train_values, contamination)
+    if lof_backend == 'native' and contamination == 'auto':
+        native_model = model.get_native_model()
+        if native_model is not None:
+            score = get_local_outlier_factor_score_1d(test_value, train_values, native_model)
+            # scikit-learn decides in case the score is too close to the threshold
+            if score is not None and abs(score - lof_auto_offset) > 1e-6:
+                return score - lof_auto_offset < 0
+    lof_novelty = model.get_sklearn_model()
     test_value = np.array(test_value).reshape(1, -1)
     prediction = lof_novelty.predict(test_value)
     return prediction[0] == -1
 
 
-def is_oneClassSVM(test_value: float, train_values: List[float]):
+def fit_oneClassSVM(train_values: List[float]) -> 'OneClassSVM':
+    from sklearn.svm import OneClassSVM
+    model = OneClassSVM(nu=0.1, kernel="rbf", gamma=0.2)
+    model.fit(np.array(train_values).reshape(-1, 1))
+    return model
+
+
+def is_oneClassSVM(test_value: float, train_values: List[float], model: 'OneClassSVM' = None):
     """
     One-class SVM with non-linear kernel (RBF). One-class SVM is an unsupervised algorithm
     that learns a decision function for novelty detection: classifying new data as similar or different to the training set.
     :param test_value: the value to be checked as an outlier
     :param train_values: values to be used for training the model
+    :param model: model fitted on the training values, fitted if not given
     """
-    model = OneClassSVM(nu=0.1, kernel="rbf", gamma=0.2)
-    model.fit(np.array(train_values).reshape(-1, 1))
+    if model is None:
+        model = fit_oneClassSVM(train_values)
     prediction = model.predict(np.array(test_value).reshape(-1, 1))   #1 = inlier;  -1 : outlier
     print(prediction)
     if prediction[0] == 1:
         return False
     return True
 
-def is_outlier_isolation_forest(test_value: float, train_values: List[float], contamination=0.1):
+def fit_isolation_forest(train_values: List[float], contamination=0.1) -> 'IsolationForest':
+    from sklearn.ensemble import IsolationForest
+    X = pd.DataFrame(train_values)
+    X.rename(columns={X.columns[0]: 'samples'}, inplace=True)
+    model = IsolationForest(n_estimators=100, warm_start=False, contamination=contamination,
+                            n_jobs=1)  # contamination="auto" else range should be (0, 0.5]
+    model.fit(X.values)
+    return model
+
+
+def is_outlier_isolation_forest(test_value: float, train_values: List[float], contamination=0.1,
+                                model: 'IsolationForest' = None):
     """
     The IsolationForest ‘isolates’ observations by randomly selecting a feature and then randomly selecting a
     split value between the maximum and minimum values of the selected feature. Since recursive partitioning can be
@@ -122,32 +559,40 @@ def is_outlier_isolation_forest(test_value: float, train_values: List[float], co
     :param test_value: the value to be checked as an outlier
     :param train_values: values to be used for training the model
     :param contamination:  the amount of contamination, i.e. the proportion of outliers in the data set. Range should be: (0, 0.5]
+    :param model: model fitted on the training values, fitted if not given
     """
-    X = pd.DataFrame(train_values)
-    X.rename(columns={X.columns[0]: 'samples'}, inplace=True)
-    model = IsolationForest(n_estimators=100, warm_start=False, contamination=contamination,
-                            n_jobs=1)  # contamination="auto" else range should be (0, 0.5]
-    model.fit(X.values)
+    if model is None:
+        model = fit_isolation_forest(train_values, contamination)
     test = np.array(test_value).reshape(1, -1)
     score = model.decision_function(test)
     outlier = model.predict(test)
     return outlier[0] == -1, score
 
 
-def is_outlier_modified_z_score(test_value: float, train_values: List[float]):
+def fit_modified_z_score(train_values: List[float]):
     train_values = train_values.tolist()
     median = np.median(train_values)
     abs_diff = np.abs(train_values - median)
     median_abs_diff = np.median(abs_diff)
+    return median, median_abs_diff
+
+
+def is_outlier_modified_z_score(test_value: float, train_values: List[float], median_and_abs_diff=None):
+    median, median_abs_diff = median_and_abs_diff if median_and_abs_diff else fit_modified_z_score(train_values)
     modified_zscore = 0.6745 * ((test_value - median) / median_abs_diff)
     max_standard_deviation = 3.5  # how many std deviations; good value
     return modified_zscore > max_standard_deviation, modified_zscore
 
 
-def interquartile_range(test_value: float, train_values: List[float], isFactor=False):
+def fit_interquartile_range(train_values: List[float]):
     train_values = train_values.tolist()
     q1 = np.quantile(train_values, 0.25)
     q3 = np.quantile(train_values, 0.75)
+    return q1, q3
+
+
+def interquartile_range(test_value: float, train_values: List[float], isFactor=False, quartiles=None):
+    q1, q3 = quartiles if quartiles else fit_interquartile_range(train_values)
     iqr = q3 - q1
     # calculation for multiplier selection based on the standard deviation
     # std_dev = 3.5
@@ -163,7 +608,8 @@ def interquartile_range(test_value: float, train_values: List[float], isFactor=F
     return True, (minimum, maximum)
 
 
-def is_confidence_interval_outlier(test_value: float, train_values: List[float], confidence: float):
+def fit_confidence_interval(train_values: List[float], confidence: float):
+    import scipy.stats as st
     train_values = train_values.tolist()
     if len(train_values) < 30:  # use t-distribution in case less than 30 samples are used
         confidence_interval = st.t.interval(alpha=confidence, df=len(train_values) - 1,
@@ -173,6 +619,13 @@ def is_confidence_interval_outlier(test_value: float, train_values: List[float],
         confidence_interval = st.norm.interval(alpha=confidence,
                                                loc=np.mean(train_values),
                                                scale=st.sem(train_values))
+    return confidence_interval
+
+
+def is_confidence_interval_outlier(test_value: float, train_values: List[float], confidence: float,
+                                   confidence_interval=None):
+    if confidence_interval is None:
+        confidence_interval = fit_confidence_interval(train_values, confidence)
     if confidence_interval[0] <= test_value <= confidence_interval[1]:
         return False, confidence_interval
     return True, confidence_interval
@@ -204,28 +657,27 @@ def get_last_values(measurements_df: pd.DataFrame, index, column_name,
     return last_values
 
 
-def get_last_N_month_and_days(measurements_df: pd.DataFrame, current_measurement, column_name, num_month, num_days,
-                              sewage_flag: SewageFlag = None, additional_sewage_flag: SewageFlag = None):
+def get_last_N_month_and_days(measurements_df: pd.DataFrame, index, column_name, num_month, num_days,
+                              sewage_flag: SewageFlag = None, additional_sewage_flag: SewageFlag = None,
+                              window_index: WindowIndex = None):
     """
     Obtain last values from last N month from the data frame. In case a flag is provided values that do have the flag set
     will be filtered.
 
-    :param measurements_df: full data frame ot select last values
-    :param current_measurement: current value
+    :param measurements_df: full data frame ot select last values, sorted by collection date
+    :param index: index of current measurement
     :param column_name: remove NA from selected column
     :param num_month: number of last month to select values
     :param num_days: number of last days to select values
     :param sewage_flag: Sewage flag to filter for previous outliers; must be not set in flags
     :param additional_sewage_flag: Additional Sewage flag to filter for previous outliers; must be not set in flags
+    :param window_index: window index shared by the stages; a temporary one is built if not given
     :return: data frame with entries from last N month
     """
-    min_date = current_measurement[Columns.DATE]
-    if num_month > 0:
-        min_date = min_date + dateutil.relativedelta.relativedelta(months=-num_month)
-    if num_days > 0:
-        min_date = min_date + dateutil.relativedelta.relativedelta(days=-num_days)
-    last_values = measurements_df[(measurements_df[Columns.DATE] >= min_date) &
-                                  (measurements_df[Columns.DATE] < current_measurement[Columns.DATE])]
+    if window_index is None:
+        window_index = WindowIndex()
+    start, end = window_index.get(measurements_df).calendar_window(index, num_month, num_days)
+    last_values = measurements_df.iloc[start:end]
     # remove outliers based on sewage_flag -> filters values which do not have the flag
     if sewage_flag:
         last_values = last_values[SewageFlag.is_not_flag_set_for_series(last_values[CalculatedColumns.FLAG.value], sewage_flag)]
@@ -281,11 +733,29 @@ class CustomFormatter(logging.Formatter):
         return formatter.format(record)
 
 
+class LogRecordBuffer(logging.Handler):
+    """
+    Collects log records instead of emitting them. Used inside worker processes so that the records
+    can be send back to the main process and replayed in a stable order.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
 class SewageLogger:
     _instance = None
     log = None
     verbosity = None
     quiet = None
+    buffer = None
 
     def __init__(self, output_folder, verbosity=None, quiet=False):
         self.output_folder = os.path.join(output_folder, "logs")
@@ -328,5 +798,25 @@ class SewageLogger:
         logger.addHandler(file_handler)
         return logger
 
+    def capture_records(self):
+        """
+        Redirect all log records into a buffer instead of the console and the log file.
+        """
+        for handler in list(self.log.handlers):
+            self.log.removeHandler(handler)
+        self.buffer = LogRecordBuffer()
+        self.log.addHandler(self.buffer)
+        self.log.setLevel(logging.DEBUG)
+
+    def pop_captured_records(self) -> []:
+        records = self.buffer.records
+        self.buffer.records = []
+        return records
+
+    def replay(self, records: []):
+        for record in records:
+            self.log.handle(record)
+
     def get_progress_bar(self, total, text):
-        return tqdm.tqdm(total=total, unit=' samples', colour="blue", ncols=100, desc=text, file=sys.stdout)
+        return tqdm.tqdm(total=total, unit=' samples', colour="blue", ncols=100, desc=text, file=sys.stdout,
+                         disable=self.buffer is not None)
@@ -4,17 +4,18 @@ from .constant import *
 import math
 from .utils import *
 from .statistics import *
-from .plotting import *
 
 
 class WaterQuality:
     def __init__(self, output_folder, sewageStat: SewageStat, water_quality_number_of_last_month,
-                 min_number_of_last_measurements_for_water_qc, water_qc_outlier_statistics):
+                 min_number_of_last_measurements_for_water_qc, water_qc_outlier_statistics,
+                 window_index: WindowIndex = None):
         self.output_folder = output_folder
         self.sewageStat = sewageStat
         self.water_quality_number_of_last_month = water_quality_number_of_last_month
         self.min_number_of_last_measurements_for_water_qc = min_number_of_last_measurements_for_water_qc
         self.water_qc_outlier_statistics = water_qc_outlier_statistics
+        self.window_index = window_index if window_index else WindowIndex()
         self.logger = SewageLogger(self.output_folder)
 
     def check_water_quality(self, sample_location, measurements: pd.DataFrame, index):
@@ -23,15 +24,17 @@ class WaterQuality:
 
     def __detect_outliers_in_ammonium(self, sample_location, measurements: pd.DataFrame, index):
         current_measurement = measurements.iloc[index]
-        last_values = get_last_N_month_and_days(measurements, current_measurement, Columns.AMMONIUM,
-                                       self.water_quality_number_of_last_month, 0, SewageFlag.AMMONIUM_OUTLIER)
+        last_values = get_last_N_month_and_days(measurements, index, Columns.AMMONIUM,
+                                       self.water_quality_number_of_last_month, 0, SewageFlag.AMMONIUM_OUTLIER,
+                                       window_index=self.window_index)
         enough_last_values = last_values.shape[0] >= self.min_number_of_last_measurements_for_water_qc
         if current_measurement[Columns.AMMONIUM] and not math.isnan(current_measurement[Columns.AMMONIUM]):  # only if current value is not empty
             if not enough_last_values:
                 self.sewageStat.add_water_quality_outlier("Ammonium", 'skipped')
                 SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value, SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES)
             else:
-                is_outlier = detect_outliers(self.water_qc_outlier_statistics, last_values[Columns.AMMONIUM], current_measurement[Columns.AMMONIUM])
+                is_outlier = detect_outliers(self.water_qc_outlier_statistics, last_values[Columns.AMMONIUM], current_measurement[Columns.AMMONIUM],
+                                             sewageStat=self.sewageStat)
                 if is_outlier:
                     SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value, SewageFlag.AMMONIUM_OUTLIER)
                     self.sewageStat.add_water_quality_outlier("Ammonium", 'failed')
@@ -43,15 +46,17 @@ class WaterQuality:
 
     def __detect_outliers_in_conductivity(self, sample_location, measurements: pd.DataFrame, index):
         current_measurement = measurements.iloc[index]
-        last_values = get_last_N_month_and_days(measurements, current_measurement, Columns.CONDUCTIVITY,
-                                       self.water_quality_number_of_last_month, 0, SewageFlag.CONDUCTIVITY_OUTLIER)
+        last_values = get_last_N_month_and_days(measurements, index, Columns.CONDUCTIVITY,
+                                       self.water_quality_number_of_last_month, 0, SewageFlag.CONDUCTIVITY_OUTLIER,
+                                       window_index=self.window_index)
         enough_last_values = last_values.shape[0] >= self.min_number_of_last_measurements_for_water_qc
         if current_measurement[Columns.CONDUCTIVITY] and not math.isnan(current_measurement[Columns.CONDUCTIVITY]):  # only if current value is not empty
             if not enough_last_values:
                 self.sewageStat.add_water_quality_outlier("Conductivity", 'skipped')
                 SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value, SewageFlag.NOT_ENOUGH_CONDUCTIVITY_VALUES)
             else:
-                is_outlier = detect_outliers(self.water_qc_outlier_statistics, last_values[Columns.CONDUCTIVITY], current_measurement[Columns.CONDUCTIVITY])
+                is_outlier = detect_outliers(self.water_qc_outlier_statistics, last_values[Columns.CONDUCTIVITY], current_measurement[Columns.CONDUCTIVITY],
+                                             sewageStat=self.sewageStat)
                 if is_outlier:
                     SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value, SewageFlag.CONDUCTIVITY_OUTLIER)
                     self.sewageStat.add_water_quality_outlier("Conductivity", 'failed')
@@ -0,0 +1,89 @@
+# Created by alex at 18.10.26
+import numpy as np
+import pandas as pd
+from .constant import *
+
+
+class WindowIndex:
+    """
+    Start and end positions of the previous measurements of each row of a sample location. The windows are computed
+    once per sample location with a binary search on the collection dates, so every stage can slice the previous
+    measurements instead of comparing the dates of the whole data frame for every row.
+    The measurements have to be sorted by collection date (done in the setup of ssqn.py).
+    All windows end right before the first measurement of the current collection date.
+    """
+
+    def __init__(self):
+        self.measurements = None
+        self.dates = None
+        self.__windows = dict()
+
+    def __getstate__(self):
+        # windows are rebuilt for each sample location, don't ship them to worker processes
+        state = self.__dict__.copy()
+        state['measurements'] = None
+        state['dates'] = None
+        state['_WindowIndex__windows'] = dict()
+        return state
+
+    def get(self, measurements: pd.DataFrame) -> 'WindowIndex':
+        """
+        Returns the index for the given measurements. It is rebuilt if the measurements of another location are given.
+        """
+        if measurements is not self.measurements or measurements.shape[0] != self.dates.shape[0]:
+            dates = measurements[Columns.DATE].to_numpy(dtype='datetime64[ns]')
+            valid_dates = dates[~np.isnat(dates)]
+            if np.any(valid_dates[1:] < valid_dates[:-1]):
+                raise ValueError("Measurements have to be sorted by '{}' to build the window index".format(Columns.DATE))
+            self.measurements = measurements
+            self.dates = dates
+            self.__windows = dict()
+        return self
+
+    def __get_ends(self) -> np.ndarray:
+        if 'end' not in self.__windows:
+            ends = np.searchsorted(self.dates, self.dates, side='left')
+            # a measurement without collection date has no previous measurements
+            ends[np.isnat(self.dates)] = 0
+            self.__windows['end'] = ends
+        return self.__windows['end']
+
+    def count_window(self, index, max_number) -> (int, int):
+        """
+        Positions of the last max_number + 1 measurements before the current one, independent of the dates.
+        """
+        key = ('count', max_number)
+        if key not in self.__windows:
+            positions = np.arange(self.dates.shape[0])
+            self.__windows[key] = (np.maximum(positions - 1 - max_number, 0), positions)
+        starts, ends = self.__windows[key]
+        return int(starts[index]), int(ends[index])
+
+    def calendar_window(self, index, num_month=0, num_days=0, include_start=True) -> (int, int):
+        """
+        Positions of all measurements within the last N month and days before the current collection date.
+        :param include_start: measurements at the start date are part of the window, otherwise only later ones
+                              (day precision)
+        """
+        key = ('calendar', num_month, num_days, include_start)
+        if key not in self.__windows:
+            min_dates = pd.DatetimeIndex(self.dates)
+            if num_month > 0:
+                min_dates = min_dates - pd.DateOffset(months=num_month)
+            if num_days > 0:
+                min_dates = min_dates - pd.DateOffset(days=num_days)
+            if include_start:
+                starts = np.searchsorted(self.dates, min_dates.to_numpy(), side='left')
+            else:
+                starts = np.searchsorted(self.dates, min_dates.normalize().to_numpy(), side='right')
+            ends = self.__get_ends()
+            starts = np.minimum(starts, ends)
+            self.__windows[key] = (starts, ends)
+        starts, ends = self.__windows[key]
+        return int(starts[index]), int(ends[index])
+
+    def history_window(self, index) -> (int, int):
+        """
+        Positions of all measurements before the current collection date.
+        """
+        return 0, int(self.__get_ends()[index])
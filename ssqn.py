@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import copy
 import itertools
+import collections
 import argparse
 import pickle
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 
 
-from matplotlib.backends.backend_pdf import PdfPages
 from lib.config import Config
 from lib.constant import *
 from lib.biomarkerQC import BiomarkerQC
@@ -17,9 +20,13 @@ from lib.surrogatevirusQC import SurrogateVirusQC
 from lib.water_quality import WaterQuality
 from lib.sewage_flow import SewageFlow
 from lib.normalization import SewageNormalization
+from lib.columnar import ColumnarQualityControl
+from lib.window_index import WindowIndex
+from lib.invalidation import InvalidationPlanner
+from lib.input_cache import InputCache
+from lib.plot_stage import PlotStage, is_plot_generated
 import lib.utils as utils
 import lib.statistics as sewageStat
-import lib.plotting as plotting
 import lib.database as db
 
 import re
@@ -34,16 +41,30 @@ class SewageQuality:
                  water_quality_number_of_last_month, min_number_of_last_measurements_for_water_qc, water_qc_outlier_statistics,
                  fraction_last_samples_for_dry_flow, min_num_samples_for_mean_dry_flow, heavy_precipitation_factor,
                  mean_sewage_flow_below_typo_factor, mean_sewage_flow_above_typo_factor, min_number_of_biomarkers_for_normalization,
-                 base_reproduction_value_factor, num_previous_days_reproduction_factor, max_number_of_flags_for_outlier
-                  ):
+                 base_reproduction_value_factor, num_previous_days_reproduction_factor, max_number_of_flags_for_outlier,
+                 jobs=1, engine='pandas', lof_backend='native', outlier_model_cache_size=256, input_format='auto',
+                 excel_engine='openpyxl', location_column=utils.default_location_column, use_input_cache=True,
+                 memory_report=False, database_path=None, database_backend='files', partition_by_year=False,
+                 plot_jobs=1, use_plot_cache=True, fast_plots=False):
 
         self.input_file = input_file
+        self.input_format = input_format
+        self.excel_engine = excel_engine
+        self.location_column = location_column
+        self.use_input_cache = use_input_cache
+        self.memory_report = sewageStat.MemoryReport() if memory_report else None
+        self.database_path = database_path
+        self.database_backend = database_backend
+        self.partition_by_year = partition_by_year
         self.sewage_samples = None
         self.output_folder = output_folder
         self.verbosity = verbosity
         self.quiet = quiet
         self.rerun_all = rerun_all
         self.no_plots = no_plots
+        self.plot_jobs = plot_jobs
+        self.use_plot_cache = use_plot_cache
+        self.fast_plots = fast_plots
         # biomarker qc
         self.biomarker_outlier_statistics = biomarker_outlier_statistics
         self.min_biomarker_threshold = min_biomarker_threshold
@@ -69,34 +90,61 @@ class SewageQuality:
         self.base_reproduction_value_factor = base_reproduction_value_factor
         self.num_previous_days_reproduction_factor = num_previous_days_reproduction_factor
         self.max_number_of_flags_for_outlier = max_number_of_flags_for_outlier
+        self.jobs = jobs
+        self.engine = engine
+        self.lof_backend = lof_backend
+        self.outlier_model_cache_size = outlier_model_cache_size
         self.sewageStat = sewageStat.SewageStat()
+        self.location_statistics = dict()
         self.logger = utils.SewageLogger(self.output_folder, verbosity=verbosity, quiet=quiet)
         self.__load_data()
         self.__initialize()
 
     def __load_data(self):
-        if self.input_file:
-            self.sewage_samples_dict = utils.read_excel_input_files(self.input_file)
         self.sewage_plants2trockenwetterabfluss = dict()
 
+    def __iter_sewage_samples(self):
+        """
+        Reads the sample locations one after the other, thus only the measurements of the sample locations in
+        process are held in memory.
+        """
+        input_format = utils.get_input_format(self.input_file) if self.input_format == 'auto' else self.input_format
+        if input_format == 'excel' and self.use_input_cache:
+            input_cache = InputCache(self.output_folder)
+            yield from input_cache.iter_excel_input_files(self.input_file, self.excel_engine)
+            self.logger.log.debug("{} sheets loaded from the input cache, {} sheets parsed".format(input_cache.hits,
+                                                                                                  input_cache.misses))
+        else:
+            yield from utils.iter_input_files(self.input_file, input_format, self.excel_engine, self.location_column)
+
     def __initialize(self):
         if not os.path.exists(self.output_folder):
             os.makedirs(self.output_folder)
-        self.database = db.SewageDatabase()
+        self.database = db.SewageDatabase(self.database_path, self.database_backend, self.partition_by_year)
+        utils.set_lof_backend(self.lof_backend)
+        utils.outlier_model_cache.set_max_size(self.outlier_model_cache_size)
+        self.window_index = WindowIndex()
         self.biomarkerQC = BiomarkerQC(self.output_folder, self.sewageStat, self.biomarker_outlier_statistics, self.min_biomarker_threshold,
                                   self.min_number_biomarkers_for_outlier_detection,
                                   self.max_number_biomarkers_for_outlier_detection,
-                                  self.report_number_of_biomarker_outlier)
+                                  self.report_number_of_biomarker_outlier, self.window_index)
         self.water_quality = WaterQuality(self.output_folder, self.sewageStat, self.water_quality_number_of_last_month,
-                                          self.min_number_of_last_measurements_for_water_qc, self.water_qc_outlier_statistics)
+                                          self.min_number_of_last_measurements_for_water_qc, self.water_qc_outlier_statistics,
+                                          self.window_index)
         self.sewage_flow = SewageFlow(self.output_folder, self.sewageStat, self.sewage_plants2trockenwetterabfluss,
                                       self.fraction_last_samples_for_dry_flow, self.min_num_samples_for_mean_dry_flow,
-                                      self.heavy_precipitation_factor, self.mean_sewage_flow_below_typo_factor, self.mean_sewage_flow_above_typo_factor)
+                                      self.heavy_precipitation_factor, self.mean_sewage_flow_below_typo_factor, self.mean_sewage_flow_above_typo_factor,
+                                      self.window_index)
         self.surrogateQC = SurrogateVirusQC(self.sewageStat, self.periode_month_surrogatevirus,
                                      self.min_number_surrogatevirus_for_outlier_detection,
-                                     self.biomarker_outlier_statistics, self.output_folder)
+                                     self.biomarker_outlier_statistics, self.output_folder, self.window_index)
         self.sewageNormalization = SewageNormalization(self.sewageStat, self.max_number_of_flags_for_outlier, self.min_number_of_biomarkers_for_normalization,
-                                                       self.base_reproduction_value_factor, self.num_previous_days_reproduction_factor, self.output_folder)
+                                                       self.base_reproduction_value_factor, self.num_previous_days_reproduction_factor, self.output_folder,
+                                                       self.window_index)
+        self.columnarQC = ColumnarQualityControl(self.biomarkerQC, self.surrogateQC, self.sewage_flow, self.water_quality,
+                                                 self.sewageNormalization)
+        self.invalidation_planner = InvalidationPlanner(self.biomarkerQC, self.surrogateQC, self.sewage_flow,
+                                                        self.water_quality, self.sewageNormalization)
 
 
 
@@ -165,107 +213,348 @@ class SewageQuality:
         # Sort by collection date. Newest last.
         measurements.sort_values(by= Columns.DATE, ascending=True, inplace=True, ignore_index=True)
         self.__initalize_columns(measurements)
-        self.database.needs_recalcuation(sample_location, measurements, self.rerun_all)
+        previous_measurements, removed_dates = self.database.needs_recalcuation(sample_location, measurements, self.rerun_all)
+        self.invalidation_planner.plan(measurements, previous_measurements, removed_dates)
         return plausibility_dict, measurements
 
-    def __is_plot_not_generated(self, sample_location):
-        return not os.path.exists(os.path.join(self.output_folder, "plots", "{}.plots.pdf".format(sample_location.replace("/", "_"))))
-
-    def __plot_results(self, measurements: pd.DataFrame, sample_location):
-        if not os.path.exists(os.path.join(self.output_folder, "plots")):
-            os.makedirs(os.path.join(self.output_folder, "plots"))
-        pdf_pages = PdfPages(os.path.join(self.output_folder, "plots", "{}.plots.pdf".format(sample_location.replace("/", "_"))))
-        plotting.plot_biomarker_outlier_summary(pdf_pages, measurements, sample_location, self.biomarker_outlier_statistics)
-        plotting.plot_surrogatvirus(pdf_pages, measurements, sample_location, self.surrogatevirus_outlier_statistics)
-        plotting.plot_sewage_flow(pdf_pages, measurements, sample_location)
-        plotting.plot_water_quality(pdf_pages, measurements, sample_location, self.water_qc_outlier_statistics)
-        plotting.plot_biomarker_normalization(pdf_pages, measurements, sample_location)
-        plotting.plot_general_outliers(pdf_pages, measurements, sample_location)
-        pdf_pages.close()
-
     def run_quality_control(self):
         """
         Main method to run the quality checks and normalization
         """
-        for idx, (sample_location, measurements) in enumerate(self.sewage_samples_dict.items()):
-            self.logger.log.info("\n####################################################\n"
-                                 "\tSewage location: {} "
-                                 "\n####################################################".format(sample_location))
-            plausibility_dict, measurements = self.__setup(sample_location, measurements)
-            ### Plausibilitätscheck: dict with the index of the odd values
-            if len(plausibility_dict) > 0:
-                self.logger.log.info("Check date filed:{}".format(plausibility_dict))
-            self.logger.log.info("{}/{} new measurements to analyze".format(CalculatedColumns.get_num_of_unprocessed(measurements),
-                                                                            measurements.shape[0]))
-            progress_bar = self.logger.get_progress_bar(CalculatedColumns.get_num_of_unprocessed(measurements), "Analyzing samples")
-            self.sewageStat.set_sample_location_and_total_number(sample_location, CalculatedColumns.get_num_of_unprocessed(measurements))
-            changes_detected = False
-            for index, current_measurement in measurements.iterrows():
-                if CalculatedColumns.needs_processing(current_measurement):
-                    changes_detected = True
-                    progress_bar.update(1)
-                    # -----------------  BIOMARKER QC -----------------------
-                    # 1. check for comments. Flag samples that contain any commentary.
-                    self.biomarkerQC.check_comments(sample_location, measurements, index)
-                    self.biomarkerQC.check_mean_sewage_flow_present(sample_location, measurements, index)
-                    # 2. Mark biomarker values below threshold which are excluded from the analysis.
-                    self.biomarkerQC.biomarker_below_threshold_or_empty(sample_location, measurements, index)
-                    # 3. Calculate pairwise biomarker values if biomarkers were not marked to be below threshold.
-                    self.biomarkerQC.calculate_biomarker_ratios(sample_location, measurements, index)
-                    # 4. Detect outliers
-                    self.biomarkerQC.detect_outliers(sample_location, measurements, index)
-                    # 5. Assign biomarker outliers based on ratio outliers
-                    self.biomarkerQC.assign_biomarker_outliers_based_on_ratio_flags(sample_location, measurements, index)
-                    self.biomarkerQC.analyze_usable_biomarkers(sample_location, measurements, index)
-                    # 6. Create report in case the last two biomarkers were identified as outliers
-                    # self.biomarkerQC.report_last_biomarkers_invalid(sample_location, measurements)
-
-                    # --------------------  SUROGATVIRUS QC -------------------
-                    self.surrogateQC.filter_dry_days_time_frame(sample_location, measurements, index)
-                    self.surrogateQC.is_surrogatevirus_outlier(sample_location, measurements, index)
-
-                    # --------------------  SEWAGE FLOW -------------------
-                    self.sewage_flow.sewage_flow_quality_control(sample_location, measurements, index)
-
-                    # --------------------  WATER QUALITY -------------------
-                    self.water_quality.check_water_quality(sample_location, measurements, index)
-
-                    # --------------------  NORMALIZATION -------------------
-                    self.sewageNormalization.normalize_biomarker_values(sample_location, measurements, index)
-
-                    # --------------------  MARK OUTLIERS FROM ALL STEPS -------------------
-                    self.sewageNormalization.decide_biomarker_usable_based_on_flags(sample_location, measurements, index)
-            progress_bar.close()
+        with PlotStage(self.output_folder, self.logger, self.database_path, self.database_backend,
+                       self.partition_by_year, self.biomarker_outlier_statistics,
+                       self.surrogatevirus_outlier_statistics, self.water_qc_outlier_statistics,
+                       self.plot_jobs, use_cache=self.use_plot_cache, fast=self.fast_plots) as plot_stage:
+            if self.jobs > 1:
+                self.__run_quality_control_parallel(plot_stage)
+            else:
+                for sample_location, measurements in self.__iter_sewage_samples():
+                    if self.process_sample_location(sample_location, measurements):
+                        plot_stage.submit(sample_location)
+                    self.location_statistics[sample_location] = copy.deepcopy(self.sewageStat)
+        if self.memory_report is not None:
+            self.logger.log.info(self.memory_report.print_report())
+            self.memory_report.write(os.path.join(self.output_folder, "memory_report.tsv"))
+
+    def __run_quality_control_parallel(self, plot_stage: PlotStage):
+        """
+        Distributes the sample locations over a process pool. Log records and statistics of each location are
+        collected in the workers and merged back in the order of the input, thus the output equals a serial run.
+        At most two sample locations per worker are read ahead, thus the memory is bounded for large inputs.
+        The plots of a sample location are submitted to the plot stage when its results are merged.
+        """
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_initialize_worker, initargs=(self,)) as executor:
+            futures = collections.deque()
+            for sample_location, measurements in self.__iter_sewage_samples():
+                futures.append(executor.submit(_process_sample_location_in_worker, sample_location, measurements))
+                if len(futures) >= 2 * self.jobs:
+                    self.__merge_worker_results(plot_stage, *futures.popleft().result())
+            while len(futures) > 0:
+                self.__merge_worker_results(plot_stage, *futures.popleft().result())
+
+    def __merge_worker_results(self, plot_stage: PlotStage, sample_location, log_records, location_statistic,
+                               memory_peak, plots_needed):
+        self.logger.replay(log_records)
+        self.location_statistics[sample_location] = location_statistic
+        if memory_peak is not None:
+            self.memory_report.peaks[sample_location] = memory_peak
+        if plots_needed:
+            plot_stage.submit(sample_location)
+
+    def __run_stages(self, sample_location, measurements: pd.DataFrame, progress_bar) -> bool:
+        """
+        Runs all quality control stages row by row on the data frame. Returns True if any row was processed.
+        """
+        changes_detected = False
+        initial_values = CalculatedColumns.get_initial_values()
+        for index in range(measurements.shape[0]):
+            if self.invalidation_planner.needs_processing(index):
+                changes_detected = True
+                if self.invalidation_planner.is_dependent(index):
+                    # reset the stored results, the measurement is processed again due to a changed previous one
+                    measurements.loc[index, list(initial_values.keys())] = list(initial_values.values())
+                    progress_bar.total += 1
+                progress_bar.update(1)
+                # -----------------  BIOMARKER QC -----------------------
+                # 1. check for comments. Flag samples that contain any commentary.
+                self.biomarkerQC.check_comments(sample_location, measurements, index)
+                self.biomarkerQC.check_mean_sewage_flow_present(sample_location, measurements, index)
+                # 2. Mark biomarker values below threshold which are excluded from the analysis.
+                self.biomarkerQC.biomarker_below_threshold_or_empty(sample_location, measurements, index)
+                # 3. Calculate pairwise biomarker values if biomarkers were not marked to be below threshold.
+                self.biomarkerQC.calculate_biomarker_ratios(sample_location, measurements, index)
+                # 4. Detect outliers
+                self.biomarkerQC.detect_outliers(sample_location, measurements, index)
+                # 5. Assign biomarker outliers based on ratio outliers
+                self.biomarkerQC.assign_biomarker_outliers_based_on_ratio_flags(sample_location, measurements, index)
+                self.biomarkerQC.analyze_usable_biomarkers(sample_location, measurements, index)
+                # 6. Create report in case the last two biomarkers were identified as outliers
+                # self.biomarkerQC.report_last_biomarkers_invalid(sample_location, measurements)
+
+                # --------------------  SUROGATVIRUS QC -------------------
+                self.surrogateQC.filter_dry_days_time_frame(sample_location, measurements, index)
+                self.surrogateQC.is_surrogatevirus_outlier(sample_location, measurements, index)
+
+                # --------------------  SEWAGE FLOW -------------------
+                self.sewage_flow.sewage_flow_quality_control(sample_location, measurements, index)
+
+                # --------------------  WATER QUALITY -------------------
+                self.water_quality.check_water_quality(sample_location, measurements, index)
+
+                # --------------------  NORMALIZATION -------------------
+                self.sewageNormalization.normalize_biomarker_values(sample_location, measurements, index)
+
+                # --------------------  MARK OUTLIERS FROM ALL STEPS -------------------
+                self.sewageNormalization.decide_biomarker_usable_based_on_flags(sample_location, measurements, index)
+                self.invalidation_planner.set_processed(index, measurements.iloc[index])
+        return changes_detected
+
+    def process_sample_location(self, sample_location, measurements: pd.DataFrame) -> bool:
+        """
+        Runs the quality control and normalization for a single sample location and writes the results.
+        Returns True if the plots of the sample location need to be rendered from the stored results.
+        """
+        if self.memory_report is not None:
+            self.memory_report.start()
+        self.logger.log.info("\n####################################################\n"
+                             "\tSewage location: {} "
+                             "\n####################################################".format(sample_location))
+        plausibility_dict, measurements = self.__setup(sample_location, measurements)
+        ### Plausibilitätscheck: dict with the index of the odd values
+        if len(plausibility_dict) > 0:
+            self.logger.log.info("Check date filed:{}".format(plausibility_dict))
+        self.logger.log.info("{}/{} new measurements to analyze".format(CalculatedColumns.get_num_of_unprocessed(measurements),
+                                                                        measurements.shape[0]))
+        progress_bar = self.logger.get_progress_bar(CalculatedColumns.get_num_of_unprocessed(measurements), "Analyzing samples")
+        self.sewageStat.set_sample_location_and_total_number(sample_location, CalculatedColumns.get_num_of_unprocessed(measurements))
+        if self.engine == 'columnar':
+            changes_detected = self.columnarQC.run_quality_control(sample_location, measurements, progress_bar,
+                                                                   self.invalidation_planner)
+        else:
+            changes_detected = self.__run_stages(sample_location, measurements, progress_bar)
+        progress_bar.close()
+        if not progress_bar.disable:
             print("    ")
-            if changes_detected or self.__is_plot_not_generated(sample_location):
-                self.logger.log.info(self.sewageStat.print_statistics())
+        if self.invalidation_planner.get_num_dependent() > 0:
+            self.logger.log.info("{} measurements recalculated due to changed previous measurements".format(
+                self.invalidation_planner.get_num_dependent()))
+        plots_needed = False
+        if changes_detected or not is_plot_generated(self.output_folder, sample_location):
+            self.logger.log.info(self.sewageStat.print_statistics())
+            # Experimental: Final step explain flags
+            measurements['flags_explained'] = SewageFlag.explain_flag_series(measurements[CalculatedColumns.FLAG.value])
+            self.logger.log.info("Add '{}' to database...".format(sample_location))
+            self.database.add_sewage_location2db(sample_location, measurements)
+            self.logger.log.info("Export '{}' to excel file...".format(sample_location))
+            self.save_dataframe(sample_location, measurements)
+            if not self.no_plots:
                 self.logger.log.info("Generating plots...")
-                if not self.no_plots:
-                    self.__plot_results(measurements, sample_location)
-                # Experimental: Final step explain flags
-                measurements['flags_explained'] = SewageFlag.explain_flag_series(measurements[CalculatedColumns.FLAG.value])
-                self.logger.log.info("Add '{}' to database...".format(sample_location))
-                self.database.add_sewage_location2db(sample_location, measurements)
-                self.logger.log.info("Export '{}' to excel file...".format(sample_location))
-                self.save_dataframe(sample_location, measurements)
+                plots_needed = True
+        if self.memory_report is not None:
+            peak, max_rss = self.memory_report.stop(sample_location)
+            self.logger.log.info("Peak memory: {} traced, {} resident set size".format(
+                self.memory_report.format_megabytes(peak), self.memory_report.format_megabytes(max_rss)))
+        return plots_needed
+
+
+_worker_sewage_quality = None
+
+
+def _initialize_worker(sewage_quality: SewageQuality):
+    global _worker_sewage_quality
+    sewage_quality.logger.capture_records()
+    utils.set_lof_backend(sewage_quality.lof_backend)
+    utils.outlier_model_cache.set_max_size(sewage_quality.outlier_model_cache_size)
+    _worker_sewage_quality = sewage_quality
+
+
+def _process_sample_location_in_worker(sample_location, measurements: pd.DataFrame):
+    plots_needed = _worker_sewage_quality.process_sample_location(sample_location, measurements)
+    memory_report = _worker_sewage_quality.memory_report
+    memory_peak = memory_report.peaks.get(sample_location) if memory_report is not None else None
+    return (sample_location, _worker_sewage_quality.logger.pop_captured_records(), _worker_sewage_quality.sewageStat,
+            memory_peak, plots_needed)
 
 
+def run_query(arguments):
+    """
+    ssqn.py query: prints the measurements stored in the sqlite database that match the given conditions
+    """
+    parser = argparse.ArgumentParser(
+        prog="ssqn.py query",
+        description="Query the results of all sample locations stored with --database_backend sqlite",
+        epilog="example: which sample locations had reproduction factor outliers since 2024-05-06?\n"
+               "  ssqn.py query --flag REPRODUCTION_NUMBER_OUTLIER --start 2024-05-06 --summary",
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--database', metavar="PATH", default=None, type=str,
+                        help="Folder of the database. (default: '~/.sewage_qc_normalization')")
+    parser.add_argument('-l', '--location', metavar="LOCATION", nargs='+', default=None,
+                        help="Sample locations to query. (default: all)")
+    parser.add_argument('--start', metavar="DATE", default=None, help="First collection date, e.g. 2024-05-06")
+    parser.add_argument('--end', metavar="DATE", default=None, help="Last collection date")
+    parser.add_argument('--flag', metavar="FLAG", nargs='+', default=[], choices=[f.name for f in SewageFlag],
+                        help="Only measurements with any of these flags, e.g. REPRODUCTION_NUMBER_OUTLIER")
+    parser.add_argument('--usable', metavar="YES/NO", default=None, choices=['yes', 'no'],
+                        help="Only usable or not usable measurements")
+    parser.add_argument('-c', '--columns', metavar="COLUMN", nargs='+', default=None,
+                        help="Columns to output. (default: {} {} {})".format(
+                            Columns.DATE, CalculatedColumns.USABLE.value, CalculatedColumns.FLAG.value))
+    parser.add_argument('--summary', action="store_true",
+                        help="Output the number of matching measurements per sample location")
+    parser.add_argument('--sql', metavar="QUERY", default=None,
+                        help="Run this SQL query on the table 'measurements' instead")
+    parser.add_argument('-o', '--output', metavar="FILE", default=None,
+                        help="Write the result as tab separated file. (default: standard output)")
+    args = parser.parse_args(arguments)
+    database = db.SewageDatabase(args.database, 'sqlite')
+    if args.sql is not None:
+        result = database.backend.read_sql(args.sql)
+    else:
+        flags = 0
+        for flag in args.flag:
+            flags |= SewageFlag[flag].value
+        usable = None if args.usable is None else args.usable == 'yes'
+        result = database.query_measurements(args.location, args.start, args.end, flags, usable, args.columns,
+                                             args.summary)
+    result.to_csv(args.output if args.output is not None else sys.stdout, sep="\t", index=False)
+
+
+def run_plot(arguments) -> int:
+    """
+    ssqn.py plot: renders the plots of the stored results again, without reading the input or running the quality
+    control. Returns 1 if the plots of any sample location could not be rendered.
+    """
+    parser = argparse.ArgumentParser(
+        prog="ssqn.py plot",
+        description="Render the plots of the results stored in the database",
+        epilog="example: plots of two sample locations since 2024-01-01\n"
+               "  ssqn.py plot -l 'München_01' 'Karlsruhe' --start 2024-01-01 -o sewage_qc",
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--database', metavar="PATH", default=None, type=str,
+                        help="Folder of the database. (default: '~/.sewage_qc_normalization')")
+    parser.add_argument('--database_backend', metavar="BACKEND", default='files', choices=db.database_backends,
+                        help="Storage of the database, see 'ssqn.py --help'. (default: 'files')")
+    parser.add_argument('--partition_by_year', action="store_true",
+                        help="The partitioned database is partitioned by the year of collection.")
+    parser.add_argument('-l', '--location', metavar="LOCATION", nargs='+', default=None,
+                        help="Sample locations to plot. (default: all stored sample locations)")
+    parser.add_argument('--start', metavar="DATE", default=None, help="First collection date, e.g. 2024-05-06")
+    parser.add_argument('--end', metavar="DATE", default=None, help="Last collection date")
+    parser.add_argument('-o', '--output_folder', metavar="FOLDER", default="sewage_qc", type=str,
+                        help="The plots are written to the subfolder 'plots'. (default folder: 'sewage_qc')")
+    parser.add_argument('--plot_jobs', metavar="INT", default=1, type=int,
+                        help="Number of processes rendering the plots. (default: 1)")
+    parser.add_argument('--no_plot_cache', action="store_true",
+                        help="Draw all figures again instead of loading the unchanged ones from the plot cache.")
+    parser.add_argument('--fast_plots', action="store_true",
+                        help="Fast plotting mode for long time series: outliers close in time share one label without\n"
+                             "layout, the points are rasterized and the inliers of each panel are downsampled to 500\n"
+                             "points keeping the shape of the series.")
+    for option in ['--biomarker_outlier_statistics', '--surrogatevirus_outlier_statistics', '--water_qc_outlier_statistics']:
+        parser.add_argument(option, metavar="METHOD", default=['iqr', 'lof'], nargs='+',
+                            choices=["lof", "rf", "iqr", "zscore", "ci", "svm", "all"],
+                            help="Outlier detection methods of the quality control shown in the titles. (default: 'lof','iqr')")
+    parser.add_argument('-v', '--verbosity', action="count", help="Increase output verbosity.")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Print litte output.")
+    args = parser.parse_args(arguments)
+    logger = utils.SewageLogger(args.output_folder, verbosity=args.verbosity, quiet=args.quiet)
+    database = db.SewageDatabase(args.database, args.database_backend, args.partition_by_year)
+    sample_locations = args.location if args.location is not None else database.get_sample_locations()
+    with PlotStage(args.output_folder, logger, args.database, args.database_backend, args.partition_by_year,
+                   args.biomarker_outlier_statistics, args.surrogatevirus_outlier_statistics,
+                   args.water_qc_outlier_statistics, args.plot_jobs, args.start, args.end,
+                   not args.no_plot_cache, args.fast_plots) as plot_stage:
+        for sample_location in sample_locations:
+            logger.log.info("Plotting '{}'...".format(sample_location))
+            plot_stage.submit(sample_location)
+    logger.log.info("Plots of {} sample locations written to {}".format(plot_stage.num_rendered,
+                                                                        os.path.join(args.output_folder, "plots")))
+    return 1 if plot_stage.num_failed > 0 else 0
+
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        run_query(sys.argv[2:])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'plot':
+        sys.exit(run_plot(sys.argv[2:]))
     parser = argparse.ArgumentParser(
         description="Sewage qPCR quality control",
         usage='use "python3 ssqn.py --help" for more information',
         epilog="author: Dr. Alexander Graf (graf@genzentrum.lmu.de)", formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-i', '--input', metavar="FILE", type=str,
-                        help="Specifiy input excel file with biomarker values",
+                        help="Specifiy input file with biomarker values",
                         required=True)
+    parser.add_argument('--input_format', metavar="FORMAT", default='auto', choices=['auto'] + list(utils.input_formats),
+                        help=("Format of the input file. (default: 'auto')\n"
+                              "\tauto = detect the format by the file extension\n"
+                              "\texcel = excel workbook with one sheet per sample location\n"
+                              "\tparquet, arrow, csv = one table of all sample locations in long format,\n"
+                              "\t                      the sample location is given in --location_column\n"),
+                        required=False)
+    parser.add_argument('--excel_engine', metavar="ENGINE", default='openpyxl', choices=utils.excel_engines,
+                        help=("Library used to read excel files. (default: 'openpyxl')\n"
+                              "\topenpyxl = pure Python reader\n"
+                              "\tcalamine = faster Rust based reader, requires the package python-calamine\n"),
+                        required=False)
+    parser.add_argument('--location_column', metavar="COLUMN", default=utils.default_location_column, type=str,
+                        help="Column of the sample location in long format input files. (default: '{}')".format(
+                            utils.default_location_column),
+                        required=False)
+    parser.add_argument('--no_input_cache', action="store_true",
+                        help="Parse all sheets of the input excel file instead of loading the unchanged ones from the cache\n"
+                             "in the output folder.")
+    parser.add_argument('--database', metavar="PATH", default=None, type=str,
+                        help="Folder of the database with the results of previous runs.\n"
+                             "(default: '~/.sewage_qc_normalization', the subfolder 'sewage_db' for the partitioned backend)",
+                        required=False)
+    parser.add_argument('--database_backend', metavar="BACKEND", default='files', choices=db.database_backends,
+                        help=("Storage of the database. (default: 'files')\n"
+                              "\tfiles = one parquet file per sample location, rewritten on every run\n"
+                              "\tarrow = one Arrow IPC file per sample location, memory-mapped when loading\n"
+                              "\tpartitioned = one parquet dataset partitioned by sample location, only new or\n"
+                              "\t              changed partitions are written\n"
+                              "\tsqlite = one indexed SQLite database, required by 'ssqn.py query'\n"),
+                        required=False)
+    parser.add_argument('--partition_by_year', action="store_true",
+                        help="Partition the sample locations of the partitioned database by the year of collection.")
+    parser.add_argument('--memory_report', action="store_true",
+                        help="Report the peak memory of each sample location and write it to memory_report.tsv in the\n"
+                             "output folder. Slows down the processing.")
     parser.add_argument('-o', '--output_folder', metavar="FOLDER", default="sewage_qc", type=str,
                         help="Specifiy output folder. (default folder: 'sewage_qc')",
                         required=False)
     parser.add_argument('-p', '--no_plotting', action="store_true", help="Do not output any plots.")
+    parser.add_argument('--plot_jobs', metavar="INT", default=1, type=int,
+                        help="Number of processes rendering the plots from the stored results while the quality control\n"
+                             "continues, 0 renders them after each sample location. (default: 1)",
+                        required=False)
+    parser.add_argument('--no_plot_cache', action="store_true",
+                        help="Draw all figures again instead of loading the unchanged ones from the plot cache in the\n"
+                             "plots folder.")
+    parser.add_argument('--fast_plots', action="store_true",
+                        help="Fast plotting mode for long time series: outliers close in time share one label without\n"
+                             "layout, the points are rasterized and the inliers of each panel are downsampled to 500\n"
+                             "points keeping the shape of the series.")
     parser.add_argument('-r', '--rerun_all', action="store_true", help="Rerun the analysis on all samples.")
     parser.add_argument('-v', '--verbosity', action="count", help="Increase output verbosity.")
     parser.add_argument('-q', '--quiet', action='store_true', help="Print litte output.")
+    parser.add_argument('-e', '--engine', metavar="ENGINE", default='pandas', choices=['pandas', 'columnar'],
+                        help=("Engine used for the quality control. (default: 'pandas')\n"
+                              "\tpandas = process the data frame row by row\n"
+                              "\tcolumnar = process NumPy arrays of the required columns\n"),
+                        required=False)
+    parser.add_argument('-j', '--jobs', metavar="INT", default=1, type=int,
+                        help="Number of sample locations processed in parallel. (default: 1)",
+                        required=False)
+    parser.add_argument('--lof_backend', metavar="BACKEND", default='native', choices=utils.lof_backends,
+                        help=("Implementation of the local outlier factor. (default: 'native')\n"
+                              "\tnative = one-dimensional LOF on sorted values, same predictions as sklearn\n"
+                              "\tsklearn = LocalOutlierFactor of scikit-learn\n"),
+                        required=False)
+    parser.add_argument('--outlier_model_cache_size', metavar="INT", default=256, type=int,
+                        help="Number of fitted outlier models and statistics kept for reuse, 0 disables the cache. (default: 256)",
+                        required=False)
 
     biomarker_qc_group = parser.add_argument_group("Biomarker quality control")
     biomarker_qc_group.add_argument('--biomarker_outlier_statistics', metavar="METHOD", default=['iqr', 'lof'], nargs='+',
@@ -390,7 +679,11 @@ if __name__ == '__main__':
                                   args.fraction_last_samples_for_dry_flow, args.min_num_samples_for_mean_dry_flow,
                                   args.heavy_precipitation_factor, args.mean_sewage_flow_below_typo_factor,
                                   args.mean_sewage_flow_above_typo_factor, args.min_number_of_biomarkers_for_normalization,
-                                  args.base_reproduction_value_factor, args.num_previous_days_reproduction_factor, args.max_number_of_flags_for_outlier)
+                                  args.base_reproduction_value_factor, args.num_previous_days_reproduction_factor, args.max_number_of_flags_for_outlier,
+                                  args.jobs, args.engine, args.lof_backend, args.outlier_model_cache_size,
+                                  args.input_format, args.excel_engine, args.location_column, not args.no_input_cache,
+                                  args.memory_report, args.database, args.database_backend, args.partition_by_year,
+                                  args.plot_jobs, not args.no_plot_cache, args.fast_plots)
 
     sewageQuality.run_quality_control()
 
@@ -0,0 +1,74 @@
+# Created by alex at 18.10.26
+import shutil
+import os.path
+from unittest import TestCase
+from pandas.testing import *
+import numpy as np
+from lib import constant
+from lib import statistics
+from lib.columnar import ColumnarQualityControl, MeasurementColumns, BiomarkerRatioMatrix
+from test.utils import create_measurements, create_stages, NoProgress, test_output_folder
+
+
+def run_row_by_row(stages, measurements):
+    biomarkerQC, surrogateQC, sewage_flow, water_quality, sewageNormalization = stages
+    for index in range(measurements.shape[0]):
+        biomarkerQC.check_comments('', measurements, index)
+        biomarkerQC.check_mean_sewage_flow_present('', measurements, index)
+        biomarkerQC.biomarker_below_threshold_or_empty('', measurements, index)
+        biomarkerQC.calculate_biomarker_ratios('', measurements, index)
+        biomarkerQC.detect_outliers('', measurements, index)
+        biomarkerQC.assign_biomarker_outliers_based_on_ratio_flags('', measurements, index)
+        biomarkerQC.analyze_usable_biomarkers('', measurements, index)
+        surrogateQC.filter_dry_days_time_frame('', measurements, index)
+        surrogateQC.is_surrogatevirus_outlier('', measurements, index)
+        sewage_flow.sewage_flow_quality_control('', measurements, index)
+        water_quality.check_water_quality('', measurements, index)
+        sewageNormalization.normalize_biomarker_values('', measurements, index)
+        sewageNormalization.decide_biomarker_usable_based_on_flags('', measurements, index)
+
+
+class TestColumnarQualityControl(TestCase):
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_same_results_as_row_by_row_stages(self):
+        measurements = create_measurements()
+        expected = measurements.copy()
+        expected_stat = statistics.SewageStat()
+        run_row_by_row(create_stages(expected_stat), expected)
+
+        sewageStat = statistics.SewageStat()
+        columnarQC = ColumnarQualityControl(*create_stages(sewageStat))
+        changes_detected = columnarQC.run_quality_control('', measurements, NoProgress())
+        self.assertTrue(changes_detected)
+        assert_frame_equal(measurements, expected, check_exact=True)
+        self.assertEqual(sewageStat.print_statistics(), expected_stat.print_statistics())
+
+
+class TestBiomarkerRatioMatrix(TestCase):
+
+    def test_medians_equal_numpy_median(self):
+        measurements = create_measurements(num_rows=80, seed=3)
+        rng = np.random.default_rng(3)
+        columns = MeasurementColumns(measurements)
+        columns.biomarker_ratio_values[rng.random(columns.biomarker_ratio_values.shape) < 0.8] = 1.0
+        columns.biomarker_ratio_flags[rng.random(columns.biomarker_ratio_flags.shape) < 0.2] = constant.SewageFlag.BIOMARKER_RATIO_OUTLIER.value
+        ratio_matrix = BiomarkerRatioMatrix(columns)
+        for start, end in [(0, 0), (0, 1), (0, 2), (5, 30), (20, 71), (79, 80)]:
+            medians = ratio_matrix.get_medians(start, end)
+            for p, (j1, j2) in enumerate(columns.biomarker_pairs):
+                rows = ratio_matrix.get_usable_rows(start, end, p)
+                expected = np.median(columns.biomarker_values[rows, j1] / columns.biomarker_values[rows, j2]) if len(rows) > 0 else np.NAN
+                np.testing.assert_equal(medians[p], expected)
+
+    def test_excluded_ratios_are_not_usable(self):
+        columns = MeasurementColumns(create_measurements(num_rows=20, seed=4))
+        columns.biomarker_ratio_values[:] = 1.0
+        columns.ratio_matrix.update_row(3)
+        self.assertIn(3, columns.ratio_matrix.get_usable_rows(0, 10, 0))
+        columns.ratio_matrix.exclude(3, 0)
+        self.assertNotIn(3, columns.ratio_matrix.get_usable_rows(0, 10, 0))
+        self.assertIn(3, columns.ratio_matrix.get_usable_rows(0, 10, 1))
@@ -0,0 +1,87 @@
+# Created by alex at 18.10.26
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.constant import *
+
+
+def create_flags(num_rows=20, seed=3) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    flags = pd.DataFrame()
+    for column in FlagMatrix.get_flag_columns():
+        flags[column] = rng.choice([f.value for f in SewageFlag], num_rows) | rng.choice([f.value for f in SewageFlag], num_rows)
+    return flags
+
+
+class TestFlagMatrix(TestCase):
+
+    def setUp(self) -> None:
+        self.flags = create_flags()
+        self.flag_matrix = FlagMatrix(self.flags)
+
+    def test_views_of_flag_columns(self):
+        biomarker_flag_columns = CalculatedColumns.get_biomarker_flag_columns()
+        np.testing.assert_array_equal(self.flag_matrix.flag, self.flags[CalculatedColumns.FLAG.value])
+        np.testing.assert_array_equal(self.flag_matrix.biomarker_flags, self.flags[biomarker_flag_columns])
+        self.assertEqual(self.flag_matrix.biomarker_ratio_flags.shape, (20, 15))
+        self.flag_matrix.biomarker_flags[3, 1] = 0
+        self.assertEqual(self.flag_matrix.matrix[3, 2], 0)
+
+    def test_same_as_scalar_checks(self):
+        columns = FlagMatrix.get_flag_columns()[:8]
+        for sewage_flag in SewageFlag:
+            is_set = self.flag_matrix.is_set(slice(None), columns, sewage_flag)
+            is_not_set = self.flag_matrix.is_not_set(np.arange(20), columns, sewage_flag)
+            for position, column in enumerate(columns):
+                for row, flag_value in enumerate(self.flags[column]):
+                    self.assertEqual(is_set[row, position], SewageFlag.is_flag(flag_value, sewage_flag))
+                    self.assertEqual(is_not_set[row, position], SewageFlag.is_not_flag(flag_value, sewage_flag))
+
+    def test_set_and_clear(self):
+        columns = CalculatedColumns.get_biomarker_flag_columns()[:3]
+        rows = [2, 5, 7]
+        self.flag_matrix.set(rows, columns, SewageFlag.BIOMARKER_PROBABLE_OUTLIER)
+        self.assertTrue(self.flag_matrix.is_set(rows, columns, SewageFlag.BIOMARKER_PROBABLE_OUTLIER).all())
+        self.flag_matrix.clear(slice(None), None, SewageFlag.BIOMARKER_PROBABLE_OUTLIER | SewageFlag.AMMONIUM_OUTLIER)
+        self.assertTrue(self.flag_matrix.is_not_set(slice(None), None, SewageFlag.BIOMARKER_PROBABLE_OUTLIER).all())
+        self.assertTrue(self.flag_matrix.is_not_set(slice(None), None, SewageFlag.AMMONIUM_OUTLIER).all())
+        self.flag_matrix.reset(4)
+        self.assertFalse(self.flag_matrix.matrix[4].any())
+        # the other flags are kept
+        expected = self.flags.to_numpy() & ~(SewageFlag.BIOMARKER_PROBABLE_OUTLIER.value | SewageFlag.AMMONIUM_OUTLIER.value)
+        expected[4] = 0
+        measurements = pd.DataFrame(index=self.flags.index)
+        self.flag_matrix.write_back(measurements)
+        np.testing.assert_array_equal(measurements[self.flags.columns].to_numpy(), expected)
+        self.assertTrue((measurements.dtypes == np.int64).all())
+
+    def test_wrappers_on_data_frame(self):
+        flag_column = CalculatedColumns.FLAG.value
+        flags = self.flags[[flag_column]].copy()
+        flags[flag_column] = 0
+        SewageFlag.add_flag_to_index_column(flags, 3, flag_column, SewageFlag.COMMENT_NOT_EMPTY)
+        SewageFlag.add_flag_to_index_column(flags, 3, flag_column, SewageFlag.COMMENT_NOT_EMPTY)
+        SewageFlag.add_flag_to_index_column(flags, 3, flag_column, SewageFlag.AMMONIUM_OUTLIER)
+        SewageFlag.remove_flag_from_index_column(flags, 3, flag_column, SewageFlag.COMMENT_NOT_EMPTY)
+        SewageFlag.remove_flag_from_index_column(flags, 3, flag_column, SewageFlag.COMMENT_NOT_EMPTY)
+        self.assertEqual(flags.at[3, flag_column], SewageFlag.AMMONIUM_OUTLIER.value)
+        self.assertEqual(flags[flag_column].sum(), SewageFlag.AMMONIUM_OUTLIER.value)
+        is_set = SewageFlag.is_flag_set_for_series(flags[flag_column], SewageFlag.AMMONIUM_OUTLIER)
+        self.assertListEqual(np.flatnonzero(is_set).tolist(), [3])
+        with self.assertRaises(ValueError):
+            SewageFlag.is_flag(3, SewageFlag.AMMONIUM_OUTLIER.value)
+        with self.assertRaises(ValueError):
+            SewageFlag.add_flag_to_index_column(flags, 3, flag_column, CalculatedColumns.FLAG)
+
+
+class TestSewageFlag(TestCase):
+
+    def test_explain_flag_series(self):
+        flags = create_flags(num_rows=200)[CalculatedColumns.FLAG.value] % 64
+        flags.index = flags.index + 10
+        explained = SewageFlag.explain_flag_series(flags)
+        self.assertIsInstance(explained.dtype, pd.CategoricalDtype)
+        self.assertEqual(len(explained.cat.categories), flags.nunique())
+        self.assertListEqual(explained.index.tolist(), flags.index.tolist())
+        self.assertListEqual(explained.tolist(), [', '.join(f.name for f in SewageFlag if f.value & v == f.value) for v in flags])
+        self.assertEqual(SewageFlag.explain_flag_series(pd.Series([0]))[0], "")
@@ -0,0 +1,434 @@
+# Created by alex at 18.10.26
+import os
+import sys
+import subprocess
+import tempfile
+import multiprocessing
+from pathlib import Path
+from unittest import TestCase, mock
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from lib.constant import *
+from lib.database import SewageDatabase, ArrowSnapshotBackend, PartitionedParquetBackend, SqliteBackend, \
+    CHECKSUM_COLUMN
+import pyarrow as pa
+import pyarrow.parquet as pq
+from test.utils import repository_folder
+
+
+def create_measurements(num_rows=30, seed=5) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    measurements = pd.DataFrame()
+    measurements[Columns.DATE] = pd.to_datetime("2022-03-01") + pd.to_timedelta(np.arange(num_rows) // 2, unit="D")
+    measurements[Columns.COMMENT_ANALYSIS] = ""
+    for biomarker in Columns.get_biomarker_columns():
+        measurements[biomarker] = rng.lognormal(3, 0.5, num_rows)
+    measurements[Columns.MEAN_SEWAGE_FLOW] = rng.integers(200, 400, num_rows)
+    measurements[Columns.TROCKENTAG] = "ja"
+    measurements[CalculatedColumns.FLAG.value] = 0
+    measurements[CalculatedColumns.NEEDS_PROCESSING.value] = True
+    return measurements
+
+
+# stores the measurements of the pickle file and kills the process at the crash point
+crash_script = """
+import io
+import os
+import sys
+import shutil
+import sqlite3
+import pandas as pd
+import pyarrow.parquet as pq
+from unittest import mock
+from lib.database import SewageDatabase
+
+database_folder, backend, crash_point, measurements_file = sys.argv[1:]
+write_table = pq.write_table
+connect = sqlite3.connect
+
+
+def write_truncated_table(table, where, **kwargs):
+    buffer = io.BytesIO()
+    write_table(table, buffer, **kwargs)
+    with open(where, 'wb') as f:
+        f.write(buffer.getvalue()[:buffer.tell() // 2])
+    os._exit(1)
+
+
+class CrashingConnection(sqlite3.Connection):
+    def executemany(self, *args):
+        super().executemany(*args)
+        os._exit(1)
+
+
+patches = {'write': mock.patch.object(pq, 'write_table', write_truncated_table),
+           'remove': mock.patch.object(os, 'remove', lambda path: os._exit(1)),
+           'rmtree': mock.patch.object(shutil, 'rmtree', lambda path: os._exit(1)),
+           'commit': mock.patch.object(sqlite3, 'connect', lambda *a, **k: connect(*a, factory=CrashingConnection, **k))}
+database = SewageDatabase(database_folder, backend, partition_by_year=True)
+measurements = pd.read_pickle(measurements_file)
+with patches[crash_point]:
+    database.add_sewage_location2db("Ort 1", measurements)
+"""
+
+
+def store_repeatedly(database_folder, versions, num_stores):
+    database = SewageDatabase(database_folder, 'partitioned', partition_by_year=True)
+    for i in range(num_stores):
+        database.add_sewage_location2db("Ort 1", versions[i % len(versions)])
+
+
+class TestSewageDatabase(TestCase):
+    backend = 'files'
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        with mock.patch.object(Path, 'home', return_value=Path(self.tmp_folder.name)):
+            self.database = SewageDatabase(backend=self.backend, partition_by_year=True)
+        self.stored = create_measurements()
+        self.stored[CalculatedColumns.FLAG.value] = np.arange(self.stored.shape[0])
+        self.database.add_sewage_location2db("Ort 1", self.stored)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def test_checksums_are_stored(self):
+        self.assertIn(CHECKSUM_COLUMN, self.database.read_measurements("Ort 1").columns)
+
+    def test_unchanged_measurements_are_taken_from_db(self):
+        new_measurements = create_measurements()
+        self.database.needs_recalcuation("Ort 1", new_measurements, False)
+        self.assertFalse(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value].any())
+        self.assertListEqual(new_measurements[CalculatedColumns.FLAG.value].tolist(), list(range(self.stored.shape[0])))
+
+    def test_changed_and_new_measurements_need_recalculation(self):
+        new_measurements = pd.concat([create_measurements(), create_measurements(num_rows=2, seed=6)], ignore_index=True)
+        new_measurements.loc[new_measurements.index[-1], Columns.DATE] = pd.to_datetime("2022-04-01")
+        new_measurements.loc[5, Columns.BIOMARKER_N1] += 1
+        new_measurements.loc[8, Columns.COMMENT_ANALYSIS] = "verdünnt"
+        self.database.needs_recalcuation("Ort 1", new_measurements, False)
+        self.assertListEqual(np.flatnonzero(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value]).tolist(),
+                             [5, 8, 30, 31])
+        # the results of the changed rows are not overwritten by the stored ones of the same date
+        self.assertEqual(new_measurements.loc[4, CalculatedColumns.FLAG.value], 4)
+        self.assertEqual(new_measurements.loc[5, CalculatedColumns.FLAG.value], 0)
+
+    def test_duplicated_measurements_are_matched_once(self):
+        new_measurements = pd.concat([create_measurements(), create_measurements().iloc[[3]]], ignore_index=True)
+        new_measurements.sort_values(by=Columns.DATE, kind='stable', inplace=True, ignore_index=True)
+        self.database.needs_recalcuation("Ort 1", new_measurements, False)
+        self.assertListEqual(np.flatnonzero(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value]).tolist(), [4])
+
+    def test_integer_and_float_values_have_same_checksums(self):
+        new_measurements = create_measurements()
+        new_measurements[Columns.MEAN_SEWAGE_FLOW] = new_measurements[Columns.MEAN_SEWAGE_FLOW].astype(float)
+        self.database.needs_recalcuation("Ort 1", new_measurements, False)
+        self.assertFalse(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value].any())
+
+    def test_flag_explanations_are_categorical(self):
+        measurements = self.stored.copy()
+        measurements['flags_explained'] = SewageFlag.explain_flag_series(measurements[CalculatedColumns.FLAG.value] % 4)
+        self.database.add_sewage_location2db("Ort 2", measurements)
+        flags_explained = self.database.read_measurements("Ort 2")['flags_explained']
+        self.assertIsInstance(flags_explained.dtype, pd.CategoricalDtype)
+        self.assertEqual(len(flags_explained.cat.categories), 4)
+        self.assertListEqual(flags_explained.tolist(), measurements['flags_explained'].tolist())
+
+    def test_stored_sample_locations(self):
+        self.database.add_sewage_location2db("Ort/3", self.stored.iloc[:5])
+        self.assertListEqual(self.database.get_sample_locations(), ["Ort 1", "Ort/3"])
+        self.assertEqual(self.database.read_measurements("Ort/3").shape[0], 5)
+        if self.backend == 'files':
+            # database file of an older version without the name of the sample location
+            self.stored.to_parquet(os.path.join(self.database.output_folder, ".Ort_2_sewage_db.parquet"))
+            self.assertListEqual(self.database.get_sample_locations(), ["Ort 1", "Ort/3", "Ort_2"])
+
+    def test_db_without_checksums(self):
+        if self.backend != 'files':
+            self.skipTest("only the files backend was written by older versions")
+        # database file of an older version
+        self.stored.to_parquet(os.path.join(self.database.output_folder, ".Ort_2_sewage_db.parquet"))
+        new_measurements = create_measurements()
+        new_measurements.loc[0, Columns.BIOMARKER_N2] = np.NAN
+        self.database.needs_recalcuation("Ort 2", new_measurements, False)
+        self.assertListEqual(np.flatnonzero(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value]).tolist(), [0])
+
+    def test_previous_versions_of_changed_measurements(self):
+        new_measurements = create_measurements().drop(index=[12]).reset_index(drop=True)
+        new_measurements.loc[5, Columns.BIOMARKER_N1] += 1
+        previous_measurements, removed_dates = self.database.needs_recalcuation("Ort 1", new_measurements, False)
+        self.assertListEqual(previous_measurements.index.tolist(), [5])
+        self.assertEqual(previous_measurements.loc[5, Columns.BIOMARKER_N1], self.stored.loc[5, Columns.BIOMARKER_N1])
+        self.assertEqual(previous_measurements.loc[5, CalculatedColumns.FLAG.value], 5)
+        self.assertListEqual(list(removed_dates), [self.stored.loc[12, Columns.DATE].to_datetime64()])
+        self.assertEqual(self.database.needs_recalcuation("Ort 1", new_measurements, True), (None, None))
+
+
+class TestArrowSewageDatabase(TestSewageDatabase):
+    backend = 'arrow'
+
+
+class TestArrowSnapshotBackend(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.backend = ArrowSnapshotBackend(self.tmp_folder.name)
+        self.measurements = create_measurements(num_rows=40)
+        self.measurements[CHECKSUM_COLUMN] = np.arange(40, dtype=np.uint64) + np.uint64(2 ** 63)
+        self.backend.store("Ort 1", self.measurements)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def test_columns_are_memory_mapped(self):
+        allocated_bytes = pa.total_allocated_bytes()
+        loaded = self.backend.load("Ort 1")
+        assert_frame_equal(loaded, self.measurements)
+        for column in [Columns.DATE, Columns.BIOMARKER_N1, Columns.MEAN_SEWAGE_FLOW, CHECKSUM_COLUMN]:
+            # read only views of the file
+            self.assertFalse(loaded[column].to_numpy().flags.writeable, column)
+        # nothing as large as one of the columns is copied to memory of arrow
+        self.assertLess(pa.total_allocated_bytes() - allocated_bytes, self.measurements.shape[0] * 8)
+        self.assertIsNone(self.backend.load("Ort 2"))
+
+    def test_date_filters_slice_the_snapshot(self):
+        filters = [(Columns.DATE, '>', pd.Timestamp("2022-03-05")), (Columns.DATE, '<=', pd.Timestamp("2022-03-12"))]
+        loaded = self.backend.load("Ort 1", columns=[Columns.DATE, Columns.BIOMARKER_N1], filters=filters)
+        expected = self.measurements.loc[10:23, [Columns.DATE, Columns.BIOMARKER_N1]].reset_index(drop=True)
+        assert_frame_equal(loaded, expected)
+        self.assertFalse(loaded[Columns.BIOMARKER_N1].to_numpy().flags.writeable)
+        self.assertEqual(self.backend.load("Ort 1", filters=[(Columns.DATE, '>=', pd.Timestamp("2023-01-01"))]).shape[0], 0)
+
+    def test_filters_of_unsorted_snapshot(self):
+        measurements = self.measurements.iloc[::-1].reset_index(drop=True)
+        self.backend.store("Ort 1", measurements)
+        loaded = self.backend.load("Ort 1", filters=[(Columns.DATE, '>=', pd.Timestamp("2022-03-15")),
+                                                     (CalculatedColumns.FLAG.value, '==', 0)])
+        assert_frame_equal(loaded, measurements.iloc[:12].reset_index(drop=True))
+
+
+class TestPartitionedSewageDatabase(TestSewageDatabase):
+    backend = 'partitioned'
+
+
+class TestPartitionedParquetBackend(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.backend = PartitionedParquetBackend(self.tmp_folder.name, partition_by_year=True, max_fragments=3)
+        self.measurements = create_measurements(num_rows=40)
+        # 2021 and 2022
+        self.measurements[Columns.DATE] = pd.to_datetime("2021-12-22") + pd.to_timedelta(np.arange(40), unit="D")
+        self.backend.store("Ort 1/A", self.measurements)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def __get_fragments(self) -> list:
+        return sorted(str(p.relative_to(self.tmp_folder.name)) for p in Path(self.tmp_folder.name).rglob("*.parquet"))
+
+    def test_hive_partitions(self):
+        self.assertListEqual(self.__get_fragments(), ["location=Ort%201%2FA/year=2021/part-00000000.parquet",
+                                                      "location=Ort%201%2FA/year=2022/part-00000000.parquet"])
+        assert_frame_equal(self.backend.load("Ort 1/A"), self.measurements)
+        self.assertIsNone(self.backend.load("Ort 2"))
+
+    def test_unchanged_partitions_are_not_written(self):
+        self.measurements.loc[30, Columns.BIOMARKER_N1] += 1
+        self.backend.store("Ort 1/A", self.measurements)
+        self.assertListEqual(self.__get_fragments(), ["location=Ort%201%2FA/year=2021/part-00000000.parquet",
+                                                      "location=Ort%201%2FA/year=2022/part-00000001.parquet"])
+        assert_frame_equal(self.backend.load("Ort 1/A"), self.measurements)
+
+    def test_appended_rows_and_compaction(self):
+        measurements = self.measurements
+        for num_rows in [43, 47, 50]:
+            measurements = pd.concat([measurements, create_measurements(num_rows=num_rows).iloc[measurements.shape[0]:]])
+            measurements[Columns.DATE] = pd.to_datetime("2021-12-22") + pd.to_timedelta(np.arange(num_rows), unit="D")
+            self.backend.store("Ort 1/A", measurements)
+            assert_frame_equal(self.backend.load("Ort 1/A"), measurements.reset_index(drop=True))
+            if num_rows == 43:
+                new_fragment = pq.read_table(os.path.join(self.tmp_folder.name, self.__get_fragments()[-1]))
+                self.assertEqual(new_fragment.num_rows, 3)
+        # the fourth fragment of 2022 is compacted
+        self.assertListEqual(self.__get_fragments(), ["location=Ort%201%2FA/year=2021/part-00000000.parquet",
+                                                      "location=Ort%201%2FA/year=2022/part-00000003.parquet"])
+
+    def test_appended_categories(self):
+        self.measurements['flags_explained'] = pd.Categorical(["a"] * 40)
+        self.backend.store("Ort 1/A", self.measurements)
+        measurements = pd.concat([self.measurements, self.measurements.iloc[-2:]], ignore_index=True)
+        measurements['flags_explained'] = pd.Categorical(["a"] * 40 + ["b", "b"])
+        self.backend.store("Ort 1/A", measurements)
+        self.assertEqual(len(self.__get_fragments()), 3)
+        assert_frame_equal(self.backend.load("Ort 1/A"), measurements)
+
+    def test_removed_partition(self):
+        measurements = self.measurements.iloc[10:].reset_index(drop=True)
+        self.backend.store("Ort 1/A", measurements)
+        self.assertListEqual(self.__get_fragments(), ["location=Ort%201%2FA/year=2022/part-00000000.parquet"])
+        assert_frame_equal(self.backend.load("Ort 1/A"), measurements)
+
+    def test_load_other_partition_layout(self):
+        date_filter = [(Columns.DATE, '>=', pd.Timestamp("2022-01-05"))]
+        expected = self.measurements.loc[14:].reset_index(drop=True)
+        PartitionedParquetBackend(self.tmp_folder.name).store("Ort 2", self.measurements)
+        assert_frame_equal(self.backend.load("Ort 2"), self.measurements)
+        assert_frame_equal(self.backend.load("Ort 2", filters=date_filter), expected)
+        # year partitions loaded without partition_by_year
+        assert_frame_equal(PartitionedParquetBackend(self.tmp_folder.name).load("Ort 1/A", filters=date_filter), expected)
+
+    def test_fragments_without_manifest(self):
+        # first store killed before the manifest was written
+        os.remove(os.path.join(self.tmp_folder.name, "location=Ort%201%2FA", PartitionedParquetBackend.manifest_name))
+        self.assertIsNone(self.backend.load("Ort 1/A"))
+        self.assertListEqual(self.backend.get_sample_locations(), [])
+        measurements = self.measurements.iloc[10:].reset_index(drop=True)
+        self.backend.store("Ort 1/A", measurements)
+        self.assertListEqual(self.__get_fragments(), ["location=Ort%201%2FA/year=2022/part-00000000.parquet"])
+        assert_frame_equal(self.backend.load("Ort 1/A"), measurements)
+        self.assertListEqual(self.backend.get_sample_locations(), ["Ort 1/A"])
+
+    def test_projection_and_date_filter(self):
+        loaded = self.backend.load("Ort 1/A", columns=[Columns.DATE, Columns.BIOMARKER_N1],
+                                   filters=[(Columns.DATE, '>=', pd.Timestamp("2022-01-05"))])
+        self.assertListEqual(list(loaded.columns), [Columns.DATE, Columns.BIOMARKER_N1])
+        assert_frame_equal(loaded, self.measurements.loc[14:, [Columns.DATE, Columns.BIOMARKER_N1]].reset_index(drop=True))
+
+
+class TestSqliteSewageDatabase(TestSewageDatabase):
+    backend = 'sqlite'
+
+
+class TestSqliteBackend(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.backend = SqliteBackend(os.path.join(self.tmp_folder.name, "sewage_db.sqlite"))
+        self.measurements = dict()
+        for i, sample_location in enumerate(["Ort 1", "Ort 2"]):
+            measurements = create_measurements(num_rows=10, seed=i)
+            measurements[CalculatedColumns.USABLE.value] = np.arange(10) % 2 == 0
+            measurements[CalculatedColumns.FLAG.value] = np.where(np.arange(10) < 5, SewageFlag.REPRODUCTION_NUMBER_OUTLIER.value, 0)
+            measurements[CHECKSUM_COLUMN] = np.arange(10, dtype=np.uint64) + np.uint64(2 ** 63)
+            self.measurements[sample_location] = measurements.drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value])
+        # the sewage flow of the second sample location contains missing values
+        self.measurements["Ort 2"].loc[3, Columns.MEAN_SEWAGE_FLOW] = np.NAN
+        for sample_location, measurements in self.measurements.items():
+            self.backend.store(sample_location, measurements)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def test_column_types_are_restored(self):
+        for sample_location, measurements in self.measurements.items():
+            assert_frame_equal(self.backend.load(sample_location), measurements)
+        self.assertIsNone(self.backend.load("Ort 3"))
+
+    def test_store_replaces_sample_location(self):
+        measurements = self.measurements["Ort 1"].iloc[:4]
+        self.backend.store("Ort 1", measurements)
+        assert_frame_equal(self.backend.load("Ort 1"), measurements)
+        assert_frame_equal(self.backend.load("Ort 2"), self.measurements["Ort 2"])
+
+    def test_load_with_projection_and_date_filter(self):
+        loaded = self.backend.load("Ort 2", columns=[Columns.DATE, Columns.BIOMARKER_N1],
+                                   filters=[(Columns.DATE, '>=', pd.Timestamp("2022-03-03"))])
+        expected = self.measurements["Ort 2"].loc[4:, [Columns.DATE, Columns.BIOMARKER_N1]].reset_index(drop=True)
+        assert_frame_equal(loaded, expected)
+
+    def test_query_across_sample_locations(self):
+        result = self.backend.query_measurements(start_date="2022-03-02", flags=SewageFlag.REPRODUCTION_NUMBER_OUTLIER.value,
+                                                 usable=True)
+        self.assertListEqual(result[SqliteBackend.location_column].tolist(), ["Ort 1", "Ort 1", "Ort 2", "Ort 2"])
+        self.assertListEqual(list(result.columns), [SqliteBackend.location_column, Columns.DATE,
+                                                    CalculatedColumns.USABLE.value, CalculatedColumns.FLAG.value])
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(result[Columns.DATE]))
+        summary = self.backend.query_measurements(sample_locations=["Ort 2"], flags=SewageFlag.REPRODUCTION_NUMBER_OUTLIER.value,
+                                                  summary=True)
+        self.assertListEqual(summary.values.tolist(), [["Ort 2", 5, pd.Timestamp("2022-03-01"), pd.Timestamp("2022-03-03")]])
+        # numbers of different types in the sample locations
+        flows = self.backend.query_measurements(columns=[Columns.MEAN_SEWAGE_FLOW])[Columns.MEAN_SEWAGE_FLOW]
+        self.assertEqual(flows.dtype, np.float64)
+
+    def test_queries_are_read_only(self):
+        with self.assertRaises(Exception):
+            self.backend.read_sql("DELETE FROM measurements")
+        with self.assertRaises(ValueError):
+            SqliteBackend(os.path.join(self.tmp_folder.name, "missing.sqlite")).read_sql("SELECT 1")
+
+
+class TestCrashedWrites(TestCase):
+    """
+    Kills a run while it stores a sample location, the database still holds the previous or the new version
+    """
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.database_folder = os.path.join(self.tmp_folder.name, "db")
+        self.old = create_measurements().drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value])
+        self.old.loc[0, Columns.DATE] = pd.to_datetime("2021-12-30")
+        # the partition of 2021 is removed and a row of 2022 is changed
+        self.new = create_measurements(num_rows=34).drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value]).iloc[1:]
+        self.new.loc[5, Columns.BIOMARKER_N1] += 1
+        self.new = self.new.reset_index(drop=True)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def __get_database(self, backend) -> SewageDatabase:
+        return SewageDatabase(self.database_folder, backend, partition_by_year=True)
+
+    def __crash(self, backend, crash_point):
+        self.__get_database(backend).add_sewage_location2db("Ort 1", self.old)
+        measurements_file = os.path.join(self.tmp_folder.name, "new.pkl")
+        self.new.to_pickle(measurements_file)
+        process = subprocess.run([sys.executable, "-c", crash_script, self.database_folder, backend, crash_point,
+                                  measurements_file], cwd=repository_folder, capture_output=True, text=True)
+        self.assertEqual(process.returncode, 1, process.stderr)
+
+    def __assert_stored(self, backend, expected: pd.DataFrame):
+        loaded = self.__get_database(backend).read_measurements("Ort 1").drop(columns=[CHECKSUM_COLUMN])
+        assert_frame_equal(loaded, expected)
+        # the next run can compare and store the measurements
+        new_measurements = self.new.copy()
+        self.__get_database(backend).needs_recalcuation("Ort 1", new_measurements, False)
+        self.assertEqual(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value].any(), expected is self.old)
+        self.__get_database(backend).add_sewage_location2db("Ort 1", self.new)
+        loaded = self.__get_database(backend).read_measurements("Ort 1").drop(columns=[CHECKSUM_COLUMN])
+        assert_frame_equal(loaded, self.new)
+        stale_files = [str(p) for p in Path(self.database_folder).rglob("*") if ".tmp-" in p.name or ".removed-" in p.name]
+        self.assertListEqual(stale_files, [])
+
+    def test_killed_while_writing(self):
+        for backend in ['files', 'partitioned']:
+            with self.subTest(backend=backend):
+                self.__crash(backend, 'write')
+                self.__assert_stored(backend, self.old)
+
+    def test_killed_before_replaced_fragments_are_removed(self):
+        self.__crash('partitioned', 'remove')
+        self.__assert_stored('partitioned', self.new)
+
+    def test_killed_while_removing_partition(self):
+        self.__crash('partitioned', 'rmtree')
+        self.__assert_stored('partitioned', self.new)
+
+    def test_killed_before_commit(self):
+        self.__crash('sqlite', 'commit')
+        self.__assert_stored('sqlite', self.old)
+
+    def test_concurrent_writers_and_readers(self):
+        versions = [self.old, self.new]
+        database = self.__get_database('partitioned')
+        database.add_sewage_location2db("Ort 1", self.old)
+        writers = [multiprocessing.Process(target=store_repeatedly, args=(self.database_folder, versions, 10))
+                   for _ in range(3)]
+        for writer in writers:
+            writer.start()
+        while any(writer.is_alive() for writer in writers):
+            loaded = database.read_measurements("Ort 1").drop(columns=[CHECKSUM_COLUMN])
+            self.assertIn(loaded.shape[0], [version.shape[0] for version in versions])
+            assert_frame_equal(loaded, versions[0] if loaded.shape[0] == self.old.shape[0] else versions[1])
+        self.assertListEqual([writer.exitcode for writer in writers], [0, 0, 0])
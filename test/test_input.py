@@ -0,0 +1,85 @@
+# Created by alex at 18.10.26
+import importlib.util
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from lib import utils
+from test.utils import create_sheet
+
+
+class TestInputFiles(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.sheets = {"Ort 1": create_sheet(), "Ort 2": create_sheet(num_rows=7, seed=2)}
+        self.excel_file = os.path.join(self.tmp_folder.name, "input.xlsx")
+        with pd.ExcelWriter(self.excel_file) as writer:
+            for sample_location, sheet in self.sheets.items():
+                sheet.to_excel(writer, sheet_name=sample_location, index=False)
+        self.long_format = pd.concat([sheet.assign(**{utils.default_location_column: sample_location})
+                                      for sample_location, sheet in self.sheets.items()], ignore_index=True)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def __get_file(self, name):
+        return os.path.join(self.tmp_folder.name, name)
+
+    def test_excel_columns_are_mapped(self):
+        location_dict = utils.read_input_files(self.excel_file)
+        self.assertListEqual(list(location_dict), list(self.sheets))
+        for sample_location, measurements in location_dict.items():
+            self.assertListEqual(list(measurements.columns), list(utils.column_map.values()))
+            self.assertListEqual(measurements['collectionDate'].tolist(), self.sheets[sample_location]['ANFANG'].tolist())
+
+    @skipUnless(importlib.util.find_spec("python_calamine"), "python-calamine is not installed")
+    def test_calamine_same_as_openpyxl(self):
+        expected = utils.read_excel_input_files(self.excel_file)
+        location_dict = utils.read_excel_input_files(self.excel_file, 'calamine')
+        self.assertListEqual(list(location_dict), list(expected))
+        for sample_location, measurements in location_dict.items():
+            assert_frame_equal(measurements, expected[sample_location])
+
+    def test_long_formats_same_as_excel(self):
+        expected = utils.read_input_files(self.excel_file)
+        self.long_format.to_parquet(self.__get_file("input.parquet"))
+        self.long_format.to_feather(self.__get_file("input.arrow"))
+        self.long_format.to_csv(self.__get_file("input.csv"), index=False)
+        for name in ["input.parquet", "input.arrow", "input.csv"]:
+            location_dict = utils.read_input_files(self.__get_file(name))
+            self.assertListEqual(list(location_dict), list(expected))
+            for sample_location, measurements in location_dict.items():
+                assert_frame_equal(measurements, expected[sample_location], check_dtype=False)
+
+    def test_sample_locations_are_read_lazily(self):
+        self.long_format.to_csv(self.__get_file("input.csv"), index=False)
+        for input_file in [self.excel_file, self.__get_file("input.csv")]:
+            sample_locations = utils.iter_input_files(input_file)
+            sample_location, measurements = next(sample_locations)
+            self.assertEqual(sample_location, "Ort 1")
+            self.assertEqual(measurements.shape[0], self.sheets["Ort 1"].shape[0])
+            self.assertListEqual([s for s, _ in sample_locations], ["Ort 2"])
+
+    def test_long_format_with_mapped_columns_and_dates(self):
+        long_format = self.long_format.rename(columns=utils.column_map)
+        long_format['collectionDate'] = pd.to_datetime(long_format['collectionDate'])
+        long_format.to_parquet(self.__get_file("mapped.parquet"))
+        location_dict = utils.read_input_files(self.__get_file("mapped.parquet"))
+        self.assertListEqual(location_dict["Ort 2"]['collectionDate'].tolist(),
+                             self.sheets["Ort 2"]['ANFANG'].tolist())
+
+    def test_missing_location_column(self):
+        self.long_format.drop(columns=[utils.default_location_column]).to_csv(self.__get_file("input.csv"), index=False)
+        with self.assertRaises(ValueError):
+            utils.read_input_files(self.__get_file("input.csv"))
+        self.long_format.rename(columns={utils.default_location_column: "STANDORT"}).to_csv(self.__get_file("input.csv"), index=False)
+        location_dict = utils.read_input_files(self.__get_file("input.csv"), location_column="STANDORT")
+        self.assertListEqual(list(location_dict), list(self.sheets))
+
+    def test_unknown_input_format(self):
+        self.assertEqual(utils.get_input_format("Input.XLSX"), 'excel')
+        self.assertEqual(utils.get_input_format("input.csv.gz"), 'csv')
+        with self.assertRaises(ValueError):
+            utils.get_input_format("input.json")
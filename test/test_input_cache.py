@@ -0,0 +1,117 @@
+# Created by alex at 18.10.26
+import os
+import json
+import tempfile
+import zipfile
+from unittest import TestCase
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from lib import utils
+from lib.input_cache import InputCache, get_sheet_checksums
+from test.utils import create_sheet
+
+
+def write_shared_strings_workbook(input_file, shared_strings):
+    """
+    Workbook package as written by excel: the texts of both sheets are stored in sharedStrings.xml
+    """
+    namespace = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" ' \
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    with zipfile.ZipFile(input_file, 'w') as workbook:
+        workbook.writestr("xl/workbook.xml", '<workbook {}><sheets><sheet name="Ort 1" sheetId="1" r:id="rId1"/>'
+                                             '<sheet name="Ort 2" sheetId="2" r:id="rId2"/></sheets></workbook>'.format(namespace))
+        workbook.writestr("xl/_rels/workbook.xml.rels",
+                          '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                          '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/>'
+                          '<Relationship Id="rId2" Target="worksheets/sheet2.xml"/></Relationships>')
+        for sheet, string_index in [(1, 0), (2, 1)]:
+            workbook.writestr("xl/worksheets/sheet{}.xml".format(sheet),
+                              '<worksheet {}><sheetData><row r="1"><c r="A1" t="s"><v>{}</v></c><c r="B1"><v>{}</v></c>'
+                              '</row></sheetData></worksheet>'.format(namespace, string_index, string_index))
+        workbook.writestr("xl/sharedStrings.xml", '<sst {}>{}</sst>'.format(
+            namespace, "".join("<si><t>{}</t></si>".format(s) for s in shared_strings)))
+
+
+class TestInputCache(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.tmp_folder.name, "input.xlsx")
+        self.sheets = {"Ort 1": create_sheet(), "Ort 2": create_sheet(num_rows=7, seed=2), "Ort 3": create_sheet(seed=3)}
+        self.__write_workbook()
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def __write_workbook(self):
+        with pd.ExcelWriter(self.input_file) as writer:
+            for sample_location, sheet in self.sheets.items():
+                sheet.to_excel(writer, sheet_name=sample_location, index=False)
+
+    def __read(self) -> (dict, InputCache):
+        input_cache = InputCache(self.tmp_folder.name)
+        location_dict = input_cache.read_excel_input_files(self.input_file)
+        expected = utils.read_excel_input_files(self.input_file)
+        self.assertListEqual(list(location_dict), list(expected))
+        for sample_location, measurements in location_dict.items():
+            assert_frame_equal(measurements, expected[sample_location])
+        return location_dict, input_cache
+
+    def test_unchanged_workbook_is_loaded_from_cache(self):
+        _, input_cache = self.__read()
+        self.assertEqual((input_cache.hits, input_cache.misses), (0, 3))
+        _, input_cache = self.__read()
+        self.assertEqual((input_cache.hits, input_cache.misses), (3, 0))
+
+    def test_only_modified_sheets_are_parsed(self):
+        self.__read()
+        # a new comment adds a shared string of the workbook
+        self.sheets["Ort 2"].loc[3, 'BEM_LAB'] = "Probe nachgemessen"
+        self.sheets["Ort 2"].loc[4, 'N1_LAB'] = 12.5
+        self.__write_workbook()
+        location_dict, input_cache = self.__read()
+        self.assertEqual((input_cache.hits, input_cache.misses), (2, 1))
+        self.assertEqual(location_dict["Ort 2"].loc[3, 'bem_lab'], "Probe nachgemessen")
+
+    def test_corrupted_entries_are_parsed_again(self):
+        self.__read()
+        cache_folder = os.path.join(self.tmp_folder.name, ".input_cache")
+        workbook_file = [os.path.join(cache_folder, f) for f in os.listdir(cache_folder) if f.endswith(".json")][0]
+        with open(workbook_file) as f:
+            sheet_file = os.path.join(cache_folder, "{}.parquet".format(json.load(f)["Ort 2"]))
+        # truncated by a killed run
+        with open(sheet_file, 'r+b') as f:
+            f.truncate(10)
+        _, input_cache = self.__read()
+        self.assertEqual((input_cache.hits, input_cache.misses), (2, 1))
+        _, input_cache = self.__read()
+        self.assertEqual((input_cache.hits, input_cache.misses), (3, 0))
+        with open(workbook_file, 'w') as f:
+            f.write('{"Ort 1": ')
+        _, input_cache = self.__read()
+        self.assertEqual((input_cache.hits, input_cache.misses), (3, 0))
+        self.assertEqual(len(os.listdir(cache_folder)), 4)
+
+    def test_sheet_checksums_are_independent(self):
+        checksums = get_sheet_checksums(self.input_file)
+        self.sheets["Ort 1"].loc[0, 'TRO_TAG'] = "unbekannt"
+        self.sheets["Ort 3"] = self.sheets["Ort 3"].iloc[:-1]
+        self.__write_workbook()
+        new_checksums = get_sheet_checksums(self.input_file)
+        self.assertListEqual([new_checksums[s] == checksums[s] for s in self.sheets], [False, True, False])
+
+    def test_sheet_checksums_with_shared_strings(self):
+        write_shared_strings_workbook(self.input_file, ["ANFANG", "BEM_LAB", "verdünnt"])
+        checksums = get_sheet_checksums(self.input_file)
+        write_shared_strings_workbook(self.input_file, ["ANFANG", "BEM_PN", "verdünnt", "neu"])
+        new_checksums = get_sheet_checksums(self.input_file)
+        self.assertEqual(new_checksums["Ort 1"], checksums["Ort 1"])
+        self.assertNotEqual(new_checksums["Ort 2"], checksums["Ort 2"])
+
+    def test_unused_sheets_are_removed(self):
+        self.__read()
+        del self.sheets["Ort 3"]
+        self.__write_workbook()
+        self.__read()
+        cache_files = os.listdir(os.path.join(self.tmp_folder.name, ".input_cache"))
+        self.assertEqual(len(cache_files), 3)
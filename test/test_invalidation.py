@@ -0,0 +1,77 @@
+# Created by alex at 18.10.26
+from unittest import TestCase
+from pandas.testing import *
+import numpy as np
+import pandas as pd
+from lib import statistics
+from lib.constant import *
+from lib.columnar import ColumnarQualityControl
+from lib.invalidation import InvalidationPlanner
+from test.utils import create_measurements, create_stages, NoProgress
+
+
+def run_quality_control(measurements, previous_measurements=None, removed_dates=None) -> InvalidationPlanner:
+    stages = create_stages(statistics.SewageStat())
+    invalidation_planner = InvalidationPlanner(*stages).plan(measurements, previous_measurements, removed_dates)
+    ColumnarQualityControl(*stages).run_quality_control('', measurements, NoProgress(), invalidation_planner)
+    return invalidation_planner
+
+
+class TestInvalidationPlanner(TestCase):
+
+    def setUp(self) -> None:
+        self.stored = create_measurements()
+        run_quality_control(self.stored)
+        self.stored[CalculatedColumns.NEEDS_PROCESSING.value] = False
+
+    def __run_changed(self, index, column, value) -> (pd.DataFrame, InvalidationPlanner):
+        """
+        Runs the measurements with one changed value like after loading the stored results from the database
+        """
+        measurements = self.stored.copy()
+        measurements.loc[index, column] = value
+        for calculated_column, initial_value in CalculatedColumns.get_initial_values().items():
+            measurements.loc[index, calculated_column] = initial_value
+        invalidation_planner = run_quality_control(measurements, self.stored.iloc[[index]], np.array([], dtype='datetime64[ns]'))
+        return measurements, invalidation_planner
+
+    def __assert_same_results_as_full_run(self, measurements, expected):
+        run_quality_control(expected)
+        assert_frame_equal(measurements.drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value]),
+                           expected.drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value]), check_exact=True)
+
+    def test_same_results_as_full_run(self):
+        for index, column, value in [(10, Columns.BIOMARKER_N1, 500.0), (15, Columns.MEAN_SEWAGE_FLOW, 2000.0),
+                                     (20, Columns.AMMONIUM, 90.0), (30, Columns.PMMOV, 1e6)]:
+            measurements, invalidation_planner = self.__run_changed(index, column, value)
+            expected = create_measurements()
+            expected.loc[index, column] = value
+            self.__assert_same_results_as_full_run(measurements, expected)
+            self.assertGreater(invalidation_planner.get_num_dependent(), 0)
+            # only the changed measurement and the invalidated ones are processed
+            processed = measurements[CalculatedColumns.NEEDS_PROCESSING.value].to_numpy()
+            self.assertListEqual(list(np.flatnonzero(processed)),
+                                 [index] + list(np.flatnonzero(invalidation_planner.is_dependent_flags)))
+
+    def test_change_without_dependent_measurements(self):
+        # comments only flag the measurement itself
+        measurements, invalidation_planner = self.__run_changed(10, Columns.COMMENT_OPERATION, "Probe verdünnt")
+        self.assertEqual(invalidation_planner.get_num_dependent(), 0)
+        expected = create_measurements()
+        expected.loc[10, Columns.COMMENT_OPERATION] = "Probe verdünnt"
+        self.__assert_same_results_as_full_run(measurements, expected)
+
+    def test_removed_measurement(self):
+        measurements = self.stored.drop(index=40).reset_index(drop=True)
+        removed_date = self.stored.loc[40, Columns.DATE]
+        invalidation_planner = run_quality_control(measurements, self.stored.iloc[[]], np.array([removed_date]))
+        first_index = np.searchsorted(measurements[Columns.DATE], removed_date)
+        self.assertTrue(measurements[CalculatedColumns.NEEDS_PROCESSING.value].iloc[first_index:].all())
+        self.assertFalse(measurements[CalculatedColumns.NEEDS_PROCESSING.value].iloc[:first_index].any())
+        self.__assert_same_results_as_full_run(measurements, create_measurements().drop(index=40).reset_index(drop=True))
+
+    def test_inactive_without_previous_measurements(self):
+        measurements = self.stored.copy()
+        measurements.loc[5, CalculatedColumns.NEEDS_PROCESSING.value] = True
+        invalidation_planner = InvalidationPlanner(*create_stages(statistics.SewageStat())).plan(measurements)
+        self.assertListEqual([i for i in range(measurements.shape[0]) if invalidation_planner.needs_processing(i)], [5])
@@ -0,0 +1,116 @@
+# Created by alex at 18.10.26
+from unittest import TestCase
+import numpy as np
+from lib import utils
+from sklearn.neighbors import LocalOutlierFactor
+from lib.statistics import SewageStat
+
+
+class TestDetectOutliers(TestCase):
+
+    def setUp(self) -> None:
+        self.train_values = np.random.default_rng(7).normal(10, 1, 60)
+        utils.outlier_model_cache.clear()
+
+    def test_inlier_avoids_model_fits(self):
+        sewageStat = SewageStat()
+        is_outlier = utils.detect_outliers(['lof', 'iqr'], self.train_values, 10.2, sewageStat=sewageStat)
+        self.assertFalse(is_outlier)
+        self.assertDictEqual(sewageStat.outlier_model_fits, {'lof': {'avoided': 1}})
+
+    def test_outlier_runs_all_statistics(self):
+        sewageStat = SewageStat()
+        is_outlier = utils.detect_outliers(['lof', 'iqr'], self.train_values, 30.0, sewageStat=sewageStat)
+        self.assertTrue(is_outlier)
+        self.assertDictEqual(sewageStat.outlier_model_fits, {'lof': {'fitted': 1}})
+
+    def test_same_result_as_all_statistics(self):
+        outlier_statistics = ['iqr', 'zscore', 'ci', 'lof']
+        for test_value in np.linspace(4, 16, 49):
+            expected = all(utils.is_outlier(s, self.train_values, test_value) for s in outlier_statistics)
+            self.assertEqual(utils.detect_outliers(outlier_statistics, self.train_values, test_value), expected)
+
+    def test_no_outlier_statistics(self):
+        self.assertTrue(utils.detect_outliers([], self.train_values, 10.0))
+
+
+class TestLocalOutlierFactor(TestCase):
+
+    def tearDown(self) -> None:
+        utils.set_lof_backend('native')
+
+    def __get_sklearn_score(self, test_value, train_values):
+        X = np.array(train_values).reshape(-1, 1)
+        neighbours = 20 if len(X) > 20 else len(X) - 1
+        lof = LocalOutlierFactor(n_neighbors=neighbours, novelty=True, n_jobs=1).fit(X)
+        return lof.score_samples(np.array(test_value).reshape(1, -1))[0]
+
+    def test_native_score_equals_sklearn(self):
+        rng = np.random.default_rng(3)
+        for _ in range(200):
+            train_values = rng.lognormal(0, 0.5, int(rng.integers(2, 150)))
+            test_value = rng.lognormal(0, 0.5) * rng.choice([1, 3])
+            score = utils.get_local_outlier_factor_score_1d(test_value, train_values)
+            self.assertAlmostEqual(score, self.__get_sklearn_score(test_value, train_values), places=6)
+
+    def test_same_predictions_as_sklearn(self):
+        rng = np.random.default_rng(4)
+        for generate in [lambda n: rng.lognormal(0, 0.5, n), lambda n: np.round(rng.normal(10, 2, n))]:
+            for _ in range(200):
+                train_values = generate(int(rng.integers(2, 150)))
+                test_value = generate(1)[0] * rng.choice([1, 1.5, 3])
+                utils.set_lof_backend('sklearn')
+                expected = utils.is_outlier_local_outlier_factor(test_value, train_values)
+                utils.set_lof_backend('native')
+                self.assertEqual(utils.is_outlier_local_outlier_factor(test_value, train_values), expected)
+
+    def test_ambiguous_neighbors(self):
+        # 11 and 13 are tied neighbors of 12 with different k-distances
+        train_values = np.repeat([10., 11., 12., 13., 14.], [10, 14, 5, 7, 3])
+        self.assertIsNone(utils.get_local_outlier_factor_score_1d(12.0, train_values))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            utils.set_lof_backend('faiss')
+
+
+class TestOutlierModelCache(TestCase):
+
+    def setUp(self) -> None:
+        self.train_values = np.random.default_rng(8).normal(10, 1, 60)
+        utils.outlier_model_cache.clear()
+
+    def tearDown(self) -> None:
+        utils.outlier_model_cache.set_max_size(256)
+
+    def test_same_window_is_cached(self):
+        sewageStat = SewageStat()
+        for test_value in [30.0, 31.0]:
+            self.assertTrue(utils.detect_outliers(['iqr', 'lof'], self.train_values, test_value, sewageStat=sewageStat))
+        self.assertDictEqual(sewageStat.outlier_model_cache, {'miss': 2, 'hit': 2})
+        self.assertDictEqual(sewageStat.outlier_model_fits, {'lof': {'fitted': 1, 'cached': 1}})
+        # a different window is a miss
+        utils.detect_outliers(['iqr'], self.train_values[1:], 30.0, sewageStat=sewageStat)
+        self.assertEqual(sewageStat.outlier_model_cache['miss'], 3)
+
+    def test_same_results_with_and_without_cache(self):
+        rng = np.random.default_rng(9)
+        windows = [rng.normal(10, 1, 40) for _ in range(3)]
+        test_values = rng.normal(10, 3, 30)
+        utils.outlier_model_cache.set_max_size(0)
+        expected = [utils.detect_outliers(['iqr', 'zscore', 'ci', 'lof'], windows[i % 3], v) for i, v in enumerate(test_values)]
+        utils.outlier_model_cache.set_max_size(256)
+        results = [utils.detect_outliers(['iqr', 'zscore', 'ci', 'lof'], windows[i % 3], v) for i, v in enumerate(test_values)]
+        self.assertListEqual(results, expected)
+        self.assertGreater(utils.outlier_model_cache.hits, 0)
+
+    def test_least_recently_used_window_is_evicted(self):
+        utils.outlier_model_cache.set_max_size(2)
+        windows = [self.train_values, self.train_values + 1, self.train_values + 2]
+        for window in [windows[0], windows[1], windows[0], windows[2]]:
+            utils.detect_outliers(['iqr'], window, 10.0)
+        self.assertEqual(utils.outlier_model_cache.hits, 1)
+        utils.detect_outliers(['iqr'], windows[0], 10.0)
+        self.assertEqual(utils.outlier_model_cache.hits, 2)
+        utils.detect_outliers(['iqr'], windows[1], 10.0)
+        self.assertEqual(utils.outlier_model_cache.hits, 2)
@@ -0,0 +1,79 @@
+# Created by alex at 18.10.26
+import os
+import tempfile
+from unittest import TestCase, mock
+import numpy as np
+import pandas as pd
+from lib.plot_stage import render_plots
+from lib.plot_cache import PlotCache
+
+outlier_statistics = ['iqr', 'lof']
+drawn = []
+
+
+def get_figures(*outlier_statistics) -> list:
+    """
+    Two cheap figures instead of the figures of lib.plotting
+    """
+    return [("values", lambda measurements: measurements[['date', 'value']], draw_figure, ()),
+            ("flags", lambda measurements: measurements[['date', 'flag']], draw_figure, outlier_statistics[:1])]
+
+
+def draw_figure(plot_frame, sample_location, *arguments):
+    import matplotlib.pyplot as plt
+    drawn.append(plot_frame.columns[-1])
+    figure = plt.figure()
+    plt.plot(plot_frame['date'], plot_frame[plot_frame.columns[-1]])
+    plt.title("{} {}".format(sample_location, arguments))
+    return figure
+
+
+class TestPlotCache(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.measurements = pd.DataFrame({'date': pd.date_range("2023-01-01", periods=20), 'value': np.arange(20.0),
+                                          'flag': np.zeros(20, dtype=np.int64)})
+        drawn.clear()
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+
+    def __render(self, measurements, use_cache=True):
+        with mock.patch("lib.plotting.get_figures", side_effect=get_figures):
+            return render_plots(self.tmp_folder.name, "Ort 1", measurements, outlier_statistics, outlier_statistics,
+                                outlier_statistics, use_cache)
+
+    def test_only_changed_figures_are_drawn(self):
+        plot_file = self.__render(self.measurements)
+        self.assertListEqual(drawn, ['value', 'flag'])
+        # nothing changed, the plot file is kept
+        modified = os.path.getmtime(plot_file)
+        self.__render(self.measurements.copy())
+        self.assertEqual(os.path.getmtime(plot_file), modified)
+        self.assertListEqual(drawn, ['value', 'flag'])
+        # a lost plot file is written from the cached figures
+        os.remove(plot_file)
+        self.__render(self.measurements)
+        self.assertTrue(os.path.exists(plot_file))
+        self.assertListEqual(drawn, ['value', 'flag'])
+        changed = self.measurements.copy()
+        changed.loc[3, 'flag'] = 4
+        self.__render(changed)
+        self.assertListEqual(drawn, ['value', 'flag', 'flag'])
+        self.__render(changed, use_cache=False)
+        self.assertListEqual(drawn, ['value', 'flag', 'flag', 'value', 'flag'])
+        # only the figures of the current plot file are kept
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp_folder.name, "plots", ".plot_cache", "Ort%201"))), 3)
+
+    def test_checksums_of_plot_frames(self):
+        checksum = PlotCache.get_checksum("values", self.measurements, ("Ort 1", outlier_statistics))
+        self.assertEqual(PlotCache.get_checksum("values", self.measurements.copy(), ("Ort 1", outlier_statistics)), checksum)
+        self.assertTrue(checksum.startswith("values-"))
+        changed = [self.measurements.assign(value=self.measurements['value'] + 1e-9),
+                   self.measurements.astype({'flag': np.float64}),
+                   self.measurements.iloc[:-1]]
+        for plot_frame in changed:
+            self.assertNotEqual(PlotCache.get_checksum("values", plot_frame, ("Ort 1", outlier_statistics)), checksum)
+        self.assertNotEqual(PlotCache.get_checksum("values", self.measurements, ("Ort 2", outlier_statistics)), checksum)
+        self.assertNotEqual(PlotCache.get_checksum("values", self.measurements, ("Ort 1", ['iqr'])), checksum)
@@ -0,0 +1,90 @@
+# Created by alex at 18.10.26
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+from lib import statistics
+from lib.constant import *
+from lib.utils import SewageLogger
+from lib.database import SewageDatabase
+from lib.columnar import ColumnarQualityControl
+from lib.plot_stage import PlotStage, get_plot_file, is_plot_generated
+from test.utils import create_measurements, create_stages, NoProgress, test_output_folder
+
+outlier_statistics = ['iqr', 'lof']
+
+
+class TestPlotStage(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_folder = tempfile.TemporaryDirectory()
+        self.output_folder = os.path.join(self.tmp_folder.name, "output")
+        self.database_folder = os.path.join(self.tmp_folder.name, "database")
+        self.logger = SewageLogger(self.output_folder, quiet=True)
+
+    def tearDown(self) -> None:
+        self.tmp_folder.cleanup()
+        shutil.rmtree(test_output_folder, ignore_errors=True)
+
+    def __store(self, sample_location):
+        measurements = create_measurements(num_rows=12)
+        columnarQC = ColumnarQualityControl(*create_stages(statistics.SewageStat()))
+        columnarQC.run_quality_control(sample_location, measurements, NoProgress())
+        measurements['flags_explained'] = SewageFlag.explain_flag_series(measurements[CalculatedColumns.FLAG.value])
+        SewageDatabase(self.database_folder, 'arrow').add_sewage_location2db(sample_location, measurements)
+
+    def __create_plot_stage(self, jobs) -> PlotStage:
+        return PlotStage(self.output_folder, self.logger, self.database_folder, 'arrow', False, outlier_statistics,
+                         outlier_statistics, outlier_statistics, jobs)
+
+    def test_plots_are_rendered_from_the_database(self):
+        self.__store("Ort/1")
+        with self.__create_plot_stage(jobs=1) as plot_stage:
+            plot_stage.submit("Ort/1")
+            plot_stage.submit("Ort 2")
+        self.assertEqual((plot_stage.num_rendered, plot_stage.num_failed), (1, 1))
+        self.assertTrue(is_plot_generated(self.output_folder, "Ort/1"))
+        self.assertFalse(is_plot_generated(self.output_folder, "Ort 2"))
+        with open(get_plot_file(self.output_folder, "Ort/1"), 'rb') as f:
+            self.assertEqual(f.read(5), b"%PDF-")
+        self.assertListEqual(sorted(os.listdir(os.path.join(self.output_folder, "plots"))), [".plot_cache", "Ort_1.plots.pdf"])
+        # the drawn figures and the list of pages are cached
+        self.assertEqual(len(os.listdir(os.path.join(self.output_folder, "plots", ".plot_cache", "Ort%2F1"))), 7)
+
+    def test_failed_plots_keep_the_previous_file(self):
+        self.__store("Ort 1")
+        plot_file = get_plot_file(self.output_folder, "Ort 1")
+        os.makedirs(os.path.dirname(plot_file))
+        with open(plot_file, 'w') as f:
+            f.write("previous plots")
+        with mock.patch("lib.plotting.draw_biomarker_outlier_summary", side_effect=RuntimeError("layout failed")), \
+                mock.patch.object(self.logger.log, "error") as log_error:
+            with self.__create_plot_stage(jobs=0) as plot_stage:
+                plot_stage.submit("Ort 1")
+        self.assertEqual((plot_stage.num_rendered, plot_stage.num_failed), (0, 1))
+        self.assertIn("layout failed", log_error.call_args[0][0])
+        with open(plot_file) as f:
+            self.assertEqual(f.read(), "previous plots")
+        self.assertListEqual(os.listdir(os.path.dirname(plot_file)), [os.path.basename(plot_file)])
+
+    def test_plot_command_renders_stored_locations(self):
+        import ssqn
+        self.__store("Ort 1")
+        self.__store("Ort/2")
+        rendered = dict()
+
+        def render_plots(output_folder, sample_location, measurements, *outlier_statistics):
+            rendered[sample_location] = measurements[Columns.DATE]
+            return get_plot_file(output_folder, sample_location)
+
+        arguments = ['--database', self.database_folder, '--database_backend', 'arrow', '-o', self.output_folder,
+                     '--plot_jobs', '0', '-q']
+        with mock.patch("lib.plot_stage.render_plots", side_effect=render_plots):
+            self.assertEqual(ssqn.run_plot(arguments), 0)
+            self.assertListEqual(sorted(rendered), ["Ort 1", "Ort/2"])
+            rendered.clear()
+            start_date = create_measurements(num_rows=12)[Columns.DATE][6]
+            self.assertEqual(ssqn.run_plot(arguments + ['-l', 'Ort 1', 'Ort 3', '--start', str(start_date)]), 1)
+        self.assertListEqual(list(rendered), ["Ort 1"])
+        self.assertTrue((rendered["Ort 1"] >= start_date).all())
+        self.assertEqual(rendered["Ort 1"].shape[0], (create_measurements(num_rows=12)[Columns.DATE] >= start_date).sum())
@@ -0,0 +1,132 @@
+# Created by alex at 18.10.26
+import os
+import time
+import itertools
+from unittest import TestCase, skipUnless
+import numpy as np
+import pandas as pd
+from lib.constant import *
+from lib import plotting, statistics
+from lib.columnar import ColumnarQualityControl
+from test.utils import create_measurements, create_stages, NoProgress
+
+
+def create_plot_frame(num_rows=2000, seed=5) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    plot_frame = pd.DataFrame()
+    plot_frame['date'] = pd.to_datetime("2021-01-01") + pd.to_timedelta(np.arange(num_rows), unit="D")
+    plot_frame['value'] = np.sin(np.arange(num_rows) / 50) * 10 + rng.normal(0, 1, num_rows)
+    plot_frame['type'] = np.where(np.arange(num_rows) % 4 == 0, "ammonium", "conductivity")
+    plot_frame['outlier'] = rng.choice(['inlier', 'outlier', 'not tested'], num_rows, p=[0.9, 0.05, 0.05])
+    plot_frame.loc[7, 'value'] = np.NAN
+    return plot_frame
+
+
+class TestFastPlotting(TestCase):
+
+    def test_labels_same_as_row_by_row(self):
+        plot_frame = create_plot_frame(num_rows=200)
+        plot_frame['flag'] = np.where(plot_frame['outlier'] == 'outlier', SewageFlag.AMMONIUM_OUTLIER.value, 0)
+        expected = [(row['date'], row['value'], row['date'].strftime("%Y-%m-%d")) for _, row in plot_frame.iterrows()
+                    if row['type'] == "ammonium" and row['outlier'] == 'outlier']
+        self.assertListEqual(plotting.get_date_outlier_labels_value(plot_frame, 'type', "ammonium", 'outlier', 'outlier', 'value'),
+                             expected)
+        self.assertListEqual(plotting.get_date_outlier_labels_flags(plot_frame, 'type', "ammonium", 'flag',
+                                                                    SewageFlag.AMMONIUM_OUTLIER, 'value'), expected)
+
+    def test_labels_are_clustered(self):
+        plot_frame = create_plot_frame()
+        labels = plotting.get_date_outlier_labels_value(plot_frame, 'type', "conductivity", 'outlier', 'outlier', 'value')
+        self.assertGreater(len(labels), plotting.max_fast_labels)
+        clustered = plotting.cluster_date_labels(labels[::-1])
+        self.assertEqual(len(clustered), plotting.max_fast_labels)
+        # every outlier is counted once, each label is placed at the largest value of its cluster
+        self.assertEqual(sum(1 + int(text.split("+")[1]) if "+" in text else 1 for _, _, text in clustered), len(labels))
+        self.assertListEqual([date for date, _, _ in clustered], sorted(date for date, _, _ in clustered))
+        values = {date: value for date, value, _ in labels}
+        for date, value, _ in clustered:
+            self.assertEqual(values[date], value)
+        self.assertListEqual(plotting.cluster_date_labels(labels[:5]), labels[:5])
+
+    def test_lttb_keeps_the_shape(self):
+        x = np.arange(10000, dtype=np.float64)
+        y = np.sin(x / 300)
+        y[4321] = 25
+        selected = plotting.downsample_lttb(x, y, 200)
+        self.assertEqual(len(selected), 200)
+        self.assertTrue((np.diff(selected) > 0).all())
+        self.assertListEqual([selected[0], selected[-1]], [0, 9999])
+        # the peak and the extrema of the series are kept
+        self.assertIn(4321, selected)
+        self.assertAlmostEqual(y[selected].min(), -1, places=3)
+        np.testing.assert_array_equal(plotting.downsample_lttb(x[:100], y[:100], 200), np.arange(100))
+
+    def test_only_inliers_are_downsampled(self):
+        plot_frame = create_plot_frame()
+        downsampled = plotting.downsample_inliers(plot_frame, 'value', 'type', max_points=100)
+        for group, group_frame in downsampled.groupby('type'):
+            is_inlier = group_frame['outlier'] == 'inlier'
+            self.assertLessEqual(is_inlier.sum(), 101)
+            expected = plot_frame[(plot_frame['type'] == group) & (plot_frame['outlier'] != 'inlier')]
+            self.assertEqual((~is_inlier).sum(), expected.shape[0])
+        self.assertIn(7, downsampled.index)
+        self.assertTrue(plotting.is_long_series(plot_frame, 'type', max_points=1000))
+        self.assertFalse(plotting.is_long_series(plot_frame, 'type', max_points=1500))
+
+
+class TestPlotFrames(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.measurements = create_measurements(num_rows=600)
+        columnarQC = ColumnarQualityControl(*create_stages(statistics.SewageStat()))
+        columnarQC.run_quality_control("Ort 1", cls.measurements, NoProgress())
+
+    def test_melted_frames(self):
+        plot_frame = plotting.get_water_quality_frame(self.measurements)
+        num_rows = self.measurements.shape[0]
+        self.assertListEqual(list(plot_frame.columns), ['date', 'value', 'type', 'outlier'])
+        self.assertListEqual(list(plot_frame.index), list(self.measurements.index) * 2)
+        np.testing.assert_array_equal(plot_frame['value'].iloc[num_rows:], self.measurements[Columns.CONDUCTIVITY])
+        flags = self.measurements[CalculatedColumns.FLAG.value]
+        expected = np.where(SewageFlag.is_flag_set_for_series(flags, SewageFlag.NOT_ENOUGH_CONDUCTIVITY_VALUES), 'not tested',
+                            np.where(SewageFlag.is_flag_set_for_series(flags, SewageFlag.CONDUCTIVITY_OUTLIER), 'outlier', 'inlier'))
+        np.testing.assert_array_equal(plot_frame['outlier'].iloc[num_rows:], expected)
+        ratio_frame = plotting.get_biomarker_ratio_frame(self.measurements)
+        self.assertEqual(ratio_frame.shape[0], num_rows * len(list(itertools.combinations(Columns.get_biomarker_columns(), 2))))
+        self.assertEqual(ratio_frame['outlier'].dtype, np.int64)
+        for biomarker_ratio, ratio_rows in ratio_frame.groupby('biomarker_ratio', sort=False):
+            biomarker1, biomarker2 = biomarker_ratio.split("/")
+            np.testing.assert_array_equal(ratio_rows['ratio/median ratio'], self.measurements[biomarker_ratio])
+            np.testing.assert_array_equal(ratio_rows['outlier'],
+                                          self.measurements[CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)])
+        self.assertEqual(plotting.get_biomarker_ratio_frame(self.measurements.iloc[0:0]).shape, (0, 0))
+
+    def test_labels_by_first_set_flag(self):
+        flags = [0, SewageFlag.AMMONIUM_OUTLIER.value,
+                 SewageFlag.AMMONIUM_OUTLIER.value | SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES.value,
+                 SewageFlag.CONDUCTIVITY_OUTLIER.value]
+        labels = plotting.get_outlier_labels(flags, [('not tested', SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES),
+                                                     ('outlier', SewageFlag.AMMONIUM_OUTLIER)])
+        self.assertListEqual(list(labels), ['inlier', 'outlier', 'not tested', 'inlier'])
+        # one flag per value column of the melted frame
+        labels = plotting.get_outlier_labels(flags, [('outlier', [SewageFlag.AMMONIUM_OUTLIER, SewageFlag.CONDUCTIVITY_OUTLIER])])
+        self.assertListEqual(list(labels), ['inlier', 'outlier', 'inlier', 'outlier'])
+
+    @skipUnless(os.environ.get("SSQN_BENCHMARK"), "timing benchmark, run with SSQN_BENCHMARK=1")
+    def test_frames_are_negligible_to_drawing(self):
+        import matplotlib.pyplot as plt
+        figures = plotting.get_figures(['iqr'], ['iqr'], ['iqr'], fast=True)
+        preparation_times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for _, get_frame, _, _ in figures:
+                get_frame(self.measurements)
+            preparation_times.append(time.perf_counter() - start)
+        # the frames of all figures take a small part of drawing two of them in fast mode
+        start = time.perf_counter()
+        for name, get_frame, draw, arguments in figures:
+            if name in ["surrogatvirus", "water_quality"]:
+                plt.close(draw(get_frame(self.measurements), "Ort 1", *arguments))
+        drawing_time = time.perf_counter() - start
+        self.assertLess(min(preparation_times), drawing_time * 0.05)
@@ -0,0 +1,47 @@
+# Created by alex at 18.10.26
+import math
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.constant import *
+from lib.sewage_flow import DryWeatherFlowEstimator
+
+
+def get_expected_mean(flows: np.ndarray, flags: np.ndarray, end, fraction):
+    previous_flows = pd.Series(flows[:end])[(flags[:end] & DryWeatherFlowEstimator.sewage_flow_flags) == 0]
+    num_last_N_samples = math.ceil(previous_flows.shape[0] * fraction)
+    return previous_flows.shape[0], np.mean(previous_flows.nsmallest(num_last_N_samples, keep='all'))
+
+
+class TestDryWeatherFlowEstimator(TestCase):
+
+    def test_same_mean_as_nsmallest(self):
+        rng = np.random.default_rng(11)
+        for _ in range(20):
+            num_rows = int(rng.integers(1, 200))
+            # rounded flows for ties
+            flows = np.round(rng.lognormal(np.log(300), 0.3, num_rows), int(rng.integers(-1, 2)))
+            flows[rng.random(num_rows) < 0.05] = np.NAN
+            flags = np.where(rng.random(num_rows) < 0.2, rng.choice([SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value,
+                                                                     SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION.value,
+                                                                     SewageFlag.SEWAGE_FLOW_PRECIPITATION.value,
+                                                                     SewageFlag.COMMENT_NOT_EMPTY.value], num_rows), 0)
+            estimator = DryWeatherFlowEstimator()
+            for end in np.sort(rng.integers(0, num_rows + 1, 30)):
+                estimator.get(flows, flows, end).add(end, flags)
+                for fraction in [0.1, 0.5, 1.0]:
+                    num_flows, expected = get_expected_mean(flows, flags, end, fraction)
+                    self.assertEqual(estimator.get_num_flows(), num_flows)
+                    mean = estimator.get_mean_of_smallest(math.ceil(num_flows * fraction))
+                    np.testing.assert_allclose(mean, expected, rtol=1e-12)
+
+    def test_rebuilt_for_earlier_measurements(self):
+        flows = np.array([10., 20., 30., 40.])
+        flags = np.zeros(4, dtype=np.int64)
+        estimator = DryWeatherFlowEstimator()
+        estimator.get(flows, flows, 4).add(4, flags)
+        self.assertEqual(estimator.get_num_flows(), 4)
+        flags[0] = SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value
+        estimator.get(flows, flows, 2).add(2, flags)
+        self.assertEqual(estimator.get_num_flows(), 1)
+        self.assertEqual(estimator.get_mean_of_smallest(1), 20.)
@@ -0,0 +1,39 @@
+# Created by alex at 18.10.26
+import subprocess
+import sys
+from unittest import TestCase
+from test.utils import repository_folder
+
+# modules only needed for plotting or the scikit-learn outlier statistics
+lazy_modules = ['matplotlib', 'seaborn', 'sklearn', 'scipy.stats', 'adjustText']
+# cumulative import time of ssqn in microseconds
+import_time_budget = 2_500_000
+
+
+def get_import_times(statement) -> dict:
+    """
+    Runs the statement in a fresh interpreter with -X importtime and returns the cumulative import time in
+    microseconds of each imported module.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=repository_folder,
+                             capture_output=True, text=True, check=True)
+    import_times = dict()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        import_times[module.strip()] = int(cumulative)
+    return import_times
+
+
+class TestStartup(TestCase):
+
+    def test_lazy_modules_are_not_imported(self):
+        import_times = get_import_times("import ssqn")
+        for module in lazy_modules:
+            imported = [m for m in import_times if m == module or m.startswith(module + ".")]
+            self.assertListEqual(imported, [], "{} is imported at startup".format(module))
+
+    def test_import_time_budget(self):
+        import_times = get_import_times("import ssqn")
+        self.assertLess(import_times['ssqn'], import_time_budget)
@@ -0,0 +1,35 @@
+# Created by alex at 18.10.26
+import os
+import tempfile
+import tracemalloc
+from unittest import TestCase
+import numpy as np
+from lib.statistics import MemoryReport
+
+
+class TestMemoryReport(TestCase):
+
+    def tearDown(self) -> None:
+        tracemalloc.stop()
+
+    def test_peak_of_sample_location(self):
+        memory_report = MemoryReport()
+        for sample_location, num_values in [("Ort 1", 2_000_000), ("Ort 2", 100)]:
+            memory_report.start()
+            values = np.ones(num_values)
+            del values
+            memory_report.stop(sample_location)
+        self.assertListEqual(list(memory_report.peaks), ["Ort 1", "Ort 2"])
+        self.assertGreaterEqual(memory_report.peaks["Ort 1"][0], 2_000_000 * 8)
+        self.assertLess(memory_report.peaks["Ort 2"][0], 2_000_000 * 8)
+        self.assertIn("Ort 1", memory_report.print_report())
+
+    def test_write_report(self):
+        memory_report = MemoryReport()
+        memory_report.peaks = {"Ort 1": (1024, 2048), "Ort 2": (512, None)}
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            output_file = os.path.join(tmp_folder, "memory_report.tsv")
+            memory_report.write(output_file)
+            with open(output_file) as f:
+                lines = f.read().splitlines()
+        self.assertListEqual(lines[1:], ["Ort 1\t1024\t2048", "Ort 2\t512\t"])
@@ -0,0 +1,56 @@
+# Created by alex at 18.10.26
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from lib.constant import *
+from lib.window_index import WindowIndex
+
+
+def create_measurements(num_rows=300, seed=1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    measurements = pd.DataFrame()
+    # several measurements per day and dates at the end of month
+    measurements[Columns.DATE] = pd.to_datetime("2022-01-29") + pd.to_timedelta(np.cumsum(rng.integers(0, 4, num_rows)), unit="D")
+    return measurements
+
+
+class TestWindowIndex(TestCase):
+
+    def test_calendar_windows_equal_date_masks(self):
+        measurements = create_measurements()
+        dates = measurements[Columns.DATE]
+        window_index = WindowIndex().get(measurements)
+        for index in range(measurements.shape[0]):
+            current_date = dates.iloc[index]
+            for num_month, num_days in [(4, 0), (1, 0), (0, 7)]:
+                min_date = current_date + relativedelta(months=-num_month, days=-num_days)
+                expected = np.flatnonzero((dates >= min_date) & (dates < current_date))
+                start, end = window_index.calendar_window(index, num_month, num_days)
+                self.assertListEqual(list(range(start, end)), list(expected))
+            start_timeframe = (current_date - relativedelta(months=4)).strftime('%Y-%m-%d')
+            expected = np.flatnonzero((dates > start_timeframe) & (dates < current_date))
+            start, end = window_index.calendar_window(index, num_month=4, include_start=False)
+            self.assertListEqual(list(range(start, end)), list(expected))
+            expected = np.flatnonzero(dates < current_date)
+            start, end = window_index.history_window(index)
+            self.assertListEqual(list(range(start, end)), list(expected))
+
+    def test_count_window(self):
+        window_index = WindowIndex().get(create_measurements(num_rows=20))
+        self.assertEqual(window_index.count_window(0, 5), (0, 0))
+        self.assertEqual(window_index.count_window(3, 5), (0, 3))
+        self.assertEqual(window_index.count_window(15, 5), (9, 15))
+
+    def test_rebuilt_for_other_measurements(self):
+        window_index = WindowIndex()
+        window_index.get(create_measurements(num_rows=20))
+        self.assertEqual(window_index.history_window(19)[1], np.flatnonzero(window_index.dates < window_index.dates[19]).shape[0])
+        other_measurements = create_measurements(num_rows=5, seed=2)
+        window_index.get(other_measurements)
+        self.assertEqual(window_index.dates.shape[0], 5)
+
+    def test_unsorted_measurements(self):
+        measurements = create_measurements(num_rows=20).iloc[::-1].reset_index(drop=True)
+        with self.assertRaises(ValueError):
+            WindowIndex().get(measurements)
@@ -0,0 +1,91 @@
+# Created by alex at 18.10.26
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from lib import constant
+from lib import utils
+from lib.biomarkerQC import BiomarkerQC
+from lib.surrogatevirusQC import SurrogateVirusQC
+from lib.sewage_flow import SewageFlow
+from lib.water_quality import WaterQuality
+from lib.normalization import SewageNormalization
+
+repository_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+test_output_folder = 'tmp'
+
+
+def create_measurements(num_rows=120, seed=42) -> pd.DataFrame:
+    """
+    Random measurements of a sample location after the setup step of ssqn.py
+    """
+    rng = np.random.default_rng(seed)
+    Columns, CalculatedColumns = constant.Columns, constant.CalculatedColumns
+    measurements = pd.DataFrame()
+    measurements[Columns.DATE] = pd.to_datetime("2022-01-03") + pd.to_timedelta(np.cumsum(rng.integers(0, 5, num_rows)), unit="D")
+    measurements[Columns.COMMENT_ANALYSIS] = np.where(rng.random(num_rows) < 0.05, "diluted", "")
+    measurements[Columns.COMMENT_OPERATION] = ""
+    level = np.exp(np.cumsum(rng.normal(0, 0.1, num_rows))) * 50
+    for biomarker in Columns.get_biomarker_columns():
+        values = level * rng.lognormal(0, 0.2, num_rows)
+        values[rng.random(num_rows) < 0.05] = np.nan
+        values[rng.random(num_rows) < 0.05] *= 20
+        values[rng.random(num_rows) < 0.03] = 1.0
+        measurements[biomarker] = values
+    measurements[Columns.AMMONIUM] = np.round(rng.normal(40, 5, num_rows), 1)
+    measurements[Columns.CONDUCTIVITY] = np.round(rng.normal(1200, 100, num_rows))
+    flow = rng.lognormal(np.log(300), 0.2, num_rows)
+    flow[rng.random(num_rows) < 0.08] *= 4
+    flow[rng.random(num_rows) < 0.03] = np.nan
+    measurements[Columns.MEAN_SEWAGE_FLOW] = flow
+    measurements[Columns.CRASSPHAGE] = rng.lognormal(10, 0.5, num_rows)
+    measurements[Columns.PMMOV] = rng.lognormal(8, 0.5, num_rows)
+    measurements[Columns.TROCKENTAG] = np.where(rng.random(num_rows) < 0.8, "ja", "nein")
+    for biomarker in Columns.get_biomarker_columns():
+        measurements[CalculatedColumns.get_biomarker_flag(biomarker)] = 0
+    for biomarker1, biomarker2 in itertools.combinations(Columns.get_biomarker_columns(), 2):
+        measurements[biomarker1 + "/" + biomarker2] = np.NAN
+        measurements[CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)] = 0
+    for c in CalculatedColumns:
+        if c.type == bool:
+            measurements[c.value] = c.value == CalculatedColumns.NEEDS_PROCESSING.value
+        elif c.type == str:
+            measurements[c.value] = ""
+        else:
+            measurements[c.value] = 0
+        measurements[c.value] = measurements[c.value].astype(c.type)
+    return measurements
+
+
+class NoProgress:
+    total = 0
+
+    def update(self, n):
+        pass
+
+
+def create_stages(sewageStat):
+    biomarkerQC = BiomarkerQC(test_output_folder, sewageStat, ['iqr', 'lof'], 1.5, 9, 50, 2)
+    surrogateQC = SurrogateVirusQC(sewageStat, 4, 9, ['iqr', 'lof'], test_output_folder)
+    sewage_flow = SewageFlow(test_output_folder, sewageStat, dict(), 0.1, 5, 2.0, 1.5, 9.0)
+    water_quality = WaterQuality(test_output_folder, sewageStat, 4, 9, ['iqr', 'lof'])
+    sewageNormalization = SewageNormalization(sewageStat, 2, 2, 3.8, 7, test_output_folder)
+    return biomarkerQC, surrogateQC, sewage_flow, water_quality, sewageNormalization
+
+
+def create_sheet(num_rows=12, seed=1) -> pd.DataFrame:
+    """
+    Sheet of the input excel file with the original column names and some columns that are not used
+    """
+    rng = np.random.default_rng(seed)
+    sheet = pd.DataFrame()
+    sheet['OBJECTID'] = np.arange(num_rows)
+    for column in utils.column_map:
+        sheet[column] = np.round(rng.lognormal(3, 0.5, num_rows), 1)
+    sheet['ANFANG'] = (pd.to_datetime("2022-02-01 07:00") + pd.to_timedelta(np.arange(num_rows), unit="D")).strftime("%Y-%m-%dT%H:%M:%S")
+    sheet['BEM_LAB'] = np.where(rng.random(num_rows) < 0.3, "verdünnt", None)
+    sheet['BEM_PN'] = np.NAN
+    sheet['VOLUMENSTROM'] = rng.integers(1000, 4000, num_rows)
+    sheet['TRO_TAG'] = np.where(rng.random(num_rows) < 0.8, "Ja", "Nein")
+    sheet['WETTER'] = "trocken"
+    return sheet